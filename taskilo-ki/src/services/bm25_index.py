@@ -0,0 +1,226 @@
+"""
+BM25-Index für Taskilo-KI
+==========================
+Lexikalische Suche für Steuerfragen, die an exakten Token hängen
+("§ 19 UStG", "AfA", "Kz81") - dort liefern Embeddings allein schlechte Treffer.
+
+Verfahren:
+- Deutsche Tokenisierung: Kleinschreibung, Umlaute/ß gefaltet (ä→ae, ß→ss),
+  "§ 19" bleibt ein Token, Stoppwörter raus, Suffix-Kürzung bis zum festen
+  Stamm ("Steuern"/"Steuer" → "steu", "Abschreibungen" → "abschreibung")
+- Invertierter Index in kompakten Arrays: pro Term eine uint32-Liste der
+  Zeilen und eine uint16-Liste der Häufigkeiten (array-Modul, ~6 Byte pro Posting)
+- Inkrementell: neue Dokumente werden angehängt, gelöschte als Grabstein
+  markiert und bei mehr als 25 % Grabsteinen kompaktiert
+- Agenten-Filter über dieselbe Bitmaske wie der Vektor-Index
+"""
+
+import logging
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_FOLD = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+# "§ 19", "§§ 19a" → ein Token; sonst Buchstaben/Ziffern-Folgen ("kz81", "ustg", "2025")
+_TOKEN = re.compile(r"§+\s*\d+[a-z]?|[a-z0-9]+")
+_SUFFIXES = ("ungen", "ern", "en", "er", "es", "e", "s")
+_S_ENDING = frozenset("bdfghklmnrt")  # Genitiv-s nur nach diesen Lauten (wie Snowball), sonst "groess" → "groe"
+_STOPWORDS = frozenset("""
+    aber als am an auch auf aus bei bin bis bist da damit dann das dass dein deine dem den der des die dies diese
+    dieser dieses doch du durch ein eine einem einen einer eines er es etwas fuer hat hatte hier ich ihr im in
+    ist ja kann kein keine man mein meine mich mir mit muss nach nicht noch nur ob oder sein seine sich sie sind
+    so ueber um und uns unter vom von vor war was welche welcher wenn wer werden wie wir wird wo zu zum zur
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Deutsche Tokenisierung für Index und Anfrage (beide Seiten identisch)"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower().translate(_FOLD)):
+        if token.startswith("§"):
+            tokens.append("§" + token.lstrip("§").replace(" ", ""))
+            continue
+        if token in _STOPWORDS or len(token) < 2:
+            continue
+        # Ab 5 Zeichen ("kunde" → "kund" wie "kunden"); _stem lässt mindestens 4 Zeichen stehen
+        if len(token) > 4 and not token[-1].isdigit():
+            token = _stem(token)
+        tokens.append(token)
+    return tokens
+
+
+def _stem(token: str) -> str:
+    """Kürzt Endungen, bis keine mehr passt - sonst landen "steuern" (→ "steuer") und "steuer" (→ "steu") auf verschiedenen Stämmen"""
+    while True:
+        for suffix in _SUFFIXES:
+            if suffix == "s" and token[-2:-1] not in _S_ENDING:
+                continue
+            if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+                token = token[:-len(suffix)] + ("ung" if suffix == "ungen" else "")
+                break
+        else:
+            return token
+
+
+class BM25Index:
+    """
+    Okapi BM25 über inkrementell wachsende, kompakte Postings.
+
+    Beispiel:
+        index = BM25Index()
+        index.add("tax:1", "Kleinunternehmer nach § 19 UStG", mask=0)
+        hits = index.search("§19 ustg", k=5)  # [(id, score), ...]
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        if np is None:
+            raise ImportError("numpy wird für den BM25-Index benötigt")
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._post_rows: List[array] = []   # pro Term: Zeilen (uint32)
+        self._post_tfs: List[array] = []    # pro Term: Häufigkeit (uint16)
+        self._doc_len = array("I")
+        self._masks = array("I")
+        self._alive = bytearray()
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._total_len = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, doc_id: str, text: str, mask: int = 0):
+        """Indiziert ein Dokument (ersetzt eine vorhandene Version)"""
+        if doc_id in self._rows:
+            self.remove([doc_id])
+        counts = Counter(tokenize(text))
+        row = len(self._ids)
+        for term, tf in counts.items():
+            term_id = self._terms.get(term)
+            if term_id is None:
+                term_id = len(self._post_rows)
+                self._terms[term] = term_id
+                self._post_rows.append(array("I"))
+                self._post_tfs.append(array("H"))
+            self._post_rows[term_id].append(row)
+            self._post_tfs[term_id].append(min(tf, 65535))
+        length = sum(counts.values())
+        self._doc_len.append(length)
+        self._masks.append(mask)
+        self._alive.append(1)
+        self._ids.append(doc_id)
+        self._rows[doc_id] = row
+        self._total_len += length
+
+    def remove(self, ids: Sequence[str]):
+        """Markiert Dokumente als gelöscht (Postings bleiben bis zur Kompaktierung)"""
+        for doc_id in ids:
+            row = self._rows.pop(doc_id, None)
+            if row is None:
+                continue
+            self._alive[row] = 0
+            self._ids[row] = None
+            self._total_len -= self._doc_len[row]
+            self._dead += 1
+        if self._dead > 1000 and self._dead > len(self._ids) // 4:
+            self._compact()
+
+    def _compact(self):
+        """Baut die Postings ohne Grabsteine neu auf (Zeilennummern werden dicht)"""
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        new_row = np.cumsum(alive, dtype=np.int64) - 1
+        terms: Dict[str, int] = {}
+        post_rows: List[array] = []
+        post_tfs: List[array] = []
+        for term, term_id in self._terms.items():
+            rows = np.frombuffer(self._post_rows[term_id], dtype=np.uint32)
+            keep = alive[rows]
+            if not keep.any():
+                continue
+            terms[term] = len(post_rows)
+            post_rows.append(array("I", new_row[rows[keep]].astype(np.uint32).tobytes()))
+            post_tfs.append(array("H", np.frombuffer(self._post_tfs[term_id], dtype=np.uint16)[keep].tobytes()))
+        keep_rows = np.flatnonzero(alive)
+        self._terms, self._post_rows, self._post_tfs = terms, post_rows, post_tfs
+        self._doc_len = array("I", np.frombuffer(self._doc_len, dtype=np.uint32)[keep_rows].tobytes())
+        self._masks = array("I", np.frombuffer(self._masks, dtype=np.uint32)[keep_rows].tobytes())
+        self._ids = [self._ids[row] for row in keep_rows]
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._dead = 0
+        logger.info(f"[BM25] Kompaktiert: {len(self._ids)} Dokumente, {len(self._terms)} Terme")
+
+    def search(self, query: str, k: int, mask_bit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Top-k (ID, BM25-Score) für eine Anfrage; nur Dokumente mit mindestens einem Treffer"""
+        live = len(self._rows)
+        if not live or k <= 0:
+            return []
+        term_ids = [self._terms[t] for t in set(tokenize(query)) if t in self._terms]
+        if not term_ids:
+            return []
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32).astype(np.float32)
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / max(self._total_len / live, 1e-6))
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        for term_id in term_ids:
+            rows = np.frombuffer(self._post_rows[term_id], dtype=np.uint32)
+            tfs = np.frombuffer(self._post_tfs[term_id], dtype=np.uint16).astype(np.float32)
+            df = int(alive[rows].sum())
+            if not df:
+                continue
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            np.add.at(scores, rows, idf * tfs * (self.k1 + 1) / (tfs + norm[rows]))
+        allowed = alive & (scores > 0)
+        if mask_bit:
+            masks = np.frombuffer(self._masks, dtype=np.uint32)
+            allowed &= (masks == 0) | ((masks & mask_bit) != 0)
+        candidates = np.flatnonzero(allowed)
+        if not len(candidates):
+            return []
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[row], float(scores[row])) for row in top]
+
+    def get_stats(self) -> Dict[str, Any]:
+        postings = sum(len(rows) for rows in self._post_rows)
+        return {
+            "documents": len(self._rows),
+            "terms": len(self._terms),
+            "postings": postings,
+            "tombstones": self._dead,
+            "bytes": postings * 6 + len(self._ids) * 9,
+        }
+
+
+# Test
+if __name__ == "__main__":
+    print("=== BM25 Test ===\n")
+    print(f"Tokens: {tokenize('Kleinunternehmer nach §§ 19 UStG: Abschreibungen (AfA), Kz81, Größe')}")
+    for a, b in [("Steuer", "Steuern"), ("Umsatzsteuer", "Umsatzsteuern"), ("Freiberufler", "Freiberuflern"), ("Abschreibung", "Abschreibungen"), ("Umsätze", "Umsätzen"), ("Unternehmer", "Unternehmers"), ("Größe", "Größen"), ("Kunde", "Kunden"), ("Miete", "Mieten"), ("Rente", "Renten")]:
+        assert tokenize(a) == tokenize(b), (a, b, tokenize(a), tokenize(b))
+    index = BM25Index()
+    index.add("a", "Kleinunternehmerregelung nach § 19 UStG: keine Umsatzsteuer bis 25.000 Euro")
+    index.add("b", "Die AfA für Computer beträgt ein Jahr, Abschreibung sofort möglich")
+    index.add("c", "In Kz81 der Umsatzsteuer-Voranmeldung stehen Umsätze zu 19 %", mask=1 << 3)
+    index.add("d", "Marketing auf LinkedIn für Freelancer")
+    assert index.search("§19 UStG", k=1)[0][0] == "a"
+    assert index.search("Abschreibungen afa", k=1)[0][0] == "b"
+    assert index.search("kz81", k=1)[0][0] == "c"
+    assert index.search("kz81", k=1, mask_bit=1 << 1) == []
+    index.add("e", "Umsatzsteuern für Freiberuflern im Ausland")
+    assert index.search("Umsatzsteuer Freiberufler", k=1)[0][0] == "e"
+    index.remove(["a"])
+    assert all(doc_id != "a" for doc_id, _ in index.search("§19 UStG", k=3))
+    print(f"Treffer ✓\n\nStats: {index.get_stats()}")
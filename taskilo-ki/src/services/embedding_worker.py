@@ -0,0 +1,249 @@
+"""
+Embedding-Worker für Taskilo-KI
+================================
+SentenceTransformer.encode ist ein CPU-Forward-Pass und blockiert, direkt im
+async-Handler aufgerufen, den ganzen Event-Loop - alle anderen Chats stehen still.
+
+Der Worker:
+- rechnet in einem eigenen Thread (PyTorch gibt dabei den GIL frei)
+- sammelt gleichzeitige Anfragen, während ein Batch läuft, und kodiert sie
+  anschließend zusammen (ein Forward-Pass statt vieler)
+- eine einzelne Anfrage auf freiem Worker startet sofort (keine Zusatz-Latenz);
+  nur unter Last wird bis `max_wait_ms` gewartet, um den Batch zu füllen
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Konfiguration
+EMBED_WORKER_MAX_BATCH = int(os.environ.get("EMBED_WORKER_MAX_BATCH", "64"))
+EMBED_WORKER_MAX_WAIT_MS = float(os.environ.get("EMBED_WORKER_MAX_WAIT_MS", "5"))
+
+
+@dataclass
+class _Request:
+    texts: List[str]
+    future: asyncio.Future = field(repr=False)
+    enqueued_at: float
+
+
+class EmbeddingWorker:
+    """
+    Micro-Batching vor einer synchronen encode-Funktion.
+
+    Beispiel:
+        worker = EmbeddingWorker(lambda texts: model.encode(texts, batch_size=64))
+        vectors = await worker.encode(["Wie hoch ist der Grundfreibetrag?"])
+        ...
+        await worker.close()
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], Sequence[Sequence[float]]],
+        max_batch: int = None,
+        max_wait_ms: float = None,
+    ):
+        """
+        Args:
+            encode: Synchrone Funktion Texte → Vektoren (läuft im Worker-Thread)
+            max_batch: Maximale Texte pro Forward-Pass
+            max_wait_ms: Sammelfenster unter Last (0 = nur sammeln, was während eines Batches ankommt)
+        """
+        self._encode = encode
+        self.max_batch = max_batch if max_batch is not None else EMBED_WORKER_MAX_BATCH
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else EMBED_WORKER_MAX_WAIT_MS
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Batch, der gerade gesammelt oder im Thread kodiert wird (close() muss dessen Aufrufer freigeben)
+        self._inflight: List[_Request] = []
+
+        # Metriken
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.max_batch_seen = 0
+        self.max_queue_depth = 0
+        self._waits_ms: Deque[float] = deque(maxlen=500)
+        self._encode_ms: Deque[float] = deque(maxlen=500)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        """Kodiert `texts`, ggf. zusammen mit gleichzeitigen Anfragen anderer Aufrufer"""
+        if not texts:
+            return []
+        self._ensure_started()
+        request = _Request(list(texts), asyncio.get_running_loop().create_future(), time.monotonic())
+        self.requests += 1
+        self._queue.put_nowait(request)
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await request.future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Ab dem Herausnehmen aus der Queue: auch ein Abbruch im Sammelfenster darf niemanden hängen lassen
+            self._inflight = batch
+            size = len(batch[0].texts)
+            # Alles mitnehmen, was während des letzten Batches aufgelaufen ist
+            while not self._queue.empty() and size < self.max_batch:
+                batch.append(self._queue.get_nowait())
+                size += len(batch[-1].texts)
+            # Unter Last kurz weitersammeln; eine einzelne Anfrage startet sofort
+            if len(batch) > 1 and size < self.max_batch and self.max_wait_ms > 0:
+                deadline = loop.time() + self.max_wait_ms / 1000
+                while size < self.max_batch:
+                    try:
+                        request = await asyncio.wait_for(self._queue.get(), timeout=max(deadline - loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        break
+                    batch.append(request)
+                    size += len(request.texts)
+
+            # Abgebrochene Aufrufer nicht mitrechnen
+            batch = [r for r in batch if not r.future.done()]
+            self._inflight = batch
+            if not batch:
+                continue
+            texts = [text for request in batch for text in request.texts]
+            started = time.monotonic()
+            for request in batch:
+                self._waits_ms.append((started - request.enqueued_at) * 1000)
+            try:
+                vectors = await loop.run_in_executor(self._executor, self._encode_rows, texts)
+            except Exception as e:
+                logger.warning(f"[EmbeddingWorker] Batch mit {len(texts)} Texten fehlgeschlagen: {e}")
+                self._inflight = []
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            # Bei Abbruch (close) bleibt _inflight stehen, close() gibt die Aufrufer frei
+            self._inflight = []
+            self._encode_ms.append((time.monotonic() - started) * 1000)
+            self.batches += 1
+            self.texts += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(texts))
+
+            offset = 0
+            for request in batch:
+                rows = vectors[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+                if not request.future.done():
+                    request.future.set_result(rows)
+
+    def _encode_rows(self, texts: List[str]) -> List[List[float]]:
+        # Umwandlung in Python-Listen ebenfalls im Thread, nicht im Event-Loop
+        vectors = self._encode(texts)
+        return vectors.tolist() if hasattr(vectors, "tolist") else [list(v) for v in vectors]
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Ohne das warten Aufrufer des laufenden Batches ewig auf ihr Ergebnis
+        for request in self._inflight:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("EmbeddingWorker geschlossen"))
+        self._inflight = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                request = self._queue.get_nowait()
+                if not request.future.done():
+                    request.future.cancel()
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = list(self._waits_ms)
+        encodes = list(self._encode_ms)
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch": round(self.texts / self.batches, 1) if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "wait_p50_ms": round(self._percentile(waits, 0.5), 1),
+            "wait_p95_ms": round(self._percentile(waits, 0.95), 1),
+            "encode_p50_ms": round(self._percentile(encodes, 0.5), 1),
+        }
+
+
+# Test mit simuliertem Modell
+if __name__ == "__main__":
+
+    def fake_encode(texts: List[str]) -> List[List[float]]:
+        time.sleep(0.02 + 0.001 * len(texts))  # blockierender Forward-Pass
+        return [[float(len(t)), 1.0] for t in texts]
+
+    async def test():
+        print("=== Embedding-Worker Test ===\n")
+        worker = EmbeddingWorker(fake_encode, max_wait_ms=5)
+
+        started = time.monotonic()
+        vectors = await worker.encode(["eins"])
+        print(f"1. Einzelanfrage: {vectors} in {(time.monotonic() - started) * 1000:.0f}ms")
+
+        # Event-Loop bleibt frei: der Ticker läuft weiter, während kodiert wird
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        tick_task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(worker.encode([f"text {i}", "x" * i]) for i in range(40)))
+        tick_task.cancel()
+        assert all(r[1][0] == float(i) for i, r in enumerate(results))
+        print(f"2. 40 gleichzeitige Anfragen in {worker.batches - 1} Batches, {ticks} Loop-Ticks währenddessen")
+        print(f"\nStats: {worker.get_stats()}")
+
+        # Schließen mitten im Batch: wartende Aufrufer bekommen einen Fehler statt ewig zu hängen
+        pending = asyncio.create_task(worker.encode(["läuft gerade"]))
+        await asyncio.sleep(0.005)
+        await worker.close()
+        try:
+            await asyncio.wait_for(pending, timeout=1)
+        except RuntimeError as e:
+            print(f"3. Schließen während eines Batches: {e} ✓")
+
+        # Schließen im Sammelfenster: bereits aus der Queue genommene Anfragen hängen nicht
+        worker = EmbeddingWorker(fake_encode, max_wait_ms=500)
+        collecting = [asyncio.create_task(worker.encode([f"sammeln {i}"])) for i in range(2)]
+        await asyncio.sleep(0.05)  # beide sind aus der Queue, das Fenster läuft noch
+        assert worker.batches == 0 and worker._queue.empty()
+        await worker.close()
+        done, still_pending = await asyncio.wait(collecting, timeout=1)
+        assert not still_pending and all(isinstance(t.exception(), RuntimeError) for t in done)
+        print(f"4. Schließen im Sammelfenster: {len(done)} Aufrufer freigegeben ✓")
+
+    asyncio.run(test())
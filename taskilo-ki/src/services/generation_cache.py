@@ -0,0 +1,206 @@
+"""
+Generierungs-Cache für Taskilo-KI
+==================================
+Wiederkehrende Fragen ("Wie hoch ist der Grundfreibetrag 2025?") sollen nicht
+jedes Mal eine volle GPU-Generierung kosten.
+
+Verfahren:
+- Schlüssel = SHA-256 über Endpunkt, Modell, System-Prompt, Prompt bzw.
+  Nachrichten und Sampling-Optionen (exakter Treffer, keine Ähnlichkeit)
+- Nur für niedrige Temperaturen (`max_temperature`), sonst wäre die
+  Antwort ohnehin nicht reproduzierbar
+- Stufe 1: In-Memory-LRU mit TTL, begrenzt nach Einträgen und Bytes
+- Stufe 2 (optional): JSON-Dateien auf der Platte, überleben Neustarts
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Konfiguration
+CACHE_MAX_ENTRIES = int(os.environ.get("GENERATION_CACHE_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.environ.get("GENERATION_CACHE_BYTES", str(32 * 1024 * 1024)))
+CACHE_TTL = float(os.environ.get("GENERATION_CACHE_TTL", "3600"))
+CACHE_MAX_TEMPERATURE = float(os.environ.get("GENERATION_CACHE_MAX_TEMPERATURE", "0.3"))
+CACHE_DIR = os.environ.get("GENERATION_CACHE_DIR") or None
+
+
+class GenerationCache:
+    """
+    Exakter Antwort-Cache mit LRU/TTL und optionaler Platten-Stufe.
+
+    Beispiel:
+        cache = GenerationCache(disk_dir="/data/generation-cache")
+        key = cache.key("/api/generate", payload)
+        value = await cache.get(key)
+        if value is None:
+            value = ...  # Generierung
+            await cache.put(key, value)
+    """
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        max_bytes: int = None,
+        ttl_s: float = None,
+        max_temperature: float = None,
+        disk_dir: str = None,
+    ):
+        """
+        Args:
+            max_entries: Maximale Einträge im Speicher (0 = Cache aus)
+            max_bytes: Maximale Größe der gespeicherten Antworten im Speicher
+            ttl_s: Lebensdauer eines Eintrags in Sekunden
+            max_temperature: Höchste Temperatur, bei der gecacht wird
+            disk_dir: Verzeichnis für die Platten-Stufe (None = nur Speicher)
+        """
+        self.max_entries = max_entries if max_entries is not None else CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else CACHE_MAX_BYTES
+        self.ttl_s = ttl_s if ttl_s is not None else CACHE_TTL
+        self.max_temperature = max_temperature if max_temperature is not None else CACHE_MAX_TEMPERATURE
+        self.disk_dir = disk_dir if disk_dir is not None else CACHE_DIR
+
+        # Schlüssel → (läuft ab um [time.time()], Bytes, Wert); Reihenfolge = zuletzt genutzt zuletzt
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+
+        # Metriken
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def cacheable(self, payload: Dict[str, Any]) -> bool:
+        """Nur ausreichend deterministische Anfragen werden gecacht"""
+        temperature = payload.get("options", {}).get("temperature", 0.8)  # Ollama-Standard
+        # Fortsetzungen mit Kontext-Token sind sitzungsgebunden und wiederholen sich nicht
+        return self.enabled and temperature <= self.max_temperature and not payload.get("context")
+
+    @staticmethod
+    def key(endpoint: str, payload: Dict[str, Any]) -> str:
+        """Stabiler Schlüssel über alles, was die Antwort bestimmt"""
+        relevant = {
+            "endpoint": endpoint,
+            "model": payload.get("model"),
+            "system": payload.get("system"),
+            "prompt": payload.get("prompt"),
+            "messages": payload.get("messages"),
+            "options": payload.get("options"),
+        }
+        if payload.get("context"):
+            # Gleiche Frage in verschiedenen Sitzungen darf nicht zusammengelegt werden (Single-Flight)
+            relevant["context"] = payload["context"]
+        raw = json.dumps(relevant, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Gespeicherte Antwort oder None (zählt Treffer/Fehlschläge)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self._remove(key)
+
+        if self.disk_dir:
+            stored = await asyncio.to_thread(self._read_disk, key)
+            if stored is not None:
+                expires_at, value = stored
+                self._store(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: Dict[str, Any]):
+        """Speichert eine Antwort (Speicher sofort, Platte im Thread)"""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_s
+        self._store(key, value, expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value, expires_at)
+
+    def _store(self, key: str, value: Dict[str, Any], expires_at: float):
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"[GenerationCache] Defekter Eintrag {key[:12]}: {e}")
+            return None
+        if stored.get("expires_at", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return stored["expires_at"], stored["value"]
+
+    def _write_disk(self, key: str, value: Dict[str, Any], expires_at: float):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Erst temporär schreiben, dann umbenennen: parallele Leser sehen nie halbe Dateien
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[GenerationCache] Schreiben fehlgeschlagen: {e}")
+
+    def clear(self):
+        """Leert die Speicher-Stufe (Platte bleibt unangetastet)"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,170 @@
+"""
+Keyword-Klassifikator für Taskilo-KI
+=====================================
+Kompiliert Keyword-Tabellen (Klasse → Keywords) einmalig und bewertet einen
+Text in einem einzigen Durchlauf.
+
+Genutzt von:
+- MasterBrain._detect_agent (AGENT_KEYWORDS, 21 Agenten)
+- MultiModelRouter._detect_task (TASK_KEYWORDS)
+
+Verfahren:
+- Mit `pyahocorasick` (pip install pyahocorasick): Aho-Corasick-Automat in C,
+  findet alle (auch überlappende) Keywords in einem Durchlauf
+- Ohne: alle Keywords werden zu einem Trie-förmigen Regex verschmolzen
+  (gemeinsame Präfixe nur einmal, längster Treffer pro Position); pro
+  unterschiedlichem Treffer werden vorab berechnete Mengen ergänzt
+- Ergebnis ist in beiden Fällen identisch zur naiven Schleife `keyword in text`:
+  pro Klasse zählt jedes vorkommende Keyword genau einmal
+"""
+
+import re
+from typing import Dict, Iterable, List, Set, Tuple, TypeVar, Generic
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+K = TypeVar("K")
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """Baut einen Regex, der an jeder Position das längste Keyword trifft"""
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}  # Wortende
+
+    def render(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Endet hier ein Keyword, ist die Fortsetzung optional (greedy → längster Treffer)
+        return f"(?:{body})?" if "" in node else body
+
+    return render(trie)
+
+
+class KeywordClassifier(Generic[K]):
+    """
+    Einmal kompilierte Keyword-Tabelle mit Single-Pass-Scoring.
+
+    Beispiel:
+        classifier = KeywordClassifier(AGENT_KEYWORDS, classes=list(AgentType))
+        agent = classifier.best("Wie hoch ist die Umsatzsteuer?", AgentType.GENERAL)
+    """
+
+    def __init__(self, tables: Dict[K, List[str]], classes: Iterable[K] = None):
+        """
+        Args:
+            tables: Klasse → Liste von Keywords (Kleinschreibung)
+            classes: Reihenfolge der Klassen im Ergebnis; entscheidet bei
+                Gleichstand wie max() über ein Dict (Standard: Tabellen-Reihenfolge)
+        """
+        self.classes: List[K] = list(classes) if classes is not None else list(tables)
+
+        # Keyword → Klassen (ein Keyword kann mehreren Klassen angehören, z.B. "analyse")
+        self._keyword_classes: Dict[str, List[K]] = {}
+        for cls, keywords in tables.items():
+            for keyword in keywords:
+                if keyword:
+                    self._keyword_classes.setdefault(keyword, []).append(cls)
+
+        keywords = list(self._keyword_classes)
+        self._automaton = None
+        self._pattern = None
+        self._contained: Dict[str, Tuple[str, ...]] = {}
+        self._overlaps: Dict[str, Tuple[str, ...]] = {}
+
+        if ahocorasick is not None and keywords:
+            self.backend = "aho-corasick"
+            self._automaton = ahocorasick.Automaton()
+            for keyword in keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+            return
+
+        self.backend = "regex"
+        if keywords:
+            self._pattern = re.compile(_trie_pattern(keywords))
+        # Im Treffer enthaltene Keywords (inkl. des Treffers selbst)
+        self._contained = {
+            match: tuple(k for k in keywords if k in match) for match in keywords
+        }
+        # Keywords, die innerhalb eines Treffers beginnen und über sein Ende hinausragen
+        # (z.B. "ab" trifft, "bc" in "abc" wird übersprungen) - selten, daher direkt nachgeprüft
+        self._overlaps = {
+            match: tuple(
+                k for k in keywords
+                if any(len(k) > len(match) - offset and k.startswith(match[offset:]) for offset in range(1, len(match)))
+            )
+            for match in keywords
+        }
+
+    def matches(self, text: str) -> Set[str]:
+        """Alle im Text vorkommenden Keywords (Groß-/Kleinschreibung egal)"""
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(text.lower())}
+        found: Set[str] = set()
+        if self._pattern is None:
+            return found
+        text_lower = text.lower()
+        candidates: Set[str] = set()
+        # Ein Regex-Durchlauf, danach nur noch Arbeit pro *unterschiedlichem* Treffer
+        for keyword in set(self._pattern.findall(text_lower)):
+            found.update(self._contained[keyword])
+            candidates.update(self._overlaps[keyword])
+        for candidate in candidates - found:
+            if candidate in text_lower:
+                found.add(candidate)
+        return found
+
+    def scores(self, text: str) -> Dict[K, int]:
+        """Anzahl vorkommender Keywords pro Klasse"""
+        scores = {cls: 0 for cls in self.classes}
+        for keyword in self.matches(text):
+            for cls in self._keyword_classes[keyword]:
+                scores[cls] = scores.get(cls, 0) + 1
+        return scores
+
+    def best(self, text: str, default: K) -> K:
+        """Klasse mit den meisten Treffern oder `default`, wenn nichts trifft"""
+        scores = self.scores(text)
+        best = max(scores, key=scores.get, default=default)
+        return best if scores.get(best) else default
+
+
+# Micro-Benchmark: naive Schleife vs. kompilierter Klassifikator
+if __name__ == "__main__":
+    import timeit
+    from services.multi_model_router import TASK_KEYWORDS, ModelCapability
+    from services.master_brain import MasterBrain, AgentType
+
+    def naive_scores(tables, classes, text):
+        text_lower = text.lower()
+        scores = {cls: 0 for cls in classes}
+        for cls, keywords in tables.items():
+            for keyword in keywords:
+                if keyword in text_lower:
+                    scores[cls] += 1
+        return scores
+
+    short_text = "Wie hoch ist der Grundfreibetrag 2025 und muss ich beim Finanzamt eine Steuererklärung abgeben?"
+    long_text = (MasterBrain.PERSONALITY + "\n" + short_text + "\n") * 5
+    long_text = long_text[:10240]
+
+    print("=== Keyword-Klassifikator Benchmark ===\n")
+    for name, tables, classes in [
+        ("AGENT_KEYWORDS", MasterBrain.AGENT_KEYWORDS, list(AgentType)),
+        ("TASK_KEYWORDS", TASK_KEYWORDS, list(ModelCapability)),
+    ]:
+        classifier = KeywordClassifier(tables, classes=classes)
+        for label, text, number in [("kurz", short_text, 20000), ("10 KB", long_text, 500)]:
+            assert classifier.scores(text) == naive_scores(tables, classes, text)
+            naive_us = timeit.timeit(lambda: naive_scores(tables, classes, text), number=number) / number * 1e6
+            compiled_us = timeit.timeit(lambda: classifier.scores(text), number=number) / number * 1e6
+            print(f"{name:15} {label:6} [{classifier.backend}] naiv: {naive_us:8.1f} µs | kompiliert: {compiled_us:8.1f} µs | Faktor {naive_us / compiled_us:.1f}x")
@@ -0,0 +1,561 @@
+"""
+Wissens-Index für Taskilo-KI
+=============================
+Vektor-Suche über `tax_knowledge` und `web_knowledge`, damit pro Anfrage nur
+die passenden Abschnitte im Prompt landen statt immer derselben ersten Dokumente.
+
+Verfahren:
+- Alle Vektoren L2-normiert in EINER float32-Matrix; Top-k = ein
+  Matrix-Vektor-Produkt plus argpartition
+- Ab `ann_threshold` Einträgen (und installiertem hnswlib) HNSW statt
+  exakter Suche
+- Agenten-Filter über eine Bitmaske pro Zeile (Feld `agents` bzw. `agent`
+  im Dokument; ohne Angabe gilt das Dokument für alle Agenten)
+- Beim Start vollständig geladen, danach inkrementell über `updated_at`
+  (neuere Dokumente werden übernommen, `deleted: true` entfernt sie;
+  Dokumente ohne `updated_at` nur beim Start). Jede Abfrage beginnt
+  `sync_overlap_s` vor dem letzten Stand, weil Batch-Schreiber viele Dokumente
+  mit demselben Zeitstempel nicht-atomar schreiben; schon übernommene
+  Versionen (gleiches `_id` und `updated_at`) werden übersprungen
+- Dokumente ohne gespeicherten Vektor (oder mit Vektor eines anderen
+  Embedding-Modells) werden beim Laden eingebettet und der Vektor samt
+  `embedding_model` zurückgeschrieben - der nächste Start lädt ihn nur noch
+- `start_background()` lädt im Hintergrund; bis `ready` nutzt der Aufrufer
+  seine bisherige Mongo-Abfrage
+- Hybrid: mit Anfragetext zusätzlich BM25 (siehe bm25_index.py); die
+  Kandidaten beider Suchen werden über gewichtete, normierte Scores fusioniert
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+try:
+    from pymongo import UpdateOne
+except ImportError:
+    UpdateOne = None
+
+from services.bm25_index import BM25Index
+
+logger = logging.getLogger(__name__)
+
+# Konfiguration
+KNOWLEDGE_COLLECTIONS = ("tax_knowledge", "web_knowledge")
+KNOWLEDGE_TOP_K = int(os.environ.get("KNOWLEDGE_TOP_K", "6"))
+KNOWLEDGE_MIN_SCORE = float(os.environ.get("KNOWLEDGE_MIN_SCORE", "0.25"))
+KNOWLEDGE_SYNC_INTERVAL = float(os.environ.get("KNOWLEDGE_SYNC_INTERVAL", "60"))
+KNOWLEDGE_SYNC_OVERLAP = float(os.environ.get("KNOWLEDGE_SYNC_OVERLAP", "30"))
+KNOWLEDGE_ANN_THRESHOLD = int(os.environ.get("KNOWLEDGE_ANN_THRESHOLD", "50000"))
+# Anteil des Vektor-Scores an der Fusion (Rest: BM25, auf den besten Treffer normiert)
+KNOWLEDGE_VECTOR_WEIGHT = float(os.environ.get("KNOWLEDGE_VECTOR_WEIGHT", "0.6"))
+
+_PROJECTION = {"title": 1, "content": 1, "embedding": 1, "embedding_model": 1, "agents": 1, "agent": 1, "updated_at": 1, "deleted": 1}
+
+
+class VectorIndex:
+    """
+    Exakte Kosinus-Suche über eine wachsende NumPy-Matrix, optional HNSW.
+
+    Beispiel:
+        index = VectorIndex()
+        index.upsert(["a", "b"], vectors, masks=[0, 0b10])
+        hits = index.search(query, k=5, mask_bit=0b10)  # [(id, score), ...]
+    """
+
+    def __init__(self, ann_threshold: int = None):
+        """
+        Args:
+            ann_threshold: Ab so vielen Einträgen HNSW verwenden (nur mit hnswlib)
+        """
+        if np is None:
+            raise ImportError("numpy wird für den Wissens-Index benötigt")
+        self.ann_threshold = ann_threshold if ann_threshold is not None else KNOWLEDGE_ANN_THRESHOLD
+        self.dim: Optional[int] = None
+        self._matrix = None  # (Kapazität, dim) float32
+        self._masks = np.zeros(0, dtype=np.uint32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        # HNSW: stabile Labels pro ID (Zeilen verschieben sich beim Löschen)
+        self._ann = None
+        self._labels: Dict[str, int] = {}
+        self._label_ids: Dict[int, str] = {}
+        self._next_label = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _grow(self, needed: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        masks = np.zeros(capacity, dtype=np.uint32)
+        if self._matrix is not None:
+            matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+            masks[:len(self._ids)] = self._masks[:len(self._ids)]
+        self._matrix, self._masks = matrix, masks
+
+    def upsert(self, ids: Sequence[str], vectors, masks: Sequence[int]):
+        """Fügt Vektoren hinzu oder ersetzt bestehende (gleiche ID)"""
+        if not ids:
+            return
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._grow(len(self._ids) + len(ids))
+        rows = []
+        for doc_id, mask in zip(ids, masks):
+            row = self._rows.get(doc_id)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(doc_id)
+                self._rows[doc_id] = row
+            self._masks[row] = mask
+            rows.append(row)
+        self._matrix[rows] = vectors
+        if self._ann is not None:
+            self._ann_add(ids, vectors)
+
+    def remove(self, ids: Sequence[str]):
+        """Entfernt Einträge (die letzte Zeile rückt in die Lücke)"""
+        for doc_id in ids:
+            row = self._rows.pop(doc_id, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._masks[row] = self._masks[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._ids.pop()
+            label = self._labels.pop(doc_id, None)
+            if label is not None and self._ann is not None:
+                self._ann.mark_deleted(label)
+                del self._label_ids[label]
+
+    def _ann_add(self, ids: Sequence[str], vectors):
+        labels = []
+        for doc_id in ids:
+            label = self._labels.get(doc_id)
+            if label is None:
+                label = self._next_label
+                self._next_label += 1
+                self._labels[doc_id] = label
+                self._label_ids[label] = doc_id
+            labels.append(label)
+        if self._next_label > self._ann.get_max_elements():
+            self._ann.resize_index(max(self._next_label, self._ann.get_max_elements() * 2))
+        self._ann.add_items(vectors, np.asarray(labels))
+
+    def _ensure_ann(self):
+        if self._ann is not None or hnswlib is None or len(self._ids) < self.ann_threshold:
+            return
+        started = time.monotonic()
+        self._ann = hnswlib.Index(space="ip", dim=self.dim)
+        self._ann.init_index(max_elements=len(self._ids) * 2, ef_construction=200, M=16)
+        self._ann.set_ef(128)
+        self._ann_add(list(self._ids), self._matrix[:len(self._ids)])
+        logger.info(f"[KnowledgeIndex] HNSW über {len(self._ids)} Vektoren in {time.monotonic() - started:.1f}s aufgebaut")
+
+    def _allowed(self, rows, mask_bit: Optional[int]):
+        masks = self._masks[rows]
+        return (masks == 0) | ((masks & mask_bit) != 0) if mask_bit else np.ones(len(rows), dtype=bool)
+
+    def search(self, query: Sequence[float], k: int, mask_bit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Top-k (ID, Kosinus-Ähnlichkeit); mask_bit filtert auf Einträge dieses Agenten oder ohne Agent"""
+        count = len(self._ids)
+        if not count or k <= 0:
+            return []
+        query = self._normalize(np.asarray(query, dtype=np.float32))
+        if query.shape[0] != self.dim:
+            logger.warning(f"[KnowledgeIndex] Anfrage-Vektor hat Dimension {query.shape[0]}, Index {self.dim}")
+            return []
+
+        self._ensure_ann()
+        if self._ann is not None:
+            # Mit Filter mehr Kandidaten holen; reichen sie nicht, exakt suchen
+            labels, distances = self._ann.knn_query(query, k=min(k * 4, count))
+            ids = [self._label_ids[int(label)] for label in labels[0]]
+            rows = np.asarray([self._rows[doc_id] for doc_id in ids])
+            keep = self._allowed(rows, mask_bit)
+            hits = [(doc_id, 1.0 - float(d)) for doc_id, d, ok in zip(ids, distances[0], keep) if ok]
+            if len(hits) >= k:
+                return hits[:k]
+
+        scores = self._matrix[:count] @ query
+        if mask_bit:
+            scores = np.where(self._allowed(np.arange(count), mask_bit), scores, -np.inf)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[row], float(scores[row])) for row in top if np.isfinite(scores[row])]
+
+    def scores(self, ids: Sequence[str], query: Sequence[float]) -> Dict[str, float]:
+        """Exakte Kosinus-Ähnlichkeit für bestimmte Einträge (z.B. BM25-Kandidaten)"""
+        rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        if not rows or self.dim is None:
+            return {}
+        query = self._normalize(np.asarray(query, dtype=np.float32))
+        if query.shape[0] != self.dim:
+            return {}
+        values = self._matrix[rows] @ query
+        return {self._ids[row]: float(value) for row, value in zip(rows, values)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "vectors": len(self._ids),
+            "dim": self.dim,
+            "bytes": 0 if self._matrix is None else int(self._matrix.nbytes + self._masks.nbytes),
+            "ann": self._ann is not None,
+        }
+
+
+class KnowledgeIndex:
+    """
+    In-Process-Index über die Wissens-Collections, synchron gehalten mit MongoDB.
+
+    Beispiel:
+        index = KnowledgeIndex(db, embed=brain._embed, agents=[a.value for a in AgentType])
+        await index.start()
+        hits = index.search(query_embedding, agent="steuer", k=6)
+    """
+
+    def __init__(
+        self,
+        db,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        agents: Sequence[str],
+        embedding_model: str = None,
+        collections: Sequence[str] = KNOWLEDGE_COLLECTIONS,
+        sync_interval_s: float = None,
+        sync_overlap_s: float = None,
+        ann_threshold: int = None,
+    ):
+        """
+        Args:
+            db: Motor-Datenbank
+            embed: Async-Embedding-Funktion (für Dokumente ohne gespeicherten Vektor)
+            agents: Agenten-Namen (Reihenfolge bestimmt die Bits der Filtermaske, max. 32)
+            embedding_model: Name des Embedding-Modells; gespeicherte Vektoren anderer Modelle werden neu berechnet
+            collections: Indizierte Collections
+            sync_interval_s: Abstand der inkrementellen Synchronisation
+            sync_overlap_s: So weit vor dem letzten Stand setzt jede Synchronisation wieder an
+            ann_threshold: Ab so vielen Einträgen HNSW (falls hnswlib installiert)
+        """
+        self._db = db
+        self._embed = embed
+        self._agent_bits = {agent: 1 << i for i, agent in enumerate(list(agents)[:32])}
+        self.embedding_model = embedding_model
+        self.collections = tuple(collections)
+        self.sync_interval_s = sync_interval_s if sync_interval_s is not None else KNOWLEDGE_SYNC_INTERVAL
+        self.sync_overlap_s = sync_overlap_s if sync_overlap_s is not None else KNOWLEDGE_SYNC_OVERLAP
+        self.vectors = VectorIndex(ann_threshold=ann_threshold)
+        self.lexical = BM25Index()
+
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        # Höchstes gesehenes `updated_at` pro Collection (ISO-String wie alle Zeitstempel im Projekt)
+        self._synced_until: Dict[str, Any] = {}
+        # Übernommene Version (`updated_at`) pro Abschnitt, damit das Überlappungsfenster nichts doppelt einbettet
+        self._versions: Dict[str, Any] = {}
+        self._loaded: Set[str] = set()
+        self._sync_task: Optional[asyncio.Task] = None
+        self._start_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.ready = False
+
+        # Metriken
+        self.embedded = 0
+        self.written_back = 0
+        self.searches = 0
+        self.last_sync_ms = 0
+
+    # =========================================================================
+    # LADEN / SYNCHRONISIEREN
+    # =========================================================================
+
+    async def start(self) -> "KnowledgeIndex":
+        """Lädt alle Collections und startet die inkrementelle Synchronisation"""
+        await self.sync()
+        self.ready = True
+        logger.info(f"[KnowledgeIndex] {len(self._docs)} Abschnitte geladen ({self.last_sync_ms}ms)")
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_loop())
+        return self
+
+    def start_background(self) -> asyncio.Task:
+        """Wie start(), ohne darauf zu warten (Dienststart blockiert nicht auf dem Scan)"""
+        if self._start_task is None:
+            self._start_task = asyncio.create_task(self._start_logged())
+        return self._start_task
+
+    async def _start_logged(self):
+        try:
+            await self.start()
+        except Exception as e:
+            logger.warning(f"[KnowledgeIndex] Laden fehlgeschlagen, Wissensbasis ohne Index: {e}")
+
+    async def close(self):
+        if self._start_task and not self._start_task.done():
+            self._start_task.cancel()
+            try:
+                await self._start_task
+            except asyncio.CancelledError:
+                pass
+        self._start_task = None
+        if self._sync_task:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval_s)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"[KnowledgeIndex] Synchronisation fehlgeschlagen: {e}")
+
+    async def sync(self) -> int:
+        """Übernimmt alle seit dem letzten Lauf geänderten Dokumente. Returns: Anzahl verarbeiteter Dokumente"""
+        async with self._lock:
+            started = time.monotonic()
+            processed = 0
+            for collection in self.collections:
+                since = self._synced_until.get(collection)
+                if collection not in self._loaded:
+                    query = {}
+                else:
+                    # Dokumente ohne updated_at werden nur beim ersten Laden erfasst
+                    query = {"updated_at": {"$gte": self._sync_from(since)} if since else {"$exists": True}}
+                batch: List[Dict[str, Any]] = []
+                async for doc in self._db[collection].find(query, projection=_PROJECTION):
+                    batch.append(doc)
+                    if len(batch) >= 256:
+                        processed += await self._apply(collection, batch)
+                        batch = []
+                if batch:
+                    processed += await self._apply(collection, batch)
+                self._loaded.add(collection)
+            self.last_sync_ms = int((time.monotonic() - started) * 1000)
+            if processed and self.ready:
+                logger.info(f"[KnowledgeIndex] {processed} geänderte Abschnitte übernommen")
+            return processed
+
+    def _sync_from(self, since: Any) -> Any:
+        """Beginn der nächsten Abfrage: `sync_overlap_s` vor dem höchsten gesehenen `updated_at`"""
+        try:
+            moment = since if isinstance(since, datetime) else datetime.fromisoformat(since)
+        except (TypeError, ValueError):
+            return since
+        start = moment - timedelta(seconds=self.sync_overlap_s)
+        return start if isinstance(since, datetime) else start.isoformat()
+
+    def _mask(self, doc: Dict[str, Any]) -> int:
+        agents = doc.get("agents") or ([doc["agent"]] if doc.get("agent") else [])
+        mask = 0
+        for agent in agents:
+            mask |= self._agent_bits.get(agent, 0)
+        return mask
+
+    def _usable_vector(self, doc: Dict[str, Any]) -> bool:
+        vector = doc.get("embedding")
+        if not vector:
+            return False
+        if self.embedding_model and doc.get("embedding_model") not in (None, self.embedding_model):
+            return False
+        return self.vectors.dim is None or len(vector) == self.vectors.dim
+
+    async def _apply(self, collection: str, docs: List[Dict[str, Any]]) -> int:
+        removed, kept = [], []
+        for doc in docs:
+            doc_id = f"{collection}:{doc['_id']}"
+            updated_at = doc.get("updated_at")
+            since = self._synced_until.get(collection)
+            if updated_at and (since is None or updated_at > since):
+                self._synced_until[collection] = updated_at
+            if updated_at is not None and self._versions.get(doc_id) == updated_at:
+                continue
+            if doc.get("deleted") or not doc.get("content"):
+                removed.append(doc_id)
+                self._versions[doc_id] = updated_at
+            else:
+                kept.append((doc_id, doc))
+        if removed:
+            self.vectors.remove(removed)
+            self.lexical.remove(removed)
+            for doc_id in removed:
+                self._docs.pop(doc_id, None)
+            if len(self._versions) > 2 * max(len(self._docs), 1000):
+                # Versionen längst gelöschter Abschnitte nicht ewig halten
+                self._versions = {doc_id: self._versions[doc_id] for doc_id in self._docs if doc_id in self._versions}
+
+        missing = [doc for _, doc in kept if not self._usable_vector(doc)]
+        for start in range(0, len(missing), 64):
+            chunk = missing[start:start + 64]
+            vectors = await self._embed([doc["content"] for doc in chunk])
+            for doc, vector in zip(chunk, vectors):
+                doc["embedding"] = vector
+            self.embedded += len(chunk)
+            await self._write_back(collection, chunk)
+
+        kept = [(doc_id, doc) for doc_id, doc in kept if doc.get("embedding")]
+        if not kept:
+            return len(removed)
+        self.vectors.upsert(
+            [doc_id for doc_id, _ in kept],
+            [doc["embedding"] for _, doc in kept],
+            [self._mask(doc) for _, doc in kept],
+        )
+        for doc_id, doc in kept:
+            self._versions[doc_id] = doc.get("updated_at")
+            self.lexical.add(doc_id, f"{doc.get('title') or ''}\n{doc['content']}", self._mask(doc))
+            self._docs[doc_id] = {
+                "id": doc_id,
+                "collection": collection,
+                "title": doc.get("title"),
+                "content": doc["content"],
+            }
+        return len(removed) + len(kept)
+
+    async def _write_back(self, collection: str, docs: List[Dict[str, Any]]):
+        """
+        Speichert nachträglich berechnete Vektoren am Dokument, sonst bettet jeder
+        Neustart sie erneut ein. `updated_at` bleibt unverändert (keine Sync-Schleife);
+        der Filter auf `content` verhindert, dass ein Vektor zu veraltetem Text landet.
+        """
+        if UpdateOne is None or not docs:
+            return
+        fields = {"embedding_model": self.embedding_model} if self.embedding_model else {}
+        operations = [
+            UpdateOne({"_id": doc["_id"], "content": doc["content"]}, {"$set": dict(fields, embedding=list(doc["embedding"]))})
+            for doc in docs
+        ]
+        try:
+            await self._db[collection].bulk_write(operations, ordered=False)
+            self.written_back += len(operations)
+        except Exception as e:
+            logger.warning(f"[KnowledgeIndex] Vektoren für {collection} nicht gespeichert: {e}")
+
+    # =========================================================================
+    # SUCHE
+    # =========================================================================
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        agent: str = None,
+        k: int = None,
+        min_score: float = None,
+        query_text: str = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Relevanteste Abschnitte für eine Anfrage.
+
+        Args:
+            query_embedding: Embedding der Nutzerfrage (leer = nur BM25)
+            agent: Agenten-Name als Filter (None/unbekannt = alle Abschnitte)
+            k: Anzahl Treffer (Standard: KNOWLEDGE_TOP_K)
+            min_score: Mindest-Ähnlichkeit für Treffer ohne lexikalische Übereinstimmung (Standard: KNOWLEDGE_MIN_SCORE)
+            query_text: Nutzerfrage im Klartext; aktiviert die hybride Suche mit BM25
+
+        Returns:
+            Liste von {"id", "collection", "title", "content", "score", "vector_score", "bm25_score"}, bester zuerst
+        """
+        k = k if k is not None else KNOWLEDGE_TOP_K
+        min_score = min_score if min_score is not None else KNOWLEDGE_MIN_SCORE
+        mask_bit = self._agent_bits.get(agent)
+        self.searches += 1
+
+        # Beide Suchen mit Überhang, damit die Fusion aus genug Kandidaten wählt
+        depth = k * 4 if query_text else k
+        vector = dict(self.vectors.search(query_embedding, depth, mask_bit)) if query_embedding else {}
+        lexical = dict(self.lexical.search(query_text, depth, mask_bit)) if query_text else {}
+        if not lexical:
+            hits = sorted(vector.items(), key=lambda item: -item[1])[:k]
+            return [dict(self._docs[doc_id], score=round(score, 4), vector_score=round(score, 4), bm25_score=0.0) for doc_id, score in hits if score >= min_score]
+
+        # Lexikalische Kandidaten bekommen ihren exakten Vektor-Score nachgereicht
+        if query_embedding:
+            vector.update(self.vectors.scores([doc_id for doc_id in lexical if doc_id not in vector], query_embedding))
+        best_bm25 = max(lexical.values())
+        weight = KNOWLEDGE_VECTOR_WEIGHT if query_embedding else 0.0
+        fused = []
+        for doc_id in set(vector) | set(lexical):
+            vector_score = vector.get(doc_id, 0.0)
+            bm25 = lexical.get(doc_id, 0.0)
+            # Ohne exakten Token-Treffer muss der Abschnitt semantisch nah genug sein
+            if not bm25 and vector_score < min_score:
+                continue
+            score = weight * vector_score + (1 - weight) * bm25 / best_bm25
+            fused.append((score, doc_id, vector_score, bm25))
+        fused.sort(reverse=True)
+        return [
+            dict(self._docs[doc_id], score=round(score, 4), vector_score=round(vector_score, 4), bm25_score=round(bm25, 3))
+            for score, doc_id, vector_score, bm25 in fused[:k]
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.vectors.get_stats(),
+            bm25=self.lexical.get_stats(),
+            documents=len(self._docs),
+            embedded_on_load=self.embedded,
+            written_back=self.written_back,
+            searches=self.searches,
+            last_sync_ms=self.last_sync_ms,
+            synced_until={collection: str(value) for collection, value in self._synced_until.items()},
+        )
+
+
+# Test mit Zufallsvektoren
+if __name__ == "__main__":
+
+    def test():
+        print("=== Vektor-Index Test ===\n")
+        rng = np.random.default_rng(0)
+        index = VectorIndex(ann_threshold=10**9)
+        vectors = rng.normal(size=(20000, 384)).astype(np.float32)
+        masks = [0 if i % 3 == 0 else (1 << (i % 5)) for i in range(len(vectors))]
+        index.upsert([f"doc{i}" for i in range(len(vectors))], vectors, masks)
+
+        started = time.perf_counter()
+        hits = index.search(vectors[42] + 0.01, k=5)
+        print(f"1. Top-5 über {len(index)} Vektoren in {(time.perf_counter() - started) * 1000:.1f}ms: {hits[0]}")
+        assert hits[0][0] == "doc42"
+
+        hits = index.search(vectors[7], k=5, mask_bit=1 << 2)
+        assert all(masks[int(doc_id[3:])] in (0, 1 << 2) for doc_id, _ in hits)
+        assert hits[0][0] == "doc7"
+        print("2. Agenten-Filter ✓")
+
+        index.remove(["doc42"])
+        assert index.search(vectors[42], k=1)[0][0] != "doc42"
+        index.upsert(["doc42"], vectors[42:43], [0])
+        assert index.search(vectors[42], k=1)[0][0] == "doc42"
+        print(f"3. Entfernen/Einfügen ✓\n\nStats: {index.get_stats()}")
+
+    test()
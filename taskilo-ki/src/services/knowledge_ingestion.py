@@ -0,0 +1,574 @@
+"""
+Wissens-Ingestion für Taskilo-KI
+=================================
+Befüllt `tax_knowledge` / `web_knowledge` mit Abschnitten und vorberechneten
+Vektoren, damit der Wissens-Index (knowledge_index.py) beim Start nichts
+einbetten muss.
+
+Ablauf:
+- Quelldokumente werden gestreamt (Verzeichnis mit .md/.txt oder JSONL)
+- Aufteilung in überlappende Abschnitte entlang von Absätzen und Sätzen
+- Abschnitte mehrerer Dokumente werden gesammelt und gebündelt eingebettet
+- Upsert pro Abschnitt mit inhaltsbasierter ID `<source_id>#<hash>` und `updated_at`
+
+Idempotent und fortsetzbar:
+- Pro Quelle wird ein Hash (Text, Metadaten, Chunking, Embedding-Modell) in
+  `knowledge_sources` abgelegt - unveränderte Quellen werden übersprungen
+- Pro Abschnitt ein `content_hash`; Abschnitte werden über den Hash, nicht
+  über ihre Position wiedererkannt - ein eingefügter Absatz schreibt nur die
+  neuen Abschnitte, die übrigen bleiben samt Vektor unangetastet
+- Der Quell-Hash wird erst geschrieben, wenn alle Abschnitte gespeichert
+  sind; ein abgebrochener Lauf setzt also bei der ersten unfertigen Quelle fort
+- Alte Abschnitte, deren Hash nicht mehr vorkommt, werden (nach dem Schreiben
+  der neuen) mit `deleted: true` markiert; der Index entfernt sie bei der
+  nächsten Synchronisation
+
+Aufruf:
+    python -m services.knowledge_ingestion ./wissen/steuern --collection tax_knowledge --agents steuer
+    python -m services.knowledge_ingestion   # Selbsttest mit simulierter MongoDB
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    from pymongo import UpdateOne
+except ImportError:
+    UpdateOne = None
+
+logger = logging.getLogger(__name__)
+
+# Konfiguration
+INGEST_CHUNK_CHARS = int(os.environ.get("INGEST_CHUNK_CHARS", "900"))
+INGEST_CHUNK_OVERLAP = int(os.environ.get("INGEST_CHUNK_OVERLAP", "150"))
+INGEST_EMBED_BATCH = int(os.environ.get("INGEST_EMBED_BATCH", "64"))
+
+SOURCES_COLLECTION = "knowledge_sources"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class SourceDocument:
+    """Ein Quelldokument vor dem Aufteilen"""
+    source_id: str
+    text: str
+    title: Optional[str] = None
+    collection: str = "tax_knowledge"
+    agents: List[str] = field(default_factory=list)
+    url: Optional[str] = None
+
+
+@dataclass
+class IngestionStats:
+    sources: int = 0
+    sources_unchanged: int = 0
+    chunks: int = 0
+    chunks_unchanged: int = 0
+    chunks_written: int = 0
+    chunks_deleted: int = 0
+    sources_pruned: int = 0
+    elapsed_s: float = 0.0
+
+
+# =============================================================================
+# QUELLEN
+# =============================================================================
+
+async def iter_directory(path: str, collection: str = "tax_knowledge", agents: Sequence[str] = ()) -> AsyncIterator[SourceDocument]:
+    """Alle .md/.txt-Dateien unterhalb von `path`; source_id = relativer Pfad, Titel = erste Überschrift bzw. Dateiname"""
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            if not name.endswith((".md", ".txt")):
+                continue
+            file_path = os.path.join(root, name)
+            text = await asyncio.to_thread(_read_text, file_path)
+            first_line = text.lstrip().split("\n", 1)[0]
+            title = first_line.lstrip("# ").strip() if first_line.startswith("#") else os.path.splitext(name)[0]
+            yield SourceDocument(
+                source_id=os.path.relpath(file_path, path),
+                text=text,
+                title=title,
+                collection=collection,
+                agents=list(agents),
+            )
+
+
+async def iter_jsonl(path: str, collection: str = "tax_knowledge", agents: Sequence[str] = ()) -> AsyncIterator[SourceDocument]:
+    """
+    Eine Quelle pro Zeile: {"id", "content", "title"?, "collection"?, "agents"?, "url"?}
+
+    Die Datei wird blockweise (ca. 1 MB ganze Zeilen pro Thread-Aufruf) gelesen,
+    nie komplett - auch mehrere GB große Exporte bleiben im Speicher klein.
+    """
+    f = await asyncio.to_thread(open, path, "r", encoding="utf-8")
+    try:
+        number = 0
+        while True:
+            lines = await asyncio.to_thread(f.readlines, 1 << 20)
+            if not lines:
+                break
+            for line in lines:
+                number += 1
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError as e:
+                    logger.warning(f"[Ingestion] {path}:{number} übersprungen: {e}")
+                    continue
+                yield SourceDocument(
+                    source_id=str(data.get("id") or data.get("url") or f"{os.path.basename(path)}:{number}"),
+                    text=data.get("content", ""),
+                    title=data.get("title"),
+                    collection=data.get("collection", collection),
+                    agents=data.get("agents") or list(agents),
+                    url=data.get("url"),
+                )
+    finally:
+        f.close()
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# =============================================================================
+# AUFTEILEN
+# =============================================================================
+
+def _units(text: str, max_chars: int) -> List[Tuple[str, bool]]:
+    """Sätze je Absatz (zu lange Sätze in Wortgruppen), jeweils mit Markierung, ob die Einheit den Absatz beendet"""
+    units: List[Tuple[str, bool]] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        pieces: List[str] = []
+        for sentence in _SENTENCE_END.split(paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if sentence:
+                pieces.append(sentence)
+        units.extend((piece, i == len(pieces) - 1) for i, piece in enumerate(pieces))
+    return units
+
+
+def chunk_text(text: str, chunk_chars: int = None, overlap: int = None) -> List[str]:
+    """
+    Teilt Text in überlappende Abschnitte.
+
+    Ein Abschnitt endet an einem Absatzende, sobald er halb voll ist. Die Grenzen
+    hängen so vom Inhalt ab statt von der Position: wird oben ein Absatz eingefügt,
+    ändern sich nur die Abschnitte um die Einfügung, alle weiteren bleiben
+    wortgleich (gleicher content_hash, kein neues Embedding).
+
+    Args:
+        text: Quelltext
+        chunk_chars: Ziel-Länge eines Abschnitts in Zeichen
+        overlap: Zeichen, die vom Ende des vorigen Abschnitts wiederholt werden
+            (ganze Sätze, damit keine Aussage zerschnitten wird)
+    """
+    chunk_chars = chunk_chars or INGEST_CHUNK_CHARS
+    overlap = INGEST_CHUNK_OVERLAP if overlap is None else overlap
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    fresh = False  # enthält der Abschnitt mehr als die Überlappung?
+
+    def close_chunk():
+        nonlocal current, size, fresh
+        chunks.append(" ".join(current))
+        tail: List[str] = []
+        tail_size = 0
+        for previous in reversed(current):
+            if tail_size + len(previous) + 1 > overlap:
+                break
+            tail.insert(0, previous)
+            tail_size += len(previous) + 1
+        current, size, fresh = tail, tail_size, False
+
+    for unit, paragraph_end in _units(text, chunk_chars):
+        if fresh and size + len(unit) > chunk_chars:
+            close_chunk()
+        current.append(unit)
+        size += len(unit) + 1
+        fresh = True
+        if paragraph_end and size >= chunk_chars // 2:
+            close_chunk()
+    if fresh:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _hash(*parts: Any) -> str:
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+class KnowledgeIngestion:
+    """
+    Abschnitte erzeugen, einbetten und idempotent in MongoDB schreiben.
+
+    Beispiel:
+        ingestion = KnowledgeIngestion(db, embed=ollama.embed, embedding_model=EMBED_MODEL)
+        stats = await ingestion.run(iter_directory("./wissen/steuern", agents=["steuer"]))
+    """
+
+    def __init__(
+        self,
+        db,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        embedding_model: str,
+        chunk_chars: int = None,
+        overlap: int = None,
+        batch_size: int = None,
+    ):
+        """
+        Args:
+            db: Motor-Datenbank
+            embed: Async-Embedding-Funktion (dasselbe Modell wie im MasterBrain)
+            embedding_model: Name des Embedding-Modells (wird pro Abschnitt gespeichert)
+            chunk_chars: Ziel-Länge eines Abschnitts
+            overlap: Überlappung zwischen Abschnitten
+            batch_size: Abschnitte pro Embedding-Aufruf
+        """
+        if UpdateOne is None:
+            raise ImportError("pymongo wird für die Ingestion benötigt")
+        self._db = db
+        self._embed = embed
+        self.embedding_model = embedding_model
+        self.chunk_chars = chunk_chars or INGEST_CHUNK_CHARS
+        self.overlap = INGEST_CHUNK_OVERLAP if overlap is None else overlap
+        self.batch_size = batch_size or INGEST_EMBED_BATCH
+
+        # Abschnitte, die auf Einbettung warten, und Quellen, deren Abschnitte alle im Puffer sind
+        self._pending: List[Dict[str, Any]] = []
+        self._completed: List[Dict[str, Any]] = []
+        self.stats = IngestionStats()
+
+    async def ensure_indexes(self, collections: Sequence[str]):
+        for collection in collections:
+            await self._db[collection].create_index([("source_id", 1), ("chunk_index", 1)])
+            await self._db[collection].create_index("updated_at")
+
+    async def run(self, sources: AsyncIterator[SourceDocument], prune: bool = False) -> IngestionStats:
+        """
+        Verarbeitet alle Quellen.
+
+        Args:
+            sources: Quelldokumente (z.B. iter_directory / iter_jsonl)
+            prune: Abschnitte von Quellen, die diesmal fehlen, als gelöscht markieren
+                (nur bei vollständigen Läufen über den ganzen Bestand sinnvoll)
+        """
+        started = time.monotonic()
+        seen: Dict[str, Set[str]] = {}
+        async for source in sources:
+            seen.setdefault(source.collection, set()).add(source.source_id)
+            await self._ingest(source)
+            if len(self._pending) >= self.batch_size:
+                await self._flush()
+        await self._flush()
+        if prune:
+            for collection, source_ids in seen.items():
+                await self._prune(collection, source_ids)
+        self.stats.elapsed_s = round(time.monotonic() - started, 1)
+        logger.info(f"[Ingestion] Fertig: {asdict(self.stats)}")
+        return self.stats
+
+    async def _ingest(self, source: SourceDocument):
+        self.stats.sources += 1
+        source_hash = _hash(source.text, source.title, sorted(source.agents), source.url, self.chunk_chars, self.overlap, self.embedding_model)
+        marker = await self._db[SOURCES_COLLECTION].find_one({"_id": f"{source.collection}:{source.source_id}"})
+        if marker and marker.get("source_hash") == source_hash:
+            self.stats.sources_unchanged += 1
+            return
+
+        chunks = chunk_text(source.text, self.chunk_chars, self.overlap)
+        # Vorhandene Abschnitte nach Inhalt (auch ältere mit positionsbasierter ID)
+        existing: Dict[str, Dict[str, Any]] = {}
+        stale: List[Any] = []
+        async for doc in self._db[source.collection].find(
+            {"source_id": source.source_id, "deleted": {"$ne": True}}, projection={"chunk_index": 1, "content_hash": 1}
+        ):
+            if doc.get("content_hash") in existing:
+                stale.append(doc["_id"])
+            else:
+                existing[doc.get("content_hash")] = doc
+
+        wanted: Set[str] = set()
+        reindex: List[Any] = []
+        for index, content in enumerate(chunks):
+            self.stats.chunks += 1
+            content_hash = _hash(source.title, content, sorted(source.agents), source.url, self.embedding_model)
+            if content_hash in wanted:
+                # Wortgleicher Abschnitt innerhalb derselben Quelle
+                self.stats.chunks_unchanged += 1
+                continue
+            wanted.add(content_hash)
+            previous = existing.get(content_hash)
+            if previous is not None:
+                self.stats.chunks_unchanged += 1
+                if previous.get("chunk_index") != index:
+                    # Nur die Reihenfolge; `updated_at` bleibt, der Index muss nichts tun
+                    reindex.append(UpdateOne({"_id": previous["_id"]}, {"$set": {"chunk_index": index}}))
+                continue
+            self._pending.append({
+                "collection": source.collection,
+                "doc": {
+                    "_id": f"{source.source_id}#{content_hash[:16]}",
+                    "source_id": source.source_id,
+                    "chunk_index": index,
+                    "title": source.title,
+                    "content": content,
+                    "agents": list(source.agents),
+                    "url": source.url,
+                    "content_hash": content_hash,
+                    "embedding_model": self.embedding_model,
+                    "deleted": False,
+                },
+            })
+        if reindex:
+            await self._db[source.collection].bulk_write(reindex, ordered=False)
+
+        # Nicht mehr vorkommende Abschnitte erst nach dem Schreiben der neuen austragen (siehe _flush)
+        stale += [doc["_id"] for content_hash, doc in existing.items() if content_hash not in wanted]
+        self._completed.append({
+            "collection": source.collection,
+            "stale": stale,
+            "marker": {"_id": f"{source.collection}:{source.source_id}", "source_hash": source_hash, "chunks": len(chunks), "updated_at": datetime.now().isoformat()},
+        })
+
+    async def _flush(self):
+        """Bettet den Puffer gebündelt ein, schreibt die Abschnitte und danach die Quell-Hashes"""
+        pending, self._pending = self._pending, []
+        completed, self._completed = self._completed, []
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = await self._embed([item["doc"]["content"] for item in batch])
+            now = datetime.now().isoformat()
+            by_collection: Dict[str, List[Any]] = {}
+            for item, vector in zip(batch, vectors):
+                doc = dict(item["doc"], embedding=list(vector), updated_at=now)
+                by_collection.setdefault(item["collection"], []).append(UpdateOne({"_id": doc["_id"]}, {"$set": doc}, upsert=True))
+            for collection, operations in by_collection.items():
+                await self._db[collection].bulk_write(operations, ordered=False)
+            self.stats.chunks_written += len(batch)
+            logger.info(f"[Ingestion] {self.stats.chunks_written} Abschnitte geschrieben ({self.stats.sources} Quellen gelesen)")
+
+        # Neue Abschnitte stehen: jetzt die ersetzten austragen
+        now = datetime.now().isoformat()
+        for source in completed:
+            if source["stale"]:
+                await self._db[source["collection"]].update_many(
+                    {"_id": {"$in": source["stale"]}},
+                    {"$set": {"deleted": True, "updated_at": now}, "$unset": {"embedding": ""}},
+                )
+                self.stats.chunks_deleted += len(source["stale"])
+
+        # Erst jetzt gelten die Quellen als fertig - ein Abbruch davor wiederholt sie beim nächsten Lauf
+        if completed:
+            await self._db[SOURCES_COLLECTION].bulk_write(
+                [UpdateOne({"_id": source["marker"]["_id"]}, {"$set": source["marker"]}, upsert=True) for source in completed],
+                ordered=False,
+            )
+
+    async def _prune(self, collection: str, source_ids: Set[str]):
+        prefix = f"{collection}:"
+        async for marker in self._db[SOURCES_COLLECTION].find({"_id": {"$regex": f"^{re.escape(prefix)}"}}, projection={"_id": 1}):
+            source_id = marker["_id"][len(prefix):]
+            if source_id in source_ids:
+                continue
+            await self._db[collection].update_many(
+                {"source_id": source_id, "deleted": {"$ne": True}},
+                {"$set": {"deleted": True, "updated_at": datetime.now().isoformat()}, "$unset": {"embedding": ""}},
+            )
+            await self._db[SOURCES_COLLECTION].delete_one({"_id": marker["_id"]})
+            self.stats.sources_pruned += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**asdict(self.stats), "pending": len(self._pending), "batch_size": self.batch_size}
+
+
+# Kommandozeile
+def _cli(argv: List[str]):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Wissensdokumente aufteilen, einbetten und in MongoDB speichern")
+    parser.add_argument("path", help="Verzeichnis mit .md/.txt oder .jsonl-Datei")
+    parser.add_argument("--collection", default="tax_knowledge", choices=["tax_knowledge", "web_knowledge"])
+    parser.add_argument("--agents", default="", help="Agenten, kommagetrennt (leer = alle)")
+    parser.add_argument("--prune", action="store_true", help="Fehlende Quellen als gelöscht markieren")
+    # Standard wie MasterBrain (EMBEDDING_BACKEND), sonst verwirft der Wissens-Index die Vektoren als fremdes Modell
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--sentence-transformer", dest="backend", action="store_const", const="sentence-transformers", help="Lokales SentenceTransformer-Modell erzwingen")
+    backend.add_argument("--ollama", dest="backend", action="store_const", const="ollama", help="Ollama /api/embed erzwingen")
+    parser.set_defaults(backend=os.environ.get("EMBEDDING_BACKEND", "sentence-transformers"))
+    args = parser.parse_args(argv)
+
+    async def main():
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        from services.ollama_service import EMBED_MODEL, OllamaService, Priority, close_http_session
+
+        logging.basicConfig(level=logging.INFO)
+        client = AsyncIOMotorClient(os.environ.get("MONGODB_URL", "mongodb://taskilo-mongo:27017"))
+        db = client["taskilo_ki"]
+        logger.info(f"[Ingestion] Embedding-Backend: {args.backend}")
+        if args.backend != "ollama":
+            from sentence_transformers import SentenceTransformer
+
+            from services.embedding_worker import EmbeddingWorker
+            from services.master_brain import MasterBrain
+
+            model = SentenceTransformer(MasterBrain.SENTENCE_TRANSFORMER_MODEL)
+            worker = EmbeddingWorker(lambda texts: model.encode(texts, batch_size=64))
+            ingestion = KnowledgeIngestion(db, embed=worker.encode, embedding_model=MasterBrain.SENTENCE_TRANSFORMER_MODEL)
+        else:
+            ollama = OllamaService(timeout=120, priority=Priority.BATCH)
+            ingestion = KnowledgeIngestion(db, embed=ollama.embed, embedding_model=EMBED_MODEL)
+        await ingestion.ensure_indexes([args.collection])
+        agents = [agent.strip() for agent in args.agents.split(",") if agent.strip()]
+        reader = iter_jsonl if args.path.endswith(".jsonl") else iter_directory
+        stats = await ingestion.run(reader(args.path, collection=args.collection, agents=agents), prune=args.prune)
+        print(json.dumps(asdict(stats), indent=2))
+        await close_http_session()
+        client.close()
+
+    asyncio.run(main())
+
+
+# Test mit simulierter MongoDB (ohne Argumente), sonst Kommandozeile
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        _cli(sys.argv[1:])
+        sys.exit(0)
+
+    class _Cursor:
+        def __init__(self, docs):
+            self._docs = iter(docs)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return dict(next(self._docs))
+            except StopIteration:
+                raise StopAsyncIteration
+
+    class _Collection:
+        def __init__(self):
+            self.docs: Dict[str, Dict[str, Any]] = {}
+
+        def _matches(self, doc, query):
+            for key, condition in query.items():
+                value = doc.get(key)
+                if isinstance(condition, dict):
+                    if "$in" in condition and value not in condition["$in"]:
+                        return False
+                    if "$ne" in condition and value == condition["$ne"]:
+                        return False
+                    if "$regex" in condition and not re.match(condition["$regex"], value):
+                        return False
+                elif value != condition:
+                    return False
+            return True
+
+        async def find_one(self, query):
+            return next((dict(d) for d in self.docs.values() if self._matches(d, query)), None)
+
+        def find(self, query, projection=None):
+            return _Cursor([d for d in self.docs.values() if self._matches(d, query)])
+
+        async def bulk_write(self, operations, ordered=True):
+            for op in operations:
+                self.docs.setdefault(op._filter["_id"], {}).update(op._doc["$set"])
+
+        async def update_many(self, query, update):
+            for doc in self.docs.values():
+                if self._matches(doc, query):
+                    doc.update(update["$set"])
+                    for key in update.get("$unset", {}):
+                        doc.pop(key, None)
+
+        async def delete_one(self, query):
+            self.docs.pop(query["_id"], None)
+
+    class _Database(dict):
+        def __missing__(self, name):
+            self[name] = _Collection()
+            return self[name]
+
+    async def test():
+        print("=== Ingestion Test ===\n")
+        text = "\n\n".join(f"Absatz {i}. " + "Kleinunternehmer nach § 19 UStG zahlen keine Umsatzsteuer. " * 5 for i in range(8))
+        chunks = chunk_text(text, chunk_chars=600, overlap=120)
+        assert all(len(c) <= 600 for c in chunks)
+        # Der letzte Satz eines Abschnitts steht am Anfang des nächsten
+        assert all(_units(chunks[i], 600)[-1][0] in chunks[i + 1][:120] for i in range(len(chunks) - 1))
+        print(f"1. {len(chunks)} Abschnitte à max. 600 Zeichen, mit Überlappung ✓")
+
+        embedded: List[int] = []
+
+        async def embed(texts: List[str]) -> List[List[float]]:
+            embedded.append(len(texts))
+            return [[float(len(t)), 1.0] for t in texts]
+
+        async def sources(long_text: str):
+            yield SourceDocument("ustg.md", long_text, "UStG", agents=["steuer"])
+            yield SourceDocument("afa.md", "Die AfA für Computer beträgt ein Jahr.", "AfA")
+
+        db = _Database()
+        stats = await KnowledgeIngestion(db, embed, "test-embed", chunk_chars=600, overlap=120, batch_size=4).run(sources(text))
+        assert stats.chunks_written == len(chunks) + 1 and sum(embedded) == stats.chunks_written
+        print(f"2. Erstlauf: {stats.chunks_written} Abschnitte in {len(embedded)} Embedding-Batches")
+
+        embedded.clear()
+        stats = await KnowledgeIngestion(db, embed, "test-embed", chunk_chars=600, overlap=120, batch_size=4).run(sources(text))
+        assert stats.sources_unchanged == 2 and not embedded
+        print("3. Zweiter Lauf: beide Quellen unverändert übersprungen ✓")
+
+        def live() -> Set[str]:
+            return {doc["content"] for doc in db["tax_knowledge"].docs.values() if not doc["deleted"] and doc["source_id"] == "ustg.md"}
+
+        shorter = text[:1500]
+        embedded.clear()
+        stats = await KnowledgeIngestion(db, embed, "test-embed", chunk_chars=600, overlap=120, batch_size=4).run(sources(shorter))
+        assert live() == set(chunk_text(shorter, 600, 120)) and stats.chunks_written == sum(embedded)
+        assert stats.chunks_deleted == len(set(chunks) - set(chunk_text(shorter, 600, 120)))
+        assert all("embedding" not in doc for doc in db["tax_knowledge"].docs.values() if doc["deleted"])
+        print(f"4. Gekürzte Quelle: {stats.chunks_unchanged} unverändert, {stats.chunks_written} neu, {stats.chunks_deleted} als gelöscht markiert ✓")
+
+        # Absatz ganz oben einfügen: nur die Abschnitte um die Einfügung werden neu eingebettet
+        await KnowledgeIngestion(db, embed, "test-embed", chunk_chars=600, overlap=120, batch_size=4).run(sources(text))
+        embedded.clear()
+        inserted = "Neu: Die Umsatzsteuer-Voranmeldung ist monatlich fällig. " * 4 + "\n\n" + text
+        stats = await KnowledgeIngestion(db, embed, "test-embed", chunk_chars=600, overlap=120, batch_size=4).run(sources(inserted))
+        assert live() == set(chunk_text(inserted, 600, 120))
+        assert sum(embedded) <= 2 and stats.chunks_unchanged >= len(chunks) - 1
+        print(f"5. Absatz oben eingefügt: {sum(embedded)} Abschnitte neu eingebettet, {stats.chunks_unchanged} wiederverwendet ✓")
+        print(f"\nStats: {asdict(stats)}")
+
+    if UpdateOne is None:
+        print("pymongo nicht installiert - Test übersprungen")
+    else:
+        asyncio.run(test())
@@ -31,11 +31,12 @@ Architektur:
 """
 
 import asyncio
-import aiohttp
 import logging
 import os
-from typing import Dict, List, Any, Optional, Tuple
+import time
+from typing import Awaitable, Dict, List, Any, Optional, Set, Tuple, AsyncIterator, Union
 from dataclasses import dataclass, field
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from enum import Enum
 import json
@@ -43,7 +44,7 @@ import hashlib
 
 # Ollama Service - Lokales LLM auf GPU (RTX 4000, 20GB VRAM)
 try:
-    from services.ollama_service import OllamaService, OllamaModel
+    from services.ollama_service import OllamaService, OllamaModel, EMBED_MODEL
     OLLAMA_AVAILABLE = True
 except ImportError:
     OLLAMA_AVAILABLE = False
@@ -60,7 +61,14 @@ except ImportError:
 
 
 # Multi-Model Router für automatische Modell-Auswahl
-from services.multi_model_router import MultiModelRouter
+from services.multi_model_router import MultiModelRouter, RoutingHint, ModelCapability, get_router
+from services.ollama_scheduler import SchedulerRejected
+from services.session_context import SESSION_CONTEXT_MAX_SESSIONS
+from services.generation_cache import CACHE_MAX_TEMPERATURE
+from services.keyword_classifier import KeywordClassifier
+from services.semantic_router import SemanticRouter, CAPABILITY_PROTOTYPES
+from services.embedding_worker import EmbeddingWorker
+from services.knowledge_index import KnowledgeIndex, np as _numpy
 logger = logging.getLogger(__name__)
 
 
@@ -161,6 +169,22 @@ class BrainResponse:
     thinking_time_ms: int
     context_used: bool
     memory_used: bool
+    stage_timings_ms: Dict[str, int] = field(default_factory=dict)
+    retry_after_s: Optional[float] = None  # gesetzt, wenn die GPU-Warteschlange die Anfrage abgelehnt hat
+
+
+@dataclass
+class PreparedTurn:
+    """Vorbereiteter Turn: erkannter Agent und fertige Chat-Nachrichten"""
+    message: str
+    agent_type: AgentType
+    messages: List[Dict[str, str]]
+    knowledge_context: str
+    history_messages: List[Dict[str, str]]
+    start_time: datetime
+    capability: Optional[ModelCapability] = None
+    stage_timings_ms: Dict[str, int] = field(default_factory=dict)
+    user_saved: Optional[asyncio.Task] = None
 
 
 class MasterBrain:
@@ -169,6 +193,13 @@ class MasterBrain:
     Koordiniert alle Agenten und verwaltet das Langzeitgedächtnis.
     """
     
+    # Antwort, wenn die GPU-Warteschlange die Anfrage wegen ihrer Deadline ablehnt
+    BUSY_ANSWER = "Ich bin gerade stark ausgelastet. Bitte versuche es in etwa {seconds} Sekunden noch einmal."
+    
+    # Platzhalter-IDs der API-Methoden: mehrere Benutzer/Gespräche teilen sie sich
+    SHARED_USER_IDS = frozenset({"anonymous", "demo"})
+    SHARED_SESSION_IDS = frozenset({"default"})
+    
     # System-Prompt für die Persönlichkeit (Multi-Agent System)
     PERSONALITY = """Du bist Taskilo, ein hochentwickelter Multi-Agent KI-Assistent für Freelancer und Unternehmer in Deutschland.
 
@@ -310,27 +341,183 @@ WICHTIG:
             "figma", "typografie", "accessibility", "a11y"
         ]
     }
+    
+    # Prototyp-Fragen für den semantischen Router (ganze Sätze statt Einzelwörter,
+    # GENERAL fängt Smalltalk ab, damit er nicht beim nächstbesten Fach-Agenten landet)
+    AGENT_PROTOTYPES = {
+        AgentType.GENERAL: [
+            "Hallo, wie geht es dir?",
+            "Danke, das hat mir sehr geholfen!",
+            "Was kannst du alles?",
+            "Guten Morgen, bist du da?",
+            "Alles klar, bis später!",
+        ],
+        AgentType.STEUER: [
+            "Wie hoch ist der Grundfreibetrag in diesem Jahr?",
+            "Muss ich als Kleinunternehmer Umsatzsteuer ausweisen?",
+            "Kann ich meinen Laptop von der Steuer absetzen?",
+            "Wann muss ich die Umsatzsteuervoranmeldung beim Finanzamt abgeben?",
+        ],
+        AgentType.FINANZ: [
+            "Wie behalte ich meine Einnahmen und Ausgaben im Blick?",
+            "Mein Kontostand reicht nächsten Monat nicht für alle Rechnungen",
+            "Wie schreibe ich eine korrekte Rechnung?",
+            "Lohnt sich ein Kredit für die Geschäftsausstattung?",
+        ],
+        AgentType.RISIKO: [
+            "Welche Versicherungen brauche ich als Selbstständiger?",
+            "Ein Kunde zahlt seit drei Monaten nicht, was soll ich tun?",
+            "Wie schütze ich mich vor einer Insolvenz?",
+            "Wer haftet, wenn bei einem Auftrag etwas schiefgeht?",
+        ],
+        AgentType.WACHSTUM: [
+            "Wie gewinne ich mehr Kunden für mein Geschäft?",
+            "Sollte ich meinen ersten Mitarbeiter einstellen?",
+            "Wie kann ich mein Unternehmen in eine neue Stadt erweitern?",
+            "Welche Strategie bringt mich auf den doppelten Umsatz?",
+        ],
+        AgentType.WEBSEARCH: [
+            "Was gibt es Neues zu den Förderprogrammen für Gründer?",
+            "Suche im Internet nach aktuellen Nachrichten zur E-Rechnung",
+            "Finde heraus, was die Konkurrenz gerade anbietet",
+        ],
+        AgentType.CONTENT: [
+            "Schreibe einen Blogartikel über meine Dienstleistung",
+            "Formuliere einen Newsletter für meine Stammkunden",
+            "Erstelle einen Instagram-Post zu unserem Sommerangebot",
+        ],
+        AgentType.SEO: [
+            "Wie komme ich bei Google weiter nach oben?",
+            "Welche Keywords sollte ich auf meiner Webseite verwenden?",
+            "Warum hat meine Seite so wenig Besucher aus der Suche?",
+        ],
+        AgentType.CODE: [
+            "Schreibe ein Python-Skript, das meine Rechnungen automatisch exportiert",
+            "Mein JavaScript wirft einen Fehler, kannst du den Bug finden?",
+            "Wie binde ich eine REST-API in meine Software ein?",
+        ],
+        AgentType.ANALYTICS: [
+            "Werte meine Verkaufszahlen der letzten Monate aus",
+            "Welche Kennzahlen sollte ich in meinem Dashboard verfolgen?",
+            "Erstelle eine Prognose für den Umsatz im nächsten Quartal",
+        ],
+        AgentType.MARKETING: [
+            "Plane eine Werbekampagne für meine Zielgruppe",
+            "Wie verbessere ich die Conversion Rate meiner Landing Page?",
+            "Wie baue ich einen Funnel für neue Leads auf?",
+        ],
+        AgentType.LEGAL: [
+            "Was muss in mein Impressum?",
+            "Brauche ich eine Datenschutzerklärung nach DSGVO?",
+            "Ist diese Klausel in meinen AGB wirksam?",
+        ],
+        AgentType.TECH: [
+            "Wie richte ich einen Server für meine Webseite ein?",
+            "Sollte ich meine Anwendung in Docker oder Kubernetes betreiben?",
+            "Welcher Cloud-Anbieter eignet sich für mein Hosting?",
+        ],
+        AgentType.SUPPORT: [
+            "Wie beantworte ich eine Kundenbeschwerde professionell?",
+            "Erstelle eine FAQ für häufige Kundenanfragen",
+            "Wie organisiere ich Support-Tickets effizient?",
+        ],
+        AgentType.HR: [
+            "Schreibe eine Stellenanzeige für eine Bürokraft",
+            "Welche Fragen stelle ich im Bewerbungsgespräch?",
+            "Wie gestalte ich das Onboarding neuer Mitarbeiter?",
+        ],
+        AgentType.TRANSLATION: [
+            "Übersetze diesen Text ins Englische",
+            "Wie lokalisiere ich meine Webseite für Frankreich?",
+            "Was heißt Kostenvoranschlag auf Englisch?",
+        ],
+        AgentType.RESEARCH: [
+            "Recherchiere gründlich den Markt für vegane Lebensmittel",
+            "Welche Studien gibt es zur Wirkung von Homeoffice?",
+            "Untersuche die Trends in meiner Branche mit Quellen",
+        ],
+        AgentType.PRODUCT: [
+            "Schreibe ein PRD für unsere neue App-Funktion",
+            "Wie priorisiere ich die Features in meiner Roadmap?",
+            "Was gehört in ein MVP für meine Produktidee?",
+        ],
+        AgentType.OPERATIONS: [
+            "Wie mache ich meine Betriebsabläufe effizienter?",
+            "Welche Prozesse in meinem Betrieb kann ich verschlanken?",
+            "Wie führe ich Lean Management im Team ein?",
+        ],
+        AgentType.LOGISTIK: [
+            "Wie optimiere ich meinen Lagerbestand?",
+            "Welcher Versanddienstleister ist für meine Pakete am günstigsten?",
+            "Mein Lieferant liefert ständig zu spät, was kann ich tun?",
+        ],
+        AgentType.SECURITY: [
+            "Wie schütze ich meine Firma vor Hackerangriffen?",
+            "Ist meine Webseite gegen die OWASP Top 10 abgesichert?",
+            "Wie verschlüssele ich die Kundendaten richtig?",
+        ],
+        AgentType.DESIGN: [
+            "Welche Farben passen zu meinem Logo?",
+            "Wie gestalte ich ein übersichtliches Layout für meine App?",
+            "Kannst du mir ein Wireframe für die Startseite skizzieren?",
+        ],
+    }
+    
+    SENTENCE_TRANSFORMER_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+    
+    # Zeichen pro Wissens-Abschnitt im Prompt
+    KNOWLEDGE_CHARS = {"tax_knowledge": 1000, "web_knowledge": 500}
+    KNOWLEDGE_SEPARATOR = "\n\n---\n\n"
+    
+    # Ab so vielen Nachrichten gilt ein Benutzer als Stammnutzer (ändert das Prompt-Präfix nur einmal)
+    REGULAR_USER_MESSAGES = 10
+    NO_KNOWLEDGE = "Keine spezifischen Informationen gefunden."
+    
+    # Einmal kompiliert, ein Durchlauf pro Nachricht
+    _agent_classifier = KeywordClassifier(AGENT_KEYWORDS, classes=list(AgentType))
 
     def __init__(
         self,
         mongo_uri: str = None,
         ollama_url: str = None,
-        model: str = "qwen2.5:32b"  # Standard: Qwen 32B (beste Deutsch-Qualität)
+        model: str = "qwen2.5:32b",  # Standard: Qwen 32B (beste Deutsch-Qualität)
+        semantic_routing: bool = None,
+        embedding_backend: str = None
     ):
         self.mongo_uri = mongo_uri or os.environ.get("MONGODB_URL", "mongodb://taskilo-mongo:27017")
-        self.ollama_url = ollama_url or os.environ.get("OLLAMA_URL", "http://ollama:11434")
+        # Mehrere GPU-Server: OLLAMA_URLS (kommagetrennt)
+        self.ollama_url = ollama_url or os.environ.get("OLLAMA_URLS") or os.environ.get("OLLAMA_URL", "http://ollama:11434")
         self.model = os.environ.get("OLLAMA_MODEL", model)
+        # Semantisches Routing (Embedding-Zentroiden statt Keywords), per SEMANTIC_ROUTING=1 aktivierbar
+        if semantic_routing is None:
+            semantic_routing = os.environ.get("SEMANTIC_ROUTING", "0") == "1"
+        self.semantic_routing = semantic_routing
+        # Embeddings: "sentence-transformers" (im Prozess) oder "ollama" (/api/embed auf der GPU, mit Cache)
+        # Achtung: die Vektorräume unterscheiden sich - beim Wechsel das Wissen neu einbetten
+        self.embedding_backend = embedding_backend or os.environ.get("EMBEDDING_BACKEND", "sentence-transformers")
         
         # MongoDB Collections
         self.db_name = "taskilo_ki"
         self._client = None
         self._db = None
         
-        # Session
-        self._session = None
-        
         # Embedding Model
         self._embedding_model = None
+        self._embedding_worker: Optional[EmbeddingWorker] = None
+        self._ollama_embedder: Optional[OllamaService] = None
+        self._semantic_router: Optional[SemanticRouter] = None
+        # Sitzung (_context_key) → Hashes der Wissens-Abschnitte, die schon im Ollama-Kontext stehen
+        self._session_snippets: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self._knowledge_index: Optional[KnowledgeIndex] = None
+        
+        # Multi-Model Router (prozessweit geteilt, siehe get_router)
+        self._router: Optional[MultiModelRouter] = None
+        
+        # Turns, deren Aufrufer vor dem Ende abgesprungen ist, werden nicht gespeichert
+        self._turn_stats = {"completed": 0, "abandoned": 0, "rejected": 0, "partial_chars_discarded": 0}
+        
+        # Schreibzugriffe außerhalb des kritischen Pfads (werden beim Schließen abgewartet)
+        self._pending_writes: Set[asyncio.Task] = set()
         
     async def __aenter__(self):
         await self._init()
@@ -341,11 +528,6 @@ WICHTIG:
         
     async def _init(self):
         """Initialisiert Verbindungen"""
-        # HTTP Session - 15 Sekunden Timeout (statt 5 Minuten!)
-        self._session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=15, connect=5)
-        )
-        
         # MongoDB
         if AsyncIOMotorClient:
             try:
@@ -358,18 +540,54 @@ WICHTIG:
             except Exception as e:
                 logger.warning(f"[MasterBrain] MongoDB Fehler: {e}")
                 
+        # Multi-Model Router - Session und Modell-Inventar bleiben über alle Turns erhalten
+        self._router = await get_router(self.ollama_url)
+        
         # Embedding Model
-        if SentenceTransformer:
+        if self.embedding_backend == "ollama" and OLLAMA_AVAILABLE:
+            self._ollama_embedder = OllamaService(pool=self._router.pool, timeout=30)
+            logger.info("[MasterBrain] Embeddings über Ollama /api/embed")
+        elif SentenceTransformer:
             try:
-                self._embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+                self._embedding_model = SentenceTransformer(self.SENTENCE_TRANSFORMER_MODEL)
+                # encode läuft im Worker-Thread, gleichzeitige Anfragen werden gebündelt
+                self._embedding_worker = EmbeddingWorker(lambda texts: self._embedding_model.encode(texts, batch_size=64))
                 logger.info("[MasterBrain] Embedding-Modell geladen")
             except Exception as e:
                 logger.warning(f"[MasterBrain] Embedding Fehler: {e}")
+        
+        # Semantischer Router - Prototypen werden einmalig im Thread eingebettet
+        if self.semantic_routing and self._has_embeddings:
+            try:
+                encode = self._sync_encoder(asyncio.get_running_loop())
+                self._semantic_router = await asyncio.to_thread(self._build_semantic_router, encode)
+            except Exception as e:
+                logger.warning(f"[MasterBrain] Semantischer Router nicht verfügbar: {e}")
+        
+        # Wissens-Index - Vektoren aus tax_knowledge/web_knowledge im Speicher, danach inkrementell.
+        # Das Laden (Scan beider Collections) läuft im Hintergrund; bis `ready` gilt die alte Mongo-Abfrage.
+        # Langlebige Instanz nutzen (get_master_brain)
+        if self._db is not None and self._has_embeddings and _numpy is not None:
+            try:
+                self._knowledge_index = KnowledgeIndex(
+                    self._db,
+                    embed=self._embed,
+                    agents=[agent.value for agent in AgentType],
+                    embedding_model=self.embedding_model_name
+                )
+                self._knowledge_index.start_background()
+            except Exception as e:
+                self._knowledge_index = None
+                logger.warning(f"[MasterBrain] Wissens-Index nicht verfügbar: {e}")
                 
     async def _close(self):
-        """Schließt Verbindungen"""
-        if self._session:
-            await self._session.close()
+        """Schließt Verbindungen (der geteilte Router bleibt offen)"""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        if self._knowledge_index:
+            await self._knowledge_index.close()
+        if self._embedding_worker:
+            await self._embedding_worker.close()
         if self._client:
             self._client.close()
             
@@ -516,29 +734,79 @@ WICHTIG:
     
     def _detect_agent(self, message: str) -> AgentType:
         """Erkennt den passenden Spezial-Agenten für die Anfrage"""
-        message_lower = message.lower()
-        
-        scores = {agent: 0 for agent in AgentType}
-        
-        for agent, keywords in self.AGENT_KEYWORDS.items():
-            for keyword in keywords:
-                if keyword in message_lower:
-                    scores[agent] += 1
-                    
-        # Höchsten Score finden
-        best_agent = max(scores, key=scores.get)
+        return self._agent_classifier.best(message, AgentType.GENERAL)
+    
+    @property
+    def _has_embeddings(self) -> bool:
+        return self._embedding_model is not None or self._ollama_embedder is not None
+    
+    @property
+    def embedding_model_name(self) -> str:
+        """Name des Modells hinter _embed (wird an gespeicherten Vektoren vermerkt)"""
+        return EMBED_MODEL if self._ollama_embedder is not None else self.SENTENCE_TRANSFORMER_MODEL
+    
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings über das konfigurierte Backend (leer, wenn keins verfügbar)"""
+        if self._ollama_embedder is not None:
+            return await self._ollama_embedder.embed(texts)
+        if self._embedding_worker is not None:
+            return await self._embedding_worker.encode(texts)
+        return []
+    
+    def _sync_encoder(self, loop: asyncio.AbstractEventLoop):
+        """Synchrone encode-Funktion für Aufrufer in Worker-Threads (z.B. SemanticRouter.build)"""
+        if self._ollama_embedder is not None:
+            return lambda texts: asyncio.run_coroutine_threadsafe(self._ollama_embedder.embed(list(texts)), loop).result()
+        return lambda texts: self._embedding_model.encode(texts, batch_size=64)
+    
+    def _build_semantic_router(self, encode) -> SemanticRouter:
+        """Baut die Zentroid-Matrizen für Agenten und Modell-Fähigkeiten"""
+        router = SemanticRouter(encode=encode)
+        router.add_table("agent", self.AGENT_PROTOTYPES)
+        router.add_table("capability", CAPABILITY_PROTOTYPES)
+        router.build()
+        return router
+    
+    def _classify(
+        self,
+        message: str,
+        query_embedding: List[float]
+    ) -> Tuple[AgentType, Optional[ModelCapability]]:
+        """
+        Erkennt Agent und Modell-Fähigkeit.
         
-        if scores[best_agent] == 0:
-            return AgentType.GENERAL
-            
-        return best_agent
+        Mit semantischem Router: ein Matrix-Vektor-Produkt auf dem ohnehin
+        berechneten Frage-Embedding. Ohne Embedding oder bei zu geringer
+        Ähnlichkeit: Keyword-Erkennung (Fähigkeit leitet dann der Router ab).
+        """
+        agent_type = None
+        capability = None
+        if self._semantic_router and query_embedding:
+            result = self._semantic_router.classify_all(query_embedding)
+            if result.get("agent"):
+                agent_type = result["agent"][0]
+            if result.get("capability"):
+                capability = result["capability"][0]
+        if agent_type is None:
+            agent_type = self._detect_agent(message)
+        return agent_type, capability
         
     async def _get_agent_context(
         self,
         agent_type: AgentType,
-        query_embedding: List[float]
+        query_embedding: List[float],
+        query_text: str = None
     ) -> str:
         """Holt relevanten Kontext für den Agenten"""
+        # Top-k der Wissensbasis (Vektor + BM25 für exakte Begriffe wie "§ 19 UStG"), gefiltert auf den Agenten
+        if self._knowledge_index is not None and self._knowledge_index.ready and (query_embedding or query_text):
+            hits = self._knowledge_index.search(query_embedding, agent=agent_type.value, query_text=query_text)
+            context_parts = [
+                f"**{hit['title'] or ('Web' if hit['collection'] == 'web_knowledge' else 'Info')}**\n{hit['content'][:self.KNOWLEDGE_CHARS.get(hit['collection'], 1000)]}"
+                for hit in hits
+            ]
+            return self.KNOWLEDGE_SEPARATOR.join(context_parts) if context_parts else self.NO_KNOWLEDGE
+        
         if self._db is None or not query_embedding:
             return ""
             
@@ -562,144 +830,393 @@ WICHTIG:
         except Exception as e:
             logger.debug(f"web_knowledge Fehler: {e}")
             
-        return "\n\n---\n\n".join(context_parts) if context_parts else "Keine spezifischen Informationen gefunden."
+        return self.KNOWLEDGE_SEPARATOR.join(context_parts) if context_parts else self.NO_KNOWLEDGE
 
     # =========================================================================
     # KERN-LOGIK - Hauptverarbeitung
     # =========================================================================
     
-    async def think(
+    async def _prepare_turn(
         self,
         user_id: str,
         session_id: str,
         message: str,
         include_history: bool = True
-    ) -> BrainResponse:
+    ) -> PreparedTurn:
         """
-        Hauptmethode: Verarbeitet eine Anfrage und gibt eine Antwort.
+        Bereitet einen Turn vor (Schritte 1-7 von think()).
         
-        1. Benutzer-Nachricht speichern
-        2. Agent erkennen
-        3. Kontext laden (Wissensbasis + Verlauf)
-        4. Mit LLM antworten
-        5. Antwort speichern
+        Unabhängige MongoDB-Zugriffe laufen parallel:
+        
+            Profil ───────────────────────────────────┐
+            Embedding → Agent → Wissensbasis ─────────┼→ Nachrichten
+            Verlauf ──────────────────────────────────┘
+            Benutzer-Nachricht speichern (Hintergrund, nach dem Profil)
         """
         start_time = datetime.now()
+        timings: Dict[str, int] = {}
+        
+        # 1./2. Profil laden; die Benutzer-Nachricht wird danach im Hintergrund gespeichert
+        # (erst nach dem Profil, weil get_user_profile neue Profile anlegt und save_message sie hochzählt)
+        profile_task = asyncio.create_task(self._timed(timings, "profile", self.get_user_profile(user_id)))
+        user_saved = self._background(self._save_user_message(profile_task, user_id, session_id, message))
         
-        # 1. Benutzer-Nachricht speichern
+        async def knowledge() -> Tuple[AgentType, Optional[ModelCapability], str]:
+            # 3. Embedding erstellen
+            query_embedding = []
+            if self._has_embeddings:
+                try:
+                    query_embedding = (await self._timed(timings, "embedding", self._embed([message])))[0]
+                except Exception as e:
+                    logger.warning(f"[MasterBrain] Embedding-Fehler: {e}")
+            
+            # 4. Agent (und ggf. Modell-Fähigkeit) erkennen
+            agent_type, capability = self._classify(message, query_embedding)
+            logger.info(f"[MasterBrain] Agent erkannt: {agent_type.value}")
+            
+            # 5. Wissensbasis-Kontext laden
+            knowledge_context = await self._timed(timings, "knowledge", self._get_agent_context(agent_type, query_embedding, message))
+            return agent_type, capability, knowledge_context
+        
+        async def history() -> List[Dict[str, str]]:
+            # 6. Konversations-Verlauf laden (aktuelle Frage gehört in den Turn-Abschnitt, nicht in den Verlauf)
+            history_messages: List[Dict[str, str]] = []
+            if not include_history:
+                return history_messages
+            history = await self._timed(timings, "history", self.load_conversation_history(user_id, session_id, limit=10))
+            if history and history[-1]["role"] == "user" and history[-1]["content"] == message:
+                history = history[:-1]
+            for msg in history[-5:]:  # Letzte 5 Nachrichten
+                role = "assistant" if msg["role"] == "assistant" else "user"
+                history_messages.append({"role": role, "content": msg["content"][:200]})
+            return history_messages
+        
+        profile, (agent_type, capability, knowledge_context), history_messages = await asyncio.gather(
+            profile_task, knowledge(), history()
+        )
+        
+        # 7. Nachrichten in Cache-freundlicher Reihenfolge bauen
+        messages = self._build_messages(profile, history_messages, knowledge_context, message)
+        timings["prepare"] = int((datetime.now() - start_time).total_seconds() * 1000)
+        
+        return PreparedTurn(
+            message=message,
+            agent_type=agent_type,
+            messages=messages,
+            knowledge_context=knowledge_context,
+            history_messages=history_messages,
+            start_time=start_time,
+            capability=capability,
+            stage_timings_ms=timings,
+            user_saved=user_saved
+        )
+    
+    @staticmethod
+    async def _timed(timings: Dict[str, int], stage: str, awaitable: Awaitable):
+        """Misst die Dauer einer Stufe in ms (auch bei Fehlern)"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = int((time.perf_counter() - started) * 1000)
+    
+    def _background(self, coro) -> asyncio.Task:
+        """Startet einen Schreibzugriff außerhalb des kritischen Pfads und hält eine Referenz bis zum Ende"""
+        task = asyncio.create_task(coro)
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+        return task
+    
+    async def _save_user_message(self, profile_task: asyncio.Task, user_id: str, session_id: str, message: str):
+        await asyncio.wait([profile_task])
         await self.save_message(
             user_id=user_id,
             session_id=session_id,
             role="user",
             content=message
         )
+    
+    def _build_messages(
+        self,
+        profile: Optional[UserProfile],
+        history_messages: List[Dict[str, str]],
+        knowledge_context: str,
+        message: str
+    ) -> List[Dict[str, str]]:
+        """
+        Baut die /api/chat-Nachrichten vom stabilsten zum flüchtigsten Teil.
         
-        # 2. Benutzerprofil laden
-        profile = await self.get_user_profile(user_id)
+        PERSONALITY steht unverändert vorne und wird nur einmal gesendet, danach
+        folgen Benutzer-Info und Verlauf; alles, was sich pro Turn ändert
+        (Wissensbasis, Frage), steht in der letzten Nachricht.
+        So bleibt das Präfix über Turns identisch und Ollama kann den KV-Cache wiederverwenden.
         
-        # 3. Agent erkennen
-        agent_type = self._detect_agent(message)
-        logger.info(f"[MasterBrain] Agent erkannt: {agent_type.value}")
+        Der Nachrichtenzähler steht nicht im Prompt (nur grob als Stammnutzer-Hinweis in der
+        Benutzer-Info), sonst wären die Nachrichten jedes Turns einmalig und der exakte
+        Generierungs-Cache des Routers träfe nie. Treffer gibt es trotzdem nur bei gleichem
+        Verlauf - in laufenden Gesprächen also v.a. ohne Verlauf (include_history=False).
+        """
+        messages = [{"role": "system", "content": self.PERSONALITY}]
         
-        # 4. Embedding erstellen
-        query_embedding = []
-        if self._embedding_model:
-            try:
-                query_embedding = self._embedding_model.encode(message).tolist()
-            except Exception as e:
-                logger.warning(f"[MasterBrain] Embedding-Fehler: {e}")
-        
-        # 5. Wissensbasis-Kontext laden
-        knowledge_context = await self._get_agent_context(agent_type, query_embedding)
-        
-        # 6. Konversations-Verlauf laden
-        history_context = ""
-        if include_history:
-            history = await self.load_conversation_history(user_id, session_id, limit=10)
-            if history:
-                history_parts = []
-                for msg in history[-5:]:  # Letzte 5 Nachrichten
-                    role = "Du" if msg["role"] == "assistant" else "Nutzer"
-                    history_parts.append(f"{role}: {msg['content'][:200]}")
-                history_context = "\n".join(history_parts)
-        
-        # 7. Benutzer-Kontext
-        user_context = ""
+        # Benutzer-Kontext (nur stabile Felder, damit das Präfix gleich bleibt)
+        turn_parts = []
         if profile:
             user_parts = []
             if profile.name:
                 user_parts.append(f"Name: {profile.name}")
             if profile.company_type:
                 user_parts.append(f"Unternehmensform: {profile.company_type}")
-            if profile.total_messages > 0:
-                user_parts.append(f"Bisherige Nachrichten: {profile.total_messages}")
+            if profile.industry:
+                user_parts.append(f"Branche: {profile.industry}")
+            if profile.total_messages >= self.REGULAR_USER_MESSAGES:
+                user_parts.append("Stammnutzer")
             user_context = ", ".join(user_parts) if user_parts else "Neuer Benutzer"
+            messages.append({"role": "system", "content": f"--- BENUTZER-INFO ---\n{user_context}"})
         
-        # 8. Vollständigen Prompt bauen
-        full_prompt = f"""{self.PERSONALITY}
-
---- BENUTZER-INFO ---
-{user_context}
-
---- VORHERIGER VERLAUF ---
-{history_context if history_context else "(Erste Nachricht in dieser Session)"}
-
---- WISSENSBASIS ---
-{knowledge_context}
-
---- AKTUELLE FRAGE ---
-{message}
-
---- DEINE ANTWORT ---
-Antworte strukturiert und hilfreich. Nutze die Informationen aus der Wissensbasis."""
-
-        # 9. LLM anfragen
-        answer = await self._query_ollama(full_prompt)
+        messages.extend(history_messages)
         
-        # 10. Antwort speichern
+        turn_parts.append(f"--- WISSENSBASIS ---\n{knowledge_context}")
+        turn_parts.append(f"--- AKTUELLE FRAGE ---\n{message}")
+        turn_parts.append("--- DEINE ANTWORT ---\nAntworte strukturiert und hilfreich. Nutze die Informationen aus der Wissensbasis.")
+        messages.append({"role": "user", "content": "\n\n".join(turn_parts)})
+        return messages
+    
+    async def _finish_turn(
+        self,
+        user_id: str,
+        session_id: str,
+        turn: PreparedTurn,
+        answer: str
+    ) -> BrainResponse:
+        """Speichert die Antwort und baut die BrainResponse"""
+        self._turn_stats["completed"] += 1
+        timings = turn.stage_timings_ms
+        timings["llm"] = int((datetime.now() - turn.start_time).total_seconds() * 1000) - timings.get("prepare", 0)
+        
+        # 10. Antwort speichern (nach der Frage, damit die Reihenfolge im Verlauf stimmt)
+        save_started = time.perf_counter()
+        if turn.user_saved is not None:
+            await turn.user_saved
         await self.save_message(
             user_id=user_id,
             session_id=session_id,
             role="assistant",
             content=answer,
-            agent_used=agent_type.value,
+            agent_used=turn.agent_type.value,
             confidence=0.85,
             sources=[]
         )
         
+        timings["save"] = int((time.perf_counter() - save_started) * 1000)
+        
         # 11. Response bauen
-        thinking_time = int((datetime.now() - start_time).total_seconds() * 1000)
+        thinking_time = int((datetime.now() - turn.start_time).total_seconds() * 1000)
+        logger.info(f"[MasterBrain] Stufen (ms): {timings} | gesamt {thinking_time}ms")
         
         return BrainResponse(
             answer=answer,
             confidence=0.85,
-            agent_used=agent_type.value,
+            agent_used=turn.agent_type.value,
             sources=[],
             thinking_time_ms=thinking_time,
-            context_used=bool(knowledge_context),
-            memory_used=bool(history_context)
+            context_used=bool(turn.knowledge_context),
+            memory_used=bool(turn.history_messages),
+            stage_timings_ms=dict(timings)
+        )
+    
+    async def think(
+        self,
+        user_id: str,
+        session_id: str,
+        message: str,
+        include_history: bool = True
+    ) -> BrainResponse:
+        """
+        Hauptmethode: Verarbeitet eine Anfrage und gibt eine Antwort.
+        
+        1. Benutzer-Nachricht speichern
+        2. Agent erkennen
+        3. Kontext laden (Wissensbasis + Verlauf)
+        4. Mit LLM antworten
+        5. Antwort speichern
+        """
+        turn = await self._prepare_turn(user_id, session_id, message, include_history)
+        
+        # 9. LLM anfragen (Abbruch des Aufrufers bricht die Generierung auf der GPU ab)
+        try:
+            answer = await self._query_ollama(turn.messages, hint=self._routing_hint(turn), session_id=self._context_key(user_id, session_id), continuation=self._continuation_prompt(turn, self._context_key(user_id, session_id)))
+        except asyncio.CancelledError:
+            self._record_abandoned(session_id, "")
+            raise
+        except SchedulerRejected as e:
+            return self._busy_response(turn, e)
+        
+        return await self._finish_turn(user_id, session_id, turn, answer)
+    
+    async def think_stream(
+        self,
+        user_id: str,
+        session_id: str,
+        message: str,
+        include_history: bool = True
+    ) -> AsyncIterator[Union[str, BrainResponse]]:
+        """
+        Streaming-Variante von think().
+        
+        Liefert die Antwort Token für Token als str, zum Schluss die
+        BrainResponse. Gespeichert wird die Antwort erst, wenn sie vollständig ist.
+        """
+        turn = await self._prepare_turn(user_id, session_id, message, include_history)
+        
+        if self._router is None:
+            self._router = await get_router(self.ollama_url)
+        
+        answer = ""
+        partial: List[str] = []
+        rejected: Optional[SchedulerRejected] = None
+        chunks = self._router.chat_stream(
+            messages=turn.messages,
+            max_tokens=None,
+            temperature=0.3,
+            hint=self._routing_hint(turn),
+            session_id=self._context_key(user_id, session_id),
+            continuation=self._continuation_prompt(turn, self._context_key(user_id, session_id))
+        )
+        try:
+            async for chunk in chunks:
+                if chunk.content:
+                    partial.append(chunk.content)
+                    yield chunk.content
+                if chunk.done:
+                    answer = chunk.response.content
+                    self._log_router_response(chunk.response)
+        except (GeneratorExit, asyncio.CancelledError):
+            # Client hat die Verbindung getrennt: Teilantwort verwerfen statt speichern
+            self._record_abandoned(session_id, "".join(partial))
+            raise
+        except SchedulerRejected as e:
+            # Abgelehnt wird vor dem ersten Token (Deadline der GPU-Warteschlange)
+            rejected = e
+        except Exception as e:
+            logger.error(f"[MasterBrain] Router Fehler: {e}")
+            raise
+        finally:
+            # Schließt den Router-Stream sofort; ohne weitere Abnehmer bricht er die Generierung ab
+            await chunks.aclose()
+        
+        if rejected is not None:
+            busy = self._busy_response(turn, rejected)
+            yield busy.answer
+            yield busy
+            return
+        
+        yield await self._finish_turn(user_id, session_id, turn, answer)
+    
+    def _busy_response(self, turn: PreparedTurn, error: SchedulerRejected) -> BrainResponse:
+        """Klare "später erneut"-Antwort statt Router-Fehler; wird nicht als Antwort im Verlauf gespeichert"""
+        self._turn_stats["rejected"] += 1
+        logger.warning(f"[MasterBrain] Anfrage abgelehnt: {error}")
+        retry_after_s = max(1, round(error.projected_wait_s))
+        return BrainResponse(
+            answer=self.BUSY_ANSWER.format(seconds=retry_after_s),
+            confidence=0.0,
+            agent_used=turn.agent_type.value,
+            sources=[],
+            thinking_time_ms=int((datetime.now() - turn.start_time).total_seconds() * 1000),
+            context_used=False,
+            memory_used=False,
+            stage_timings_ms=dict(turn.stage_timings_ms),
+            retry_after_s=retry_after_s
         )
+    
+    def _record_abandoned(self, session_id: str, partial: str) -> None:
+        self._turn_stats["abandoned"] += 1
+        self._turn_stats["partial_chars_discarded"] += len(partial)
+        logger.info(f"[MasterBrain] Turn in {session_id} abgebrochen, Antwort verworfen ({len(partial)} Zeichen generiert)")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "turns": dict(self._turn_stats),
+            "router": self._router.get_stats() if self._router else None,
+            "embedding_worker": self._embedding_worker.get_stats() if self._embedding_worker else None,
+            "knowledge_index": self._knowledge_index.get_stats() if self._knowledge_index else None,
+        }
         
-    async def _query_ollama(self, prompt: str, force_model: str = None) -> str:
+    @classmethod
+    def _context_key(cls, user_id: str, session_id: str) -> Optional[str]:
+        """
+        Schlüssel für Ollamas Sitzungs-Kontext im Router (None = immer voller Prompt).
+        
+        Die Kontext-Token enthalten Fragen und Antworten im Klartext; Sitzungs-IDs
+        sind nur pro Benutzer eindeutig, und Platzhalter wie "default" teilen sich alle.
+        """
+        if not user_id or not session_id or user_id in cls.SHARED_USER_IDS or session_id in cls.SHARED_SESSION_IDS:
+            return None
+        return f"{user_id}:{session_id}"
+        
+    def _continuation_prompt(self, turn: PreparedTurn, context_key: Optional[str]) -> str:
+        """
+        Prompt für fortgesetzte Sitzungen: die Frage plus nur die Wissens-Abschnitte,
+        die noch nicht im Kontext der Sitzung stehen (der Zähler entfällt).
+        
+        Beginnt der Router die Sitzung mit vollem Prompt, stehen dort ohnehin alle
+        Abschnitte dieses Turns - sie gelten deshalb in beiden Fällen als gesendet.
+        """
+        snippets = [
+            part for part in turn.knowledge_context.split(self.KNOWLEDGE_SEPARATOR)
+            if part.strip() and part != self.NO_KNOWLEDGE
+        ]
+        new_snippets = snippets
+        if context_key is not None:
+            seen = self._session_snippets.pop(context_key, set())
+            new_snippets = []
+            for part in snippets:
+                digest = hashlib.sha1(part.encode("utf-8")).hexdigest()
+                if digest not in seen:
+                    seen.add(digest)
+                    new_snippets.append(part)
+            self._session_snippets[context_key] = seen
+            while len(self._session_snippets) > SESSION_CONTEXT_MAX_SESSIONS:
+                self._session_snippets.popitem(last=False)
+        
+        parts = []
+        if new_snippets:
+            parts.append(f"--- WISSENSBASIS (NEU) ---\n{self.KNOWLEDGE_SEPARATOR.join(new_snippets)}")
+        parts.append(f"--- AKTUELLE FRAGE ---\n{turn.message}")
+        parts.append("--- DEINE ANTWORT ---\nAntworte strukturiert und hilfreich."
+                     + (" Nutze die Informationen aus der Wissensbasis." if snippets else ""))
+        return "\n\n".join(parts)
+        
+    def _routing_hint(self, turn: PreparedTurn) -> RoutingHint:
+        """Router klassifiziert die Nutzerfrage und den erkannten Agenten, nicht den Mega-Prompt"""
+        return RoutingHint(text=turn.message, agent=turn.agent_type.value, capability=turn.capability)
+        
+    def _log_router_response(self, response) -> None:
+        logger.info(f"[MasterBrain] Router: {response.model_used} | {response.capability_matched.value}/{response.complexity.value} | {response.tokens_per_second}t/s | prompt_eval={response.prompt_tokens} (gespart {response.prompt_tokens_saved}) | ttft={response.ttft_ms}ms | pfad={response.path}{' (hedged)' if response.hedged else ''}")
+        
+    async def _query_ollama(self, messages: List[Dict[str, str]], force_model: str = None, hint: RoutingHint = None, session_id: str = None, continuation: str = None) -> str:
         """
         Multi-Model Router fuer automatische Modell-Auswahl.
         Waehlt automatisch das beste Modell basierend auf Aufgabe.
+        Mit session_id (siehe _context_key) setzt der Router die Sitzung über Ollamas Kontext-Token fort.
         """
+        if self._router is None:
+            self._router = await get_router(self.ollama_url)
         try:
-            async with MultiModelRouter(
-                ollama_url=self.ollama_url,
-                prefer_quality=True,
-                fallback_model="mistral:7b"
-            ) as router:
-                response = await router.generate(
-                    prompt=prompt,
-                    system=self.PERSONALITY,
-                    force_model=force_model,
-                    max_tokens=4096,
-                    temperature=0.3
-                )
-                logger.info(f"[MasterBrain] Router: {response.model_used} | {response.capability_matched.value}/{response.complexity.value} | {response.tokens_per_second}t/s")
-                return response.content
+            response = await self._router.chat(
+                messages=messages,
+                force_model=force_model,
+                max_tokens=None,  # Budget nach Agent und Komplexität (siehe MultiModelRouter._output_budget)
+                temperature=0.3,
+                hint=hint,
+                session_id=session_id,
+                continuation=continuation
+            )
+            self._log_router_response(response)
+            return response.content
+        except SchedulerRejected:
+            # Kein Fehler des Routers: think() macht daraus eine "später erneut"-Antwort
+            raise
         except Exception as e:
             logger.error(f"[MasterBrain] Router Fehler: {e}")
             raise
@@ -710,7 +1227,9 @@ Antworte strukturiert und hilfreich. Nutze die Informationen aus der Wissensbasi
             async with OllamaService(
                 base_url=self.ollama_url,
                 model=model,
-                timeout=90
+                timeout=90,
+                # Dieselben Hosts und GPU-Warteschlangen wie der Router
+                pool=self._router.pool if self._router else None
             ) as ollama:
                 response = await ollama.generate(
                     prompt=prompt,
@@ -743,13 +1262,45 @@ Antworte strukturiert und hilfreich. Nutze die Informationen aus der Wissensbasi
             message=message
         )
         
+        return self._response_to_dict(response)
+    
+    async def chat_stream(
+        self,
+        message: str,
+        user_id: str = "anonymous",
+        session_id: str = "default"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        API-kompatible Streaming-Chat-Methode (z.B. für SSE-Endpoints).
+        
+        Liefert {"type": "token", "content": ...} pro Teilstück und zum
+        Schluss {"type": "done", ...} mit denselben Feldern wie chat().
+        """
+        items = self.think_stream(
+            user_id=user_id,
+            session_id=session_id,
+            message=message
+        )
+        try:
+            async for item in items:
+                if isinstance(item, BrainResponse):
+                    yield {"type": "done", **self._response_to_dict(item)}
+                else:
+                    yield {"type": "token", "content": item}
+        finally:
+            # SSE-Verbindung getrennt: Abbruch bis zur GPU durchreichen
+            await items.aclose()
+    
+    def _response_to_dict(self, response: BrainResponse) -> Dict[str, Any]:
         return {
             "message": response.answer,
             "confidence": response.confidence,
             "agent": response.agent_used,
             "sources": response.sources,
             "thinking_time_ms": response.thinking_time_ms,
+            "stage_timings_ms": response.stage_timings_ms,
             "memory_used": response.memory_used,
+            "retry_after_s": response.retry_after_s,
             "source": "master_brain"
         }
         
@@ -799,9 +1350,14 @@ async def chat_with_brain(
     user_id: str = "demo",
     session_id: str = "default"
 ) -> Dict[str, Any]:
-    """Convenience-Funktion für schnelle Chats"""
-    async with MasterBrain() as brain:
-        return await brain.chat(message, user_id, session_id)
+    """
+    Convenience-Funktion für schnelle Chats.
+    
+    Nutzt die prozessweite Instanz: eine eigene MasterBrain pro Aufruf würde jedes
+    Mal den Wissens-Index neu laden (beide Collections lesen, fehlende Vektoren einbetten).
+    """
+    brain = await get_master_brain()
+    return await brain.chat(message, user_id, session_id)
 
 
 # ==============================================================================
@@ -838,4 +1394,37 @@ if __name__ == "__main__":
             print(f"Gesamt Nachrichten: {summary['total_messages']}")
             print(f"Themen: {summary['topics_discussed']}")
             
+            # Test 4: prompt_eval_count alt (PERSONALITY doppelt, /api/generate) vs. neu (/api/chat).
+            # Temperatur knapp über CACHE_MAX_TEMPERATURE, sonst käme Lauf 2 aus dem Generierungs-Cache
+            print("\nTest 4: Prompt-Eval-Messung")
+            uncached = CACHE_MAX_TEMPERATURE + 0.05
+            question = "Wie hoch ist der Grundfreibetrag 2025?"
+            hint = RoutingHint(text=question, agent=AgentType.STEUER.value)
+            turn = await brain._prepare_turn("test-user", "test-session", question)
+            legacy = await brain._router.generate(
+                prompt=f"{brain.PERSONALITY}\n\n{turn.messages[-1]['content']}",
+                system=brain.PERSONALITY,
+                temperature=uncached,
+                hint=hint
+            )
+            print(f"prompt_eval_count vorher: {legacy.prompt_tokens} ({legacy.model_used})")
+            for run in (1, 2):
+                current = await brain._router.chat(turn.messages, force_model=legacy.model_used, temperature=uncached, hint=hint)
+                print(f"prompt_eval_count nachher (Lauf {run}): {current.prompt_tokens}")
+            
+            # Test 5: Smalltalk landet beim semantischen Router bei GENERAL
+            print("\nTest 5: Semantisches Agent-Routing")
+            if brain._semantic_router is None:
+                print("Übersprungen (kein Embedding-Backend)")
+            else:
+                for text, expected in (
+                    ("Hi, wie läuft's bei dir?", AgentType.GENERAL),
+                    ("Vielen Dank für deine Hilfe!", AgentType.GENERAL),
+                    ("Was darf ich vom Finanzamt zurückholen?", AgentType.STEUER),
+                ):
+                    embedding = (await brain._embed([text]))[0]
+                    agent_type, _ = brain._classify(text, embedding)
+                    assert agent_type is expected, f"{text!r} → {agent_type}"
+                    print(f"{text!r} → {agent_type.value} ✓")
+            
     asyncio.run(test())
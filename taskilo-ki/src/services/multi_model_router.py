@@ -5,12 +5,34 @@ import os
 import asyncio
 import aiohttp
 import logging
-from typing import Dict, Any, Optional, List, Tuple
-from dataclasses import dataclass
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Any, Optional, List, Tuple, AsyncIterator
+from dataclasses import dataclass, field
 from enum import Enum
 
+from services.ollama_service import OllamaService, close_http_session, get_http_session, iter_ndjson, keep_alive_for, WARMUP_MODELS
+from services.keyword_classifier import KeywordClassifier
+from services.ollama_scheduler import ModelScheduler, Priority, SchedulerRejected
+from services.ollama_pool import OllamaHost, OllamaPool
+from services.generation_cache import GenerationCache
+from services.session_context import SessionContextStore
+
 logger = logging.getLogger(__name__)
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://ollama:11434")
+INVENTORY_TTL = float(os.environ.get("OLLAMA_INVENTORY_TTL", "300"))
+RESIDENCY_TTL = float(os.environ.get("OLLAMA_RESIDENCY_TTL", "15"))
+VRAM_GB = float(os.environ.get("OLLAMA_VRAM_GB", "20"))
+NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+QUEUE_DEADLINE = float(os.environ.get("OLLAMA_QUEUE_DEADLINE", "45"))
+# Hedging: kommt innerhalb dieses Budgets kein erstes Token, startet parallel ein schnelles Modell (0 = aus)
+HEDGE_AFTER_MS = float(os.environ.get("OLLAMA_HEDGE_AFTER_MS", "0"))
+HEDGE_MODELS = ("mistral:7b", "llama3.1:8b")
+# Ausgabe-Budget bei max_tokens=None: p95 der beobachteten Antwortlängen pro Agent × Faktor
+OUTPUT_BUDGET_FACTOR = float(os.environ.get("OLLAMA_OUTPUT_BUDGET_FACTOR", "1.5"))
+OUTPUT_BUDGET_MIN = 256
+OUTPUT_BUDGET_MAX = int(os.environ.get("OLLAMA_OUTPUT_BUDGET_MAX", "4096"))
+OUTPUT_BUDGET_SAMPLES = 20  # darunter gelten die Standardwerte
 
 class ModelCapability(str, Enum):
     GENERAL = "general"
@@ -28,6 +50,21 @@ class TaskComplexity(str, Enum):
     COMPLEX = "complex"
     EXPERT = "expert"
 
+# Start-Budgets (Token), bis genug Antwortlängen beobachtet sind
+COMPLEXITY_BUDGETS: Dict[TaskComplexity, int] = {
+    TaskComplexity.SIMPLE: 512,
+    TaskComplexity.MEDIUM: 1024,
+    TaskComplexity.COMPLEX: 2048,
+    TaskComplexity.EXPERT: 3072,
+}
+CAPABILITY_BUDGET_FACTORS: Dict[ModelCapability, float] = {
+    ModelCapability.CREATIVE: 2.0,  # Blog-Artikel, Texte
+    ModelCapability.CODE: 1.5,
+    ModelCapability.FAST: 0.5,
+}
+# Beginnt das Modell, selbst den nächsten Turn unserer Prompts zu schreiben, ist die Antwort fertig
+STOP_SEQUENCES = ["\nBenutzer:", "--- AKTUELLE FRAGE ---"]
+
 @dataclass
 class ModelConfig:
     name: str
@@ -37,17 +74,18 @@ class ModelConfig:
     tokens_per_sec: float
     quality_score: float
     context_length: int
+    max_parallel: int = 4
 
 MODELS: Dict[str, ModelConfig] = {
     "llama3.3:70b-instruct-q4_K_M": ModelConfig(
         name="llama3.3:70b-instruct-q4_K_M", size_gb=42.0,
         capabilities=[ModelCapability.GENERAL, ModelCapability.REASONING, ModelCapability.GERMAN, ModelCapability.LEGAL, ModelCapability.CREATIVE, ModelCapability.MATH],
-        complexity_level=TaskComplexity.EXPERT, tokens_per_sec=25, quality_score=0.95, context_length=131072
+        complexity_level=TaskComplexity.EXPERT, tokens_per_sec=25, quality_score=0.95, context_length=131072, max_parallel=1
     ),
     "qwen2.5:32b": ModelConfig(
         name="qwen2.5:32b", size_gb=19.0,
         capabilities=[ModelCapability.GENERAL, ModelCapability.CODE, ModelCapability.GERMAN, ModelCapability.MATH, ModelCapability.REASONING],
-        complexity_level=TaskComplexity.COMPLEX, tokens_per_sec=40, quality_score=0.90, context_length=131072
+        complexity_level=TaskComplexity.COMPLEX, tokens_per_sec=40, quality_score=0.90, context_length=131072, max_parallel=2
     ),
     "phi3:14b": ModelConfig(
         name="phi3:14b", size_gb=7.9,
@@ -85,6 +123,38 @@ TASK_KEYWORDS = {
     ModelCapability.REASONING: ["analysier", "erkläre", "warum", "vergleich", "zusammenfassung", "strategie", "businessplan"],
 }
 
+COMPLEXITY_KEYWORDS = ["analysier", "erkläre ausführlich", "vergleich", "strategie", "businessplan", "detailliert"]
+
+# Einmal kompiliert, ein Durchlauf pro Anfrage
+_TASK_CLASSIFIER = KeywordClassifier(TASK_KEYWORDS, classes=list(ModelCapability))
+_COMPLEXITY_CLASSIFIER = KeywordClassifier({TaskComplexity.COMPLEX: COMPLEXITY_KEYWORDS})
+
+# Agent (MasterBrain AgentType.value) → bevorzugte Fähigkeit; fehlende Agenten routen per Keywords
+AGENT_CAPABILITIES: Dict[str, ModelCapability] = {
+    "steuer": ModelCapability.GERMAN,
+    "translation": ModelCapability.GERMAN,
+    "finanz": ModelCapability.MATH,
+    "analytics": ModelCapability.MATH,
+    "legal": ModelCapability.LEGAL,
+    "code": ModelCapability.CODE,
+    "tech": ModelCapability.CODE,
+    "content": ModelCapability.CREATIVE,
+    "marketing": ModelCapability.CREATIVE,
+    "seo": ModelCapability.CREATIVE,
+    "risiko": ModelCapability.REASONING,
+    "research": ModelCapability.REASONING,
+    "product": ModelCapability.REASONING,
+    "operations": ModelCapability.REASONING,
+}
+
+@dataclass
+class RoutingHint:
+    """Routing-Information getrennt vom Prompt: klassifiziert wird die Nutzerfrage, nicht der zusammengesetzte Prompt."""
+    text: Optional[str] = None
+    agent: Optional[str] = None
+    capability: Optional[ModelCapability] = None
+    complexity: Optional[TaskComplexity] = None
+
 @dataclass
 class RouterResponse:
     content: str
@@ -94,53 +164,250 @@ class RouterResponse:
     tokens_per_second: float
     total_tokens: int
     reasoning: str
+    prompt_tokens: int = 0
+    ttft_ms: int = 0
+    queue_ms: int = 0
+    hedged: bool = False
+    path: str = "primary"
+    cached: bool = False
+    done_reason: str = ""
+    # Ollama-Kontext-Token (nur /api/generate) und durch Sitzungs-Fortsetzung gesparte Prompt-Token
+    context: Optional[List[int]] = field(default=None, repr=False)
+    prompt_tokens_saved: int = 0
+
+@dataclass
+class ModelStats:
+    """Live-Messwerte pro Modell (EWMA über echte Antworten)."""
+    tokens_per_sec: float = 0.0
+    ttft_ms: float = 0.0  # ohne Ladezeit: Wartezeit + Prompt-Auswertung bei geladenem Modell
+    load_ms: float = 0.0
+    samples: int = 0
+
+    def update(self, tokens_per_sec: float, ttft_ms: float, load_ms: float, alpha: float):
+        ttft_ms = max(ttft_ms - load_ms, 0.0)
+        if self.samples == 0:
+            self.tokens_per_sec, self.ttft_ms, self.load_ms = tokens_per_sec, ttft_ms, load_ms
+        else:
+            if tokens_per_sec > 0:
+                self.tokens_per_sec += alpha * (tokens_per_sec - self.tokens_per_sec)
+            self.ttft_ms += alpha * (ttft_ms - self.ttft_ms)
+            self.load_ms += alpha * (load_ms - self.load_ms)
+        self.samples += 1
+
+@dataclass
+class RouterChunk:
+    content: str
+    done: bool
+    model_used: str
+    response: Optional[RouterResponse] = None
+
+@dataclass
+class BatchResult:
+    index: int
+    model: str
+    response: Optional[RouterResponse] = None
+    error: Optional[str] = None
+    
+    @property
+    def ok(self) -> bool:
+        return self.response is not None
+
+class _Flight:
+    """Eine laufende Generierung, an die sich identische Anfragen anhängen (Single-Flight)."""
+    def __init__(self, detach: Callable[[], None] = None):
+        self.chunks: List[RouterChunk] = []
+        self.finished = False
+        self.abandoned = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._detach = detach
+        self._changed = asyncio.Event()
+    
+    def push(self, chunk: RouterChunk):
+        self.chunks.append(chunk)
+        self._notify()
+    
+    def finish(self, error: BaseException = None):
+        self.finished, self.error = True, error
+        self._notify()
+    
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    async def follow(self) -> AsyncIterator[RouterChunk]:
+        # Späte Abonnenten bekommen zuerst die komplette bisherige Chunk-Historie
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                    yield chunk
+                    if chunk.done:
+                        return
+                if self.finished:
+                    if isinstance(self.error, asyncio.CancelledError):
+                        # Der Abbruch gilt dem Pump-Task, nicht diesem Abnehmer
+                        raise Exception("Ollama Error: Generierung abgebrochen")
+                    if self.error is not None:
+                        raise self.error
+                    raise Exception("Ollama Error: Stream ohne Abschluss beendet")
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            # Niemand hört mehr zu: GPU-Arbeit abbrechen. Vorher austragen, damit ein
+            # sofortiger Retry nicht an die sterbende Generierung anhängt
+            if self.subscribers == 0 and not self.finished and self.task is not None:
+                self.abandoned = True
+                if self._detach is not None:
+                    self._detach()
+                self.task.cancel()
 
 class MultiModelRouter:
-    def __init__(self, ollama_url: str = None, prefer_quality: bool = True, fallback_model: str = "mistral:7b"):
-        self.ollama_url = ollama_url or OLLAMA_URL
+    def __init__(self, ollama_url: Any = None, prefer_quality: bool = True, fallback_model: str = "mistral:7b", inventory_ttl: float = None, request_timeout: float = 120, stats_alpha: float = 0.2, startup_penalty_ms: float = 20000, vram_gb: float = None, residency_tolerance: float = 0.05, residency_ttl: float = None, queue_deadline_s: float = None, hedge_after_ms: float = None, hedge_models: Tuple[str, ...] = HEDGE_MODELS, cache: GenerationCache = None, session_contexts: SessionContextStore = None):
         self.prefer_quality = prefer_quality
         self.fallback_model = fallback_model
-        self._session = None
+        self.inventory_ttl = inventory_ttl if inventory_ttl is not None else INVENTORY_TTL
+        self.request_timeout = request_timeout
         self._available_models: List[str] = []
+        self._inventory_loaded_at: float = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.stats_alpha = stats_alpha
+        self.startup_penalty_ms = startup_penalty_ms
+        self._stats: Dict[str, ModelStats] = {}
+        # VRAM-Budget pro GPU-Server; Residenz und Scheduler führt der Pool pro Host
+        self.vram_gb = vram_gb if vram_gb is not None else VRAM_GB
+        self.residency_tolerance = residency_tolerance
+        self.residency_ttl = residency_ttl if residency_ttl is not None else RESIDENCY_TTL
+        self._selection_swaps_avoided = 0
+        # Interaktive Anfragen werden abgelehnt, wenn die Warteschlange länger als die Deadline bräuchte
+        self.queue_deadline_s = queue_deadline_s if queue_deadline_s is not None else QUEUE_DEADLINE
+        # ollama_url: eine URL, kommagetrennte URLs oder Liste (Standard: OLLAMA_URLS/OLLAMA_URL)
+        self._pool = OllamaPool(ollama_url, scheduler_factory=self._make_scheduler)
+        self.ollama_url = self._pool.primary.url
+        self.hedge_after_ms = hedge_after_ms if hedge_after_ms is not None else HEDGE_AFTER_MS
+        self.hedge_models = hedge_models
+        self._hedge_stats = {"launched": 0, "primary_won": 0, "hedge_won": 0, "cascaded": 0}
+        self._cache = cache if cache is not None else GenerationCache()
+        self._flights: Dict[str, _Flight] = {}
+        self._flight_stats = {"started": 0, "joined": 0, "abandoned": 0}
+        self._contexts = session_contexts if session_contexts is not None else SessionContextStore()
+        # Beobachtete Antwortlängen (Token) pro Agent bzw. Fähigkeit
+        self._output_lengths: Dict[str, Deque[int]] = {}
+        self._budget_stats = {"auto": 0, "truncated": 0}
+        self._warmup_report: List[Dict[str, Any]] = []
+        self._warmup_task: Optional[asyncio.Task] = None
     
     async def __aenter__(self):
-        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120))
-        await self._load_available_models()
-        return self
+        return await self.start()
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self._session:
-            await self._session.close()
+        await self.close()
     
-    async def _load_available_models(self):
-        try:
-            async with self._session.get(f"{self.ollama_url}/api/tags") as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    self._available_models = [m["name"] for m in data.get("models", [])]
-                    logger.info(f"[Router] {len(self._available_models)} Modelle verfügbar")
-        except Exception as e:
-            logger.warning(f"[Router] Modelle laden fehlgeschlagen: {e}")
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        # Geteilter Connection-Pool mit OllamaService; Timeouts werden pro Request gesetzt
+        return get_http_session()
+    
+    async def start(self) -> "MultiModelRouter":
+        """Öffnet die Session, lädt das Modell-Inventar einmalig und startet den Hintergrund-Refresh."""
+        self._ensure_session()
+        if not self._inventory_loaded_at:
+            await self._load_available_models()
+            await self._load_resident_models()
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+        return self
+    
+    async def warm_up(self, models: List[str] = None) -> List[Dict[str, Any]]:
+        """Lädt Modelle vorab auf allen Hosts (Standard: OLLAMA_WARMUP_MODELS) und misst die Ladezeiten."""
+        await self.start()
+        requested = WARMUP_MODELS if models is None else models
+        models = [m for m in requested if m in self._available_models]
+        for missing in set(requested) - set(models):
+            logger.warning(f"[Router] Warm-up übersprungen, {missing} nicht installiert")
+        report = await OllamaService(pool=self._pool).warm_up(models)
+        for result in report:
+            if result["ok"]:
+                host = next(h for h in self._pool.hosts if h.url == result["host"])
+                host.mark_resident(result["model"], self._model_size(result["model"]), self.vram_gb)
+                stats = self._stats.setdefault(result["model"], ModelStats())
+                stats.load_ms = float(result["load_ms"])
+        self._warmup_report = report
+        return report
+    
+    def start_warm_up(self, models: List[str] = None) -> asyncio.Task:
+        """Warm-up im Hintergrund, damit der Dienststart nicht auf das Laden der Gewichte wartet."""
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.create_task(self.warm_up(models))
+        return self._warmup_task
+    
+    async def close(self):
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+    
+    async def _refresh_loop(self):
+        # Inventar und VRAM-Residenz werden außerhalb des Request-Pfads aktualisiert, damit jeder Turn genau einen Request kostet
+        while True:
+            await asyncio.sleep(min(self.residency_ttl, self.inventory_ttl))
+            if not self._inventory_loaded_at or time.monotonic() - self._inventory_loaded_at >= self.inventory_ttl:
+                await self._load_available_models()
+            await self._load_resident_models()
+    
+    async def _load_resident_models(self) -> bool:
+        # /api/ps aller Hosts, zugleich Health-Check: ausgefallene Hosts fallen aus dem Inventar
+        loaded = await self._pool.refresh_residency(self._ensure_session())
+        self._available_models = self._pool.available_models() or self._available_models
+        return loaded
+    
+    def is_resident(self, model: str) -> bool:
+        return self._pool.is_resident(model)
+    
+    def _model_size(self, model: str) -> float:
+        if model in MODELS:
+            return MODELS[model].size_gb
+        return max((host.resident.get(model, 0.0) for host in self._pool.hosts), default=0.0)
+    
+    def _model_limit(self, model: str) -> int:
+        return MODELS[model].max_parallel if model in MODELS else NUM_PARALLEL
+    
+    def _make_scheduler(self, host: OllamaHost) -> ModelScheduler:
+        return ModelScheduler(max_active=NUM_PARALLEL, vram_gb=self.vram_gb, model_size=self._model_size, is_resident=host.is_resident, model_limit=self._model_limit)
+    
+    @property
+    def pool(self) -> OllamaPool:
+        return self._pool
+    
+    async def _load_available_models(self) -> bool:
+        if await self._pool.refresh_inventory(self._ensure_session()):
+            self._available_models = self._pool.available_models()
+            self._inventory_loaded_at = time.monotonic()
+            logger.info(f"[Router] {len(self._available_models)} Modelle verfügbar auf {len(self._pool.hosts)} Host(s)")
+            return True
+        logger.warning("[Router] Modelle laden fehlgeschlagen: kein Host erreichbar")
+        # Bekanntes Inventar bei temporären Fehlern behalten
+        if not self._available_models:
             self._available_models = [self.fallback_model]
+        return False
     
     def _detect_task(self, message: str) -> Tuple[ModelCapability, TaskComplexity]:
-        message_lower = message.lower()
-        capability_scores = {cap: 0 for cap in ModelCapability}
-        for capability, keywords in TASK_KEYWORDS.items():
-            for keyword in keywords:
-                if keyword in message_lower:
-                    capability_scores[capability] += 1
-        best_capability = max(capability_scores, key=capability_scores.get)
-        if capability_scores[best_capability] == 0:
-            best_capability = ModelCapability.GENERAL
+        best_capability = _TASK_CLASSIFIER.best(message, ModelCapability.GENERAL)
         complexity = TaskComplexity.SIMPLE
         if len(message) > 500:
             complexity = TaskComplexity.COMPLEX
         elif len(message) > 200:
             complexity = TaskComplexity.MEDIUM
-        for kw in ["analysier", "erkläre ausführlich", "vergleich", "strategie", "businessplan", "detailliert"]:
-            if kw in message_lower:
-                complexity = TaskComplexity.COMPLEX if complexity != TaskComplexity.EXPERT else complexity
+        if _COMPLEXITY_CLASSIFIER.matches(message):
+            complexity = TaskComplexity.COMPLEX
         return best_capability, complexity
     
     def _select_model(self, capability: ModelCapability, complexity: TaskComplexity) -> Tuple[str, str]:
@@ -159,53 +426,437 @@ class MultiModelRouter:
         if not candidates:
             return self.fallback_model, "Fallback"
         if self.prefer_quality and complexity in [TaskComplexity.COMPLEX, TaskComplexity.EXPERT]:
-            candidates.sort(key=lambda x: x[1].quality_score, reverse=True)
+            candidates.sort(key=lambda x: (x[1].quality_score, self._speed_score(x[0])), reverse=True)
         else:
-            candidates.sort(key=lambda x: x[1].quality_score * 0.5 + (x[1].tokens_per_sec / 120) * 0.5, reverse=True)
+            candidates.sort(key=lambda x: x[1].quality_score * 0.5 + self._speed_score(x[0]) * 0.5, reverse=True)
         best = candidates[0]
-        return best[0], f"{capability.value}/{complexity.value} → {best[0]} (Q:{best[1].quality_score:.0%})"
+        note = ""
+        if not self.is_resident(best[0]):
+            # Geladenes Modell mit kaum schlechterer Qualität schlägt einen Modellwechsel auf der GPU
+            resident = next((c for c in candidates if self.is_resident(c[0]) and best[1].quality_score - c[1].quality_score <= self.residency_tolerance), None)
+            if resident is not None:
+                self._selection_swaps_avoided += 1
+                note = f", resident statt {best[0]}"
+                best = resident
+        return best[0], f"{capability.value}/{complexity.value} → {best[0]} (Q:{best[1].quality_score:.0%}, {self._tokens_per_sec(best[0]):.0f}t/s{note})"
     
-    async def generate(self, prompt: str, system: str = None, force_model: str = None, max_tokens: int = 2048, temperature: float = 0.3) -> RouterResponse:
-        if not self._session:
-            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120))
-            await self._load_available_models()
-        capability, complexity = self._detect_task(prompt)
+    def _tokens_per_sec(self, model: str) -> float:
+        stats = self._stats.get(model)
+        if stats and stats.tokens_per_sec > 0:
+            return stats.tokens_per_sec
+        return MODELS[model].tokens_per_sec if model in MODELS else 0.0
+    
+    def _speed_score(self, model: str) -> float:
+        # Gemessener Durchsatz statt Katalogwert; Zeit bis zum ersten Token wird abgezogen.
+        # Die Ladezeit nur, wenn das Modell laut /api/ps nicht im VRAM liegt - sonst hinge
+        # ein einziger Kaltstart von Platte dauerhaft am Modell
+        score = min(self._tokens_per_sec(model) / 120, 1.0)
+        stats = self._stats.get(model)
+        if stats and stats.samples:
+            startup_ms = stats.ttft_ms + (0.0 if self.is_resident(model) else stats.load_ms)
+            score -= min(startup_ms / self.startup_penalty_ms, 0.5)
+        return score
+    
+    def _record_stats(self, model: str, data: Dict[str, Any], ttft_ms: float) -> float:
+        eval_duration = data.get("eval_duration", 0) / 1_000_000
+        eval_count = data.get("eval_count", 0)
+        tokens_per_sec = (eval_count / (eval_duration / 1000)) if eval_duration > 0 else 0
+        load_ms = data.get("load_duration", 0) / 1_000_000
+        self._stats.setdefault(model, ModelStats()).update(tokens_per_sec, ttft_ms, load_ms, self.stats_alpha)
+        return tokens_per_sec
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "models": {model: {"tokens_per_sec": round(s.tokens_per_sec, 1), "ttft_ms": round(s.ttft_ms), "load_ms": round(s.load_ms), "samples": s.samples} for model, s in self._stats.items()},
+            "selection_swaps_avoided": self._selection_swaps_avoided,
+            "hosts": self._pool.get_stats(),
+            "hedging": dict(self._hedge_stats, after_ms=self.hedge_after_ms),
+            "cache": self._cache.get_stats(),
+            "single_flight": dict(self._flight_stats, in_flight=len(self._flights)),
+            "session_context": self._contexts.get_stats(),
+            "output_budget": dict(self._budget_stats, budgets={key: {"samples": len(lengths), "budget": self._observed_budget(key)} for key, lengths in self._output_lengths.items()}),
+            "warmup": [{k: r[k] for k in ("model", "host", "ok", "load_ms", "wall_ms")} for r in self._warmup_report],
+        }
+    
+    def _route(self, prompt: str, force_model: str = None, hint: RoutingHint = None) -> Tuple[str, ModelCapability, TaskComplexity, str]:
+        capability, complexity = self._detect_task(hint.text if hint and hint.text else prompt)
+        if hint:
+            if hint.capability:
+                capability = hint.capability
+            elif hint.agent in AGENT_CAPABILITIES:
+                capability = AGENT_CAPABILITIES[hint.agent]
+            if hint.complexity:
+                complexity = hint.complexity
         if force_model and force_model in self._available_models:
             model = force_model
             reasoning = f"Forced: {force_model}"
         else:
             model, reasoning = self._select_model(capability, complexity)
         logger.info(f"[Router] {reasoning}")
-        payload = {"model": model, "prompt": prompt, "stream": False, "options": {"temperature": temperature, "num_predict": max_tokens}}
-        if system:
-            payload["system"] = system
+        return model, capability, complexity, reasoning
+    
+    async def _stream(self, host: OllamaHost, endpoint: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Roh-Stream der NDJSON-Objekte eines Ollama-Endpunkts."""
+        # sock_read statt total: lange 70B-Antworten laufen durch, solange Tokens kommen
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=self.request_timeout)
+        async with self._ensure_session().post(f"{host.url}{endpoint}", json=payload, timeout=timeout) as response:
+            if response.status != 200:
+                raise Exception(f"Ollama Error: {response.status}")
+            async for data in iter_ndjson(response):
+                if data.get("error"):
+                    raise Exception(f"Ollama Error: {data['error']}")
+                yield data
+    
+    async def _run(self, endpoint: str, payload: Dict[str, Any], model: str, capability: ModelCapability, complexity: TaskComplexity, reasoning: str, priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[RouterChunk]:
+        parts: List[str] = []
+        queued = time.monotonic()
+        ttft_ms = None
+        deadline = self.queue_deadline_s if priority == Priority.INTERACTIVE else None
         try:
-            async with self._session.post(f"{self.ollama_url}/api/generate", json=payload) as response:
-                if response.status != 200:
-                    raise Exception(f"Ollama Error: {response.status}")
-                data = await response.json()
-                eval_duration = data.get("eval_duration", 0) / 1_000_000
-                eval_count = data.get("eval_count", 0)
-                tokens_per_sec = (eval_count / (eval_duration / 1000)) if eval_duration > 0 else 0
-                return RouterResponse(
-                    content=data.get("response", ""),
-                    model_used=model,
-                    capability_matched=capability,
-                    complexity=complexity,
-                    tokens_per_second=round(tokens_per_sec, 1),
-                    total_tokens=data.get("prompt_eval_count", 0) + eval_count,
-                    reasoning=reasoning
-                )
+            async with self._pool.acquire(model) as host, host.scheduler.slot(model, priority=priority, deadline_s=deadline):
+                # TTFT ohne Wartezeit in der Queue, sonst würde Last als langsames Modell gewertet
+                started = time.monotonic()
+                async for data in self._stream(host, endpoint, payload):
+                    # /api/generate liefert "response", /api/chat liefert "message.content"
+                    text = data.get("response") or data.get("message", {}).get("content", "")
+                    if text:
+                        parts.append(text)
+                        if ttft_ms is None:
+                            ttft_ms = (time.monotonic() - started) * 1000
+                    if data.get("done"):
+                        if ttft_ms is None:
+                            ttft_ms = (time.monotonic() - started) * 1000
+                        eval_count = data.get("eval_count", 0)
+                        tokens_per_sec = self._record_stats(model, data, ttft_ms)
+                        host.mark_resident(model, self._model_size(model), self.vram_gb)
+                        response = RouterResponse(
+                            content="".join(parts),
+                            model_used=model,
+                            capability_matched=capability,
+                            complexity=complexity,
+                            tokens_per_second=round(tokens_per_sec, 1),
+                            total_tokens=data.get("prompt_eval_count", 0) + eval_count,
+                            reasoning=reasoning,
+                            prompt_tokens=data.get("prompt_eval_count", 0),
+                            ttft_ms=int(ttft_ms),
+                            queue_ms=int((started - queued) * 1000),
+                            context=data.get("context"),
+                            done_reason=data.get("done_reason", "")
+                        )
+                        yield RouterChunk(content=text, done=True, model_used=model, response=response)
+                        return
+                    if text:
+                        yield RouterChunk(content=text, done=False, model_used=model)
+        except SchedulerRejected:
+            raise
         except Exception as e:
             logger.error(f"[Router] Error: {e}")
             raise
+        raise Exception("Ollama Error: Stream ohne Abschluss beendet")
+    
+    def _hedge_model(self, primary: str) -> Optional[str]:
+        # Geladene schnelle Modelle zuerst: ein Hedge, der erst Gewichte laden muss, gewinnt selten
+        candidates = [m for m in self.hedge_models if m != primary and m in self._available_models]
+        return next((m for m in candidates if self.is_resident(m)), candidates[0] if candidates else None)
+    
+    @staticmethod
+    def _cache_value(response: RouterResponse) -> Dict[str, Any]:
+        return {"content": response.content, "model_used": response.model_used, "capability_matched": response.capability_matched.value, "complexity": response.complexity.value, "tokens_per_second": response.tokens_per_second, "total_tokens": response.total_tokens, "prompt_tokens": response.prompt_tokens}
+    
+    @staticmethod
+    def _cached_response(value: Dict[str, Any], reasoning: str) -> RouterResponse:
+        return RouterResponse(**dict(value, capability_matched=ModelCapability(value["capability_matched"]), complexity=TaskComplexity(value["complexity"]), reasoning=f"{reasoning} [Cache]", cached=True))
+    
+    async def _execute(self, endpoint: str, payload: Dict[str, Any], model: str, capability: ModelCapability, complexity: TaskComplexity, reasoning: str, priority: Priority, hedge: bool) -> AsyncIterator[RouterChunk]:
+        key = self._cache.key(endpoint, payload)
+        cacheable = self._cache.cacheable(payload)
+        if cacheable:
+            value = await self._cache.get(key)
+            if value is not None:
+                response = self._cached_response(value, reasoning)
+                yield RouterChunk(content=response.content, done=True, model_used=response.model_used, response=response)
+                return
+        # Identische Anfragen, die gerade laufen (Retry, gleiche Trend-Frage), teilen sich einen Ollama-Call
+        flight = self._flights.get(key)
+        if flight is None or flight.abandoned:
+            flight = _Flight(detach=lambda: self._detach_flight(key, flight))
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._pump(flight, key, cacheable, endpoint, payload, model, capability, complexity, reasoning, priority, hedge))
+            self._flight_stats["started"] += 1
+        else:
+            self._flight_stats["joined"] += 1
+            logger.info(f"[Router] Single-Flight: hänge an laufende Generierung auf {model} an ({flight.subscribers} Wartende)")
+        chunks = flight.follow()
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Sofort abmelden, wenn der Aufrufer abspringt - nicht erst, wenn der Generator eingesammelt wird
+            await chunks.aclose()
+    
+    def _detach_flight(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+    
+    async def _pump(self, flight: _Flight, key: str, cacheable: bool, endpoint: str, payload: Dict[str, Any], model: str, capability: ModelCapability, complexity: TaskComplexity, reasoning: str, priority: Priority, hedge: bool):
+        # Läuft als eigener Task, damit ein abspringender erster Aufrufer die übrigen nicht abbricht
+        error = None
+        if not hedge or self.hedge_after_ms <= 0 or model in self.hedge_models:
+            chunks = self._run(endpoint, payload, model, capability, complexity, reasoning, priority)
+        else:
+            chunks = self._hedged(endpoint, payload, model, capability, complexity, reasoning, priority)
+        try:
+            async for chunk in chunks:
+                # Hedge-Antworten stammen vom schwächeren Modell und gehören nicht unter den Schlüssel des Primärmodells
+                if chunk.done and cacheable and chunk.response.path == "primary":
+                    await self._cache.put(key, self._cache_value(chunk.response))
+                flight.push(chunk)
+        except BaseException as e:
+            error = e
+            if isinstance(e, asyncio.CancelledError):
+                # Alle Abnehmer sind abgesprungen: Stream zu Ollama wird geschlossen, Teilergebnis verworfen
+                self._flight_stats["abandoned"] += 1
+                logger.info(f"[Router] Generierung auf {model} abgebrochen, kein Abnehmer mehr ({len(flight.chunks)} Teilstücke verworfen)")
+        finally:
+            await chunks.aclose()
+            self._detach_flight(key, flight)
+            flight.finish(error)
+    
+    async def _hedged(self, endpoint: str, payload: Dict[str, Any], model: str, capability: ModelCapability, complexity: TaskComplexity, reasoning: str, priority: Priority) -> AsyncIterator[RouterChunk]:
+        """Primärmodell mit Latenz-Budget: ohne erstes Token nach hedge_after_ms startet ein schnelles Modell, der Verlierer wird abgebrochen."""
+        started = time.monotonic()
+        runs = {"primary": self._run(endpoint, payload, model, capability, complexity, reasoning, priority)}
+        pending = {asyncio.ensure_future(runs["primary"].__anext__()): "primary"}
+        winner, first, hedged, cascaded, error = None, None, False, False, None
+        try:
+            timeout = self.hedge_after_ms / 1000
+            while winner is None and pending:
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                timeout = None
+                for task in done:
+                    path = pending.pop(task)
+                    if task.exception() is None:
+                        winner, first = path, task.result()
+                        break
+                    error = task.exception()
+                    logger.warning(f"[Router] {path} fehlgeschlagen: {error}")
+                    cascaded = cascaded or path == "primary"
+                if winner is None and not hedged:
+                    # Budget überschritten oder Primärmodell ausgefallen (Kaskade): schnelles Modell starten
+                    hedge_model = self._hedge_model(model)
+                    if hedge_model is None:
+                        continue
+                    hedged = True
+                    self._hedge_stats["launched"] += 1
+                    self._hedge_stats["cascaded"] += int(cascaded)
+                    elapsed = (time.monotonic() - started) * 1000
+                    logger.info(f"[Router] Hedge nach {elapsed:.0f}ms: {model} → {hedge_model}")
+                    runs["hedge"] = self._run(endpoint, dict(payload, model=hedge_model, keep_alive=keep_alive_for(hedge_model)), hedge_model, capability, complexity, f"Hedge nach {elapsed:.0f}ms statt {model}", priority)
+                    pending[asyncio.ensure_future(runs["hedge"].__anext__())] = "hedge"
+        finally:
+            # Verlierer abbrechen: schließt dessen HTTP-Stream und gibt den GPU-Slot frei
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            for path, run in runs.items():
+                if path != winner:
+                    await run.aclose()
+        if winner is None:
+            raise error or Exception(f"Ollama Error: kein Modell hat geantwortet ({model})")
+        if hedged:
+            self._hedge_stats[f"{winner}_won"] += 1
+        
+        chunk = first
+        try:
+            while True:
+                if chunk.done and chunk.response is not None:
+                    chunk.response.hedged = hedged
+                    chunk.response.path = winner
+                yield chunk
+                if chunk.done:
+                    return
+                chunk = await runs[winner].__anext__()
+        finally:
+            await runs[winner].aclose()
+    
+    @staticmethod
+    def _budget_key(capability: ModelCapability, hint: Optional[RoutingHint]) -> str:
+        return hint.agent if hint and hint.agent else capability.value
     
-    async def generate_with_best(self, prompt: str, system: str = None, max_tokens: int = 4096, temperature: float = 0.3) -> RouterResponse:
+    def _observed_budget(self, key: str) -> Optional[int]:
+        lengths = sorted(self._output_lengths.get(key, ()))
+        if len(lengths) < OUTPUT_BUDGET_SAMPLES:
+            return None
+        p95 = lengths[min(len(lengths) - 1, int(0.95 * len(lengths)))]
+        return int(min(max(p95 * OUTPUT_BUDGET_FACTOR, OUTPUT_BUDGET_MIN), OUTPUT_BUDGET_MAX))
+    
+    def _output_budget(self, capability: ModelCapability, complexity: TaskComplexity, hint: Optional[RoutingHint]) -> int:
+        """num_predict aus der Längenverteilung des Agenten, sonst aus Komplexität und Fähigkeit"""
+        observed = self._observed_budget(self._budget_key(capability, hint))
+        if observed is not None:
+            return observed
+        budget = COMPLEXITY_BUDGETS.get(complexity, 2048) * CAPABILITY_BUDGET_FACTORS.get(capability, 1.0)
+        return int(min(max(budget, OUTPUT_BUDGET_MIN), OUTPUT_BUDGET_MAX))
+    
+    def _options(self, max_tokens: Optional[int], temperature: float, capability: ModelCapability, complexity: TaskComplexity, hint: Optional[RoutingHint]) -> Dict[str, Any]:
+        """Sampling-Optionen; max_tokens=None = Budget automatisch bestimmen (mit Stop-Sequenzen)"""
+        if max_tokens is not None:
+            return {"temperature": temperature, "num_predict": max_tokens}
+        self._budget_stats["auto"] += 1
+        return {"temperature": temperature, "num_predict": self._output_budget(capability, complexity, hint), "stop": STOP_SEQUENCES}
+    
+    def _record_output(self, capability: ModelCapability, hint: Optional[RoutingHint], response: Optional[RouterResponse]):
+        if response is None or response.cached:
+            return
+        tokens = response.total_tokens - response.prompt_tokens
+        if response.done_reason == "length":
+            # Abgeschnitten: der wahre Bedarf ist größer - ohne Aufschlag würde das Budget sich selbst verkleinern
+            self._budget_stats["truncated"] += 1
+            tokens *= 2
+        self._output_lengths.setdefault(self._budget_key(capability, hint), deque(maxlen=500)).append(tokens)
+    
+    @staticmethod
+    async def _collect(chunks: AsyncIterator[RouterChunk]) -> RouterResponse:
+        response = None
+        try:
+            async for chunk in chunks:
+                if chunk.done:
+                    response = chunk.response
+        finally:
+            await chunks.aclose()
+        return response
+    
+    async def generate_stream(self, prompt: str, system: str = None, force_model: str = None, max_tokens: Optional[int] = None, temperature: float = 0.3, hint: RoutingHint = None, priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[RouterChunk]:
+        if self._refresh_task is None:
+            await self.start()
+        model, capability, complexity, reasoning = self._route(prompt, force_model, hint)
+        payload = self._generate_payload(model, prompt, system, self._options(max_tokens, temperature, capability, complexity, hint))
+        chunks = self._execute("/api/generate", payload, model, capability, complexity, reasoning, priority, hedge=force_model is None)
+        try:
+            async for chunk in chunks:
+                if chunk.done:
+                    self._record_output(capability, hint, chunk.response)
+                yield chunk
+        finally:
+            await chunks.aclose()
+    
+    async def generate(self, prompt: str, system: str = None, force_model: str = None, max_tokens: Optional[int] = None, temperature: float = 0.3, hint: RoutingHint = None, priority: Priority = Priority.INTERACTIVE) -> RouterResponse:
+        return await self._collect(self.generate_stream(prompt, system=system, force_model=force_model, max_tokens=max_tokens, temperature=temperature, hint=hint, priority=priority))
+    
+    @staticmethod
+    def _generate_payload(model: str, prompt: str, system: Optional[str], options: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {"model": model, "prompt": prompt, "stream": True, "keep_alive": keep_alive_for(model), "options": options}
+        if system:
+            payload["system"] = system
+        return payload
+    
+    async def generate_many(self, prompts: List[str], system: str = None, force_model: str = None, max_tokens: Optional[int] = None, temperature: float = 0.3, hints: List[Optional[RoutingHint]] = None, concurrency: int = None, priority: Priority = Priority.BATCH) -> List[BatchResult]:
+        """Batch-Generierung für Hintergrund-Jobs: alle Prompts vorab routen, pro Modell gebündelt abarbeiten (jedes Modell wird einmal geladen), Ergebnisse in Eingabe-Reihenfolge mit Fehlern pro Eintrag."""
+        if self._refresh_task is None:
+            await self.start()
+        routes = [self._route(prompt, force_model, hints[i] if hints else None) for i, prompt in enumerate(prompts)]
+        groups: Dict[str, List[int]] = {}
+        for index, route in enumerate(routes):
+            groups.setdefault(route[0], []).append(index)
+        results: List[BatchResult] = [BatchResult(index=i, model=route[0]) for i, route in enumerate(routes)]
+        
+        async def run_one(index: int, semaphore: asyncio.Semaphore):
+            model, capability, complexity, reasoning = routes[index]
+            hint = hints[index] if hints else None
+            payload = self._generate_payload(model, prompts[index], system, self._options(max_tokens, temperature, capability, complexity, hint))
+            async with semaphore:
+                try:
+                    results[index].response = await self._collect(self._execute("/api/generate", payload, model, capability, complexity, reasoning, priority, hedge=False))
+                    self._record_output(capability, hint, results[index].response)
+                except Exception as e:
+                    results[index].error = str(e)
+        
+        # Bereits geladene Modelle zuerst, danach jedes weitere Modell genau einmal laden
+        started = time.monotonic()
+        for model in sorted(groups, key=lambda m: (not self.is_resident(m), -len(groups[m]))):
+            semaphore = asyncio.Semaphore(concurrency or self._model_limit(model))
+            await asyncio.gather(*(run_one(index, semaphore) for index in groups[model]))
+        elapsed = time.monotonic() - started
+        tokens = sum(r.response.total_tokens - r.response.prompt_tokens for r in results if r.ok)
+        logger.info(f"[Router] Batch: {len(prompts)} Prompts auf {len(groups)} Modellen in {elapsed:.1f}s ({tokens / max(elapsed, 1e-6):.0f}t/s gesamt, {sum(1 for r in results if not r.ok)} Fehler)")
+        return results
+    
+    async def chat_stream(self, messages: List[Dict[str, str]], force_model: str = None, max_tokens: Optional[int] = None, temperature: float = 0.3, hint: RoutingHint = None, priority: Priority = Priority.INTERACTIVE, session_id: str = None, continuation: str = None) -> AsyncIterator[RouterChunk]:
+        """
+        Multi-Turn über /api/chat: stabile System-/Verlaufs-Präfixe erlauben Ollama die Wiederverwendung des KV-Caches.
+        
+        Mit session_id (und eingeschaltetem SessionContextStore) über Ollamas Kontext-Token, siehe _session_turn;
+        die ID muss pro Benutzer und Gespräch eindeutig sein, die Token enthalten den Verlauf im Klartext.
+        `continuation` ist der Prompt für fortgesetzte Turns (Standard: die letzte Nachricht komplett).
+        """
+        if self._refresh_task is None:
+            await self.start()
+        last_user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        model, capability, complexity, reasoning = self._route(last_user, force_model, hint)
+        options = self._options(max_tokens, temperature, capability, complexity, hint)
+        if session_id and self._contexts.enabled:
+            chunks = self._session_turn(session_id, messages, model, capability, complexity, reasoning, options, priority, hedge=force_model is None, continuation=continuation)
+        else:
+            payload = {"model": model, "messages": messages, "stream": True, "keep_alive": keep_alive_for(model), "options": options}
+            chunks = self._execute("/api/chat", payload, model, capability, complexity, reasoning, priority, hedge=force_model is None)
+        try:
+            async for chunk in chunks:
+                if chunk.done:
+                    self._record_output(capability, hint, chunk.response)
+                yield chunk
+        finally:
+            await chunks.aclose()
+    
+    async def chat(self, messages: List[Dict[str, str]], force_model: str = None, max_tokens: Optional[int] = None, temperature: float = 0.3, hint: RoutingHint = None, priority: Priority = Priority.INTERACTIVE, session_id: str = None, continuation: str = None) -> RouterResponse:
+        return await self._collect(self.chat_stream(messages, force_model=force_model, max_tokens=max_tokens, temperature=temperature, hint=hint, priority=priority, session_id=session_id, continuation=continuation))
+    
+    async def _session_turn(self, session_id: str, messages: List[Dict[str, str]], model: str, capability: ModelCapability, complexity: TaskComplexity, reasoning: str, options: Dict[str, Any], priority: Priority, hedge: bool, continuation: str = None) -> AsyncIterator[RouterChunk]:
+        """
+        Chat über /api/generate: Folge-Turns desselben Modells schicken nur die neue Frage
+        (`continuation`) plus Ollamas Kontext-Token statt System-Prompt und Verlauf.
+        """
+        system = "\n\n".join(m["content"] for m in messages if m.get("role") == "system")
+        fingerprint = self._contexts.fingerprint(system)
+        context = self._contexts.get(session_id, model, fingerprint) if messages and messages[-1].get("role") == "user" else None
+        if context:
+            payload = self._generate_payload(model, continuation if continuation is not None else messages[-1]["content"], None, options)
+            payload["context"] = context
+            reasoning = f"{reasoning} [Sitzung fortgesetzt, {len(context)} Token]"
+            # Der Kontext gehört zu diesem Modell, ein Hedge-Modell könnte damit nichts anfangen
+            hedge = False
+        else:
+            payload = self._generate_payload(model, self._render_transcript(messages), system or None, options)
+        chunks = self._execute("/api/generate", payload, model, capability, complexity, reasoning, priority, hedge=hedge)
+        try:
+            async for chunk in chunks:
+                if chunk.done and chunk.response is not None:
+                    if context:
+                        chunk.response.prompt_tokens_saved = len(context)
+                        self._contexts.record_saved(len(context))
+                    self._contexts.put(session_id, chunk.response.model_used, fingerprint, chunk.response.context)
+                yield chunk
+        finally:
+            await chunks.aclose()
+    
+    @staticmethod
+    def _render_transcript(messages: List[Dict[str, str]]) -> str:
+        """Verlauf als Prompt-Text für /api/generate (System-Nachrichten gehen als `system` mit)"""
+        turns = [m for m in messages if m.get("role") != "system"]
+        lines = [f"{'Assistent' if m['role'] == 'assistant' else 'Benutzer'}: {m['content']}" for m in turns[:-1]]
+        if turns:
+            lines.append(turns[-1]["content"])
+        return "\n\n".join(lines)
+    
+    async def generate_with_best(self, prompt: str, system: str = None, max_tokens: Optional[int] = None, temperature: float = 0.3) -> RouterResponse:
         best_model = max((m for m in self._available_models if m in MODELS), key=lambda x: MODELS[x].quality_score, default=self.fallback_model)
         return await self.generate(prompt=prompt, system=system, force_model=best_model, max_tokens=max_tokens, temperature=temperature)
     
     async def generate_fast(self, prompt: str, system: str = None, max_tokens: int = 1024, temperature: float = 0.3) -> RouterResponse:
-        fastest = max((m for m in self._available_models if m in MODELS), key=lambda x: MODELS[x].tokens_per_sec, default=self.fallback_model)
+        fastest = max((m for m in self._available_models if m in MODELS), key=self._speed_score, default=self.fallback_model)
         return await self.generate(prompt=prompt, system=system, force_model=fastest, max_tokens=max_tokens, temperature=temperature)
     
     async def generate_code(self, prompt: str, language: str = "python", max_tokens: int = 2048) -> RouterResponse:
@@ -219,14 +870,27 @@ class MultiModelRouter:
         for model_name in self._available_models:
             if model_name in MODELS:
                 config = MODELS[model_name]
-                result.append({"name": model_name, "size_gb": config.size_gb, "quality": config.quality_score, "speed": config.tokens_per_sec, "capabilities": [c.value for c in config.capabilities]})
+                result.append({"name": model_name, "size_gb": config.size_gb, "quality": config.quality_score, "speed": round(self._tokens_per_sec(model_name), 1), "capabilities": [c.value for c in config.capabilities]})
         return result
 
 _router: Optional[MultiModelRouter] = None
 
-async def get_router() -> MultiModelRouter:
+async def get_router(ollama_url: str = None) -> MultiModelRouter:
+    """Prozessweiter Router: eine Session, ein Connection-Pool, ein Modell-Inventar."""
     global _router
-    if _router is None:
-        _router = MultiModelRouter()
-        await _router._load_available_models()
+    created = _router is None
+    if created:
+        _router = MultiModelRouter(ollama_url=ollama_url)
+    await _router.start()
+    # Interaktive Modelle beim ersten Start vorladen (OLLAMA_WARMUP_MODELS, leer = aus)
+    if created and WARMUP_MODELS:
+        _router.start_warm_up()
     return _router
+
+async def close_router():
+    """Beim Herunterfahren: Router-Hintergrund-Task und geteilten Connection-Pool schließen."""
+    global _router
+    if _router is not None:
+        await _router.close()
+        _router = None
+    await close_http_session()
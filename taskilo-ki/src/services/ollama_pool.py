@@ -0,0 +1,310 @@
+"""
+Ollama-Pool für Taskilo-KI
+===========================
+Verteilt Generierungen auf mehrere GPU-Server mit Ollama.
+
+Konfiguration:
+- OLLAMA_URLS="http://gpu1:11434,http://gpu2:11434" (oder kommagetrennt in OLLAMA_URL)
+- Ohne Angabe bleibt es beim einzelnen OLLAMA_URL
+
+Regeln:
+- Pro Host eigenes Inventar (/api/tags) und eigene VRAM-Residenz (/api/ps)
+- Eine Anfrage geht bevorzugt an einen Host, auf dem das Modell schon geladen
+  ist, danach an einen, der es installiert hat - jeweils der am wenigsten
+  ausgelastete (laufende + wartende Anfragen)
+- Ein Host, der den Health-Check nicht besteht oder `max_failures`
+  Verbindungsfehler in Folge hat, wird für `eject_s` Sekunden ausgeschlossen;
+  der nächste erfolgreiche Health-Check nimmt ihn wieder auf
+- Jeder Host hat seinen eigenen GPU-Scheduler (VRAM ist pro Maschine)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import aiohttp
+
+from services.ollama_scheduler import ModelScheduler
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://ollama:11434")
+OLLAMA_URLS = os.environ.get("OLLAMA_URLS", "")
+
+# Fehler, die auf einen kaputten Host hindeuten (nicht: unbekanntes Modell, Abbruch durch den Client)
+HOST_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError, ConnectionError)
+
+
+def resolve_urls(urls: Any = None) -> List[str]:
+    """
+    Normalisiert die Host-Angabe.
+
+    Args:
+        urls: Liste von URLs, kommagetrennter String oder None (dann OLLAMA_URLS/OLLAMA_URL)
+
+    Returns:
+        Liste eindeutiger URLs ohne abschließenden Slash
+    """
+    if not urls:
+        urls = OLLAMA_URLS or OLLAMA_URL
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    result: List[str] = []
+    for url in urls:
+        url = url.strip().rstrip("/")
+        if url and url not in result:
+            result.append(url)
+    return result
+
+
+class OllamaHost:
+    """Zustand eines einzelnen Ollama-Servers"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.models: Set[str] = set()
+        # Name → GB im VRAM, Reihenfolge = zuletzt genutzt zuletzt
+        self.resident: "OrderedDict[str, float]" = OrderedDict()
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.last_error: Optional[str] = None
+        self.scheduler: Optional[ModelScheduler] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+    def is_resident(self, model: str) -> bool:
+        return model in self.resident
+
+    def mark_resident(self, model: str, size_gb: float, vram_gb: float):
+        """Lokale Schätzung bis zum nächsten /api/ps: Ollama verdrängt die am längsten ungenutzten Modelle"""
+        self.resident[model] = min(size_gb, vram_gb)
+        self.resident.move_to_end(model)
+        while len(self.resident) > 1 and sum(self.resident.values()) > vram_gb:
+            self.resident.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "url": self.url,
+            "healthy": self.healthy,
+            "models": len(self.models),
+            "resident": list(self.resident),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.get_stats()
+        return stats
+
+
+class OllamaPool:
+    """
+    Health-geprüfte Auswahl des Ollama-Hosts pro Anfrage.
+
+    Beispiel:
+        pool = OllamaPool(["http://gpu1:11434", "http://gpu2:11434"])
+        await pool.refresh_inventory(session)
+        async with pool.acquire("qwen2.5:32b") as host:
+            async with session.post(f"{host.url}/api/generate", json=payload) as response:
+                ...
+    """
+
+    def __init__(
+        self,
+        urls: Any = None,
+        max_failures: int = 3,
+        eject_s: float = 30.0,
+        scheduler_factory: Callable[[OllamaHost], ModelScheduler] = None,
+    ):
+        """
+        Args:
+            urls: Hosts (Liste oder kommagetrennt; Standard: OLLAMA_URLS/OLLAMA_URL)
+            max_failures: Verbindungsfehler in Folge, nach denen ein Host ausgeschlossen wird
+            eject_s: Dauer des Ausschlusses in Sekunden
+            scheduler_factory: Erzeugt den GPU-Scheduler pro Host (optional)
+        """
+        self.hosts = [OllamaHost(url) for url in resolve_urls(urls)]
+        self.max_failures = max_failures
+        self.eject_s = eject_s
+        if scheduler_factory is not None:
+            for host in self.hosts:
+                host.scheduler = scheduler_factory(host)
+
+    @property
+    def primary(self) -> OllamaHost:
+        return self.hosts[0]
+
+    def _healthy_hosts(self) -> List[OllamaHost]:
+        # Sind alle ausgeschlossen, wird trotzdem versucht - besser als sofort aufzugeben
+        return [host for host in self.hosts if host.healthy] or list(self.hosts)
+
+    # =========================================================================
+    # HEALTH-CHECKS / INVENTAR
+    # =========================================================================
+
+    async def _probe(self, session: aiohttp.ClientSession, host: OllamaHost, endpoint: str, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            async with session.get(f"{host.url}{endpoint}", timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientConnectionError(f"HTTP {response.status}")
+                data = await response.json()
+        except Exception as e:
+            self.eject(host, e)
+            return None
+        if host.ejected_until:
+            logger.info(f"[OllamaPool] {host.url} wieder erreichbar")
+        host.failures = 0
+        host.ejected_until = 0.0
+        return data
+
+    async def refresh_inventory(self, session: aiohttp.ClientSession) -> bool:
+        """Lädt /api/tags aller Hosts parallel. True, wenn mindestens ein Host antwortet."""
+        async def load(host: OllamaHost) -> bool:
+            data = await self._probe(session, host, "/api/tags", timeout=10)
+            if data is None:
+                return False
+            host.models = {m["name"] for m in data.get("models", [])}
+            return True
+        results = await asyncio.gather(*(load(host) for host in self.hosts))
+        return any(results)
+
+    async def refresh_residency(self, session: aiohttp.ClientSession) -> bool:
+        """Lädt /api/ps aller Hosts parallel (dient zugleich als Health-Check)"""
+        async def load(host: OllamaHost) -> bool:
+            data = await self._probe(session, host, "/api/ps", timeout=5)
+            if data is None:
+                return False
+            host.resident = OrderedDict((m["name"], m.get("size_vram", 0) / 1e9) for m in data.get("models", []))
+            return True
+        results = await asyncio.gather(*(load(host) for host in self.hosts))
+        return any(results)
+
+    def available_models(self) -> List[str]:
+        """Modelle, die auf mindestens einem erreichbaren Host installiert sind"""
+        models: Set[str] = set()
+        for host in self._healthy_hosts():
+            models |= host.models
+        return sorted(models)
+
+    def is_resident(self, model: str) -> bool:
+        return any(host.is_resident(model) for host in self._healthy_hosts())
+
+    # =========================================================================
+    # AUSWAHL
+    # =========================================================================
+
+    def pick(self, model: str) -> OllamaHost:
+        """Geladen > installiert > beliebig; innerhalb der Stufe der am wenigsten ausgelastete Host"""
+        healthy = self._healthy_hosts()
+        candidates = (
+            [host for host in healthy if host.is_resident(model)]
+            or [host for host in healthy if model in host.models]
+            or healthy
+        )
+        return min(candidates, key=lambda host: host.in_flight)
+
+    @asynccontextmanager
+    async def acquire(self, model: str):
+        """Wählt einen Host und zählt die Anfrage bis zum Ende als Last"""
+        host = self.pick(model)
+        host.in_flight += 1
+        host.requests += 1
+        try:
+            yield host
+        except HOST_ERRORS as e:
+            self.record_failure(host, e)
+            raise
+        else:
+            host.failures = 0
+        finally:
+            host.in_flight -= 1
+
+    def record_failure(self, host: OllamaHost, error: BaseException):
+        host.failures += 1
+        host.last_error = str(error) or type(error).__name__
+        if host.failures >= self.max_failures:
+            self.eject(host, error)
+
+    def eject(self, host: OllamaHost, error: BaseException):
+        host.last_error = str(error) or type(error).__name__
+        if host.healthy:
+            logger.warning(f"[OllamaPool] {host.url} für {self.eject_s:.0f}s ausgeschlossen: {host.last_error}")
+        host.ejected_until = time.monotonic() + self.eject_s
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [host.get_stats() for host in self.hosts]
+
+
+# Test gegen lokale Stub-Server
+if __name__ == "__main__":
+    from aiohttp import web
+
+    async def start_stub(models: List[str], resident: List[str]):
+        async def tags(request):
+            return web.json_response({"models": [{"name": m} for m in models]})
+
+        async def ps(request):
+            return web.json_response({"models": [{"name": m, "size_vram": 4_000_000_000} for m in resident]})
+
+        async def generate(request):
+            body = await request.json()
+            await asyncio.sleep(0.05)
+            return web.json_response({"model": body["model"], "response": request.host, "done": True})
+
+        app = web.Application()
+        app.router.add_get("/api/tags", tags)
+        app.router.add_get("/api/ps", ps)
+        app.router.add_post("/api/generate", generate)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}"
+
+    async def test():
+        print("=== Ollama-Pool Test ===\n")
+        runner_a, url_a = await start_stub(["qwen2.5:32b", "mistral:7b"], ["qwen2.5:32b"])
+        runner_b, url_b = await start_stub(["qwen2.5:32b", "mistral:7b"], ["mistral:7b"])
+        pool = OllamaPool([url_a, url_b], eject_s=60)
+
+        async with aiohttp.ClientSession() as session:
+            await pool.refresh_inventory(session)
+            await pool.refresh_residency(session)
+            assert pool.pick("qwen2.5:32b").url == url_a
+            assert pool.pick("mistral:7b").url == url_b
+            print("1. Residenz-Auswahl: qwen → A, mistral → B ✓")
+
+            async def call(model: str) -> str:
+                async with pool.acquire(model) as host:
+                    async with session.post(f"{host.url}/api/generate", json={"model": model}) as response:
+                        await response.json()
+                        return host.url
+
+            # Ohne residente Kopie gewinnt der weniger ausgelastete Host
+            pool.hosts[0].resident.clear()
+            pool.hosts[1].resident.clear()
+            used = await asyncio.gather(*(call("qwen2.5:32b") for _ in range(6)))
+            assert used.count(url_a) == used.count(url_b) == 3
+            print("2. Least-Loaded: 6 Anfragen → 3/3 verteilt ✓")
+
+            await runner_b.cleanup()
+            await pool.refresh_residency(session)
+            assert not pool.hosts[1].healthy
+            used = await asyncio.gather(*(call("mistral:7b") for _ in range(3)))
+            assert set(used) == {url_a}
+            print("3. Ausgefallener Host B wird ausgeschlossen ✓")
+
+            print(f"\nStats: {pool.get_stats()}")
+        await runner_a.cleanup()
+
+    asyncio.run(test())
@@ -0,0 +1,300 @@
+"""
+GPU-Scheduler für Taskilo-KI
+=============================
+Reiht Generierungen vor Ollama ein und gruppiert sie nach Modell, damit die
+RTX 4000 (20GB VRAM) nicht ständig zwischen qwen2.5:32b, dem 70B-Modell und
+den kleinen Modellen hin- und herlädt.
+
+Regeln:
+- Höchstens `max_active` Generierungen gleichzeitig auf der GPU
+- Ein Modell darf starten, wenn es schon läuft oder zusammen mit den
+  laufenden Modellen ins VRAM passt (oder die GPU frei ist)
+- Wartende Anfragen für bereits geladene Modelle ziehen an älteren Anfragen
+  für nicht geladene Modelle vorbei (swaps_avoided)
+- Wer länger als `max_hold_s` wartet, wird bevorzugt - notfalls wird
+  die GPU dafür leerlaufen gelassen (kein Verhungern)
+- Pro Modell höchstens `model_limit(model)` gleichzeitige Generierungen
+  (das 70B-Modell bricht bei paralleler Last stärker ein als kleine Modelle)
+- Interaktive Chats stehen vor Batch-/Hintergrund-Jobs
+- Ist die prognostizierte Wartezeit länger als die Deadline, wird sofort mit
+  `SchedulerRejected` abgelehnt statt in den 120s-Timeout zu laufen
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Kleinerer Wert = wird zuerst bedient"""
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class SchedulerRejected(Exception):
+    """Anfrage abgelehnt, weil die prognostizierte Wartezeit die Deadline überschreitet"""
+
+    def __init__(self, model: str, projected_wait_s: float, deadline_s: float):
+        self.model = model
+        self.projected_wait_s = projected_wait_s
+        self.deadline_s = deadline_s
+        super().__init__(
+            f"GPU ausgelastet: ~{projected_wait_s:.1f}s Wartezeit für {model} (Deadline {deadline_s:g}s)"
+        )
+
+
+@dataclass
+class _Waiter:
+    model: str
+    size_gb: float
+    enqueued_at: float
+    future: asyncio.Future = field(repr=False)
+    priority: Priority = Priority.INTERACTIVE
+
+    @property
+    def sort_key(self):
+        return (self.priority, self.enqueued_at)
+
+
+class ModelScheduler:
+    """
+    Modell-gruppierende Warteschlange vor der GPU.
+
+    Beispiel:
+        async with scheduler.slot("qwen2.5:32b", deadline_s=30):
+            ...  # Request an Ollama
+    """
+
+    def __init__(
+        self,
+        max_active: int = 4,
+        vram_gb: float = 20.0,
+        max_hold_s: float = 5.0,
+        model_size: Callable[[str], float] = None,
+        is_resident: Callable[[str], bool] = None,
+        model_limit: Callable[[str], int] = None,
+        service_alpha: float = 0.2,
+        default_service_s: float = 10.0,
+    ):
+        """
+        Args:
+            max_active: Gleichzeitige Generierungen auf der GPU (≈ OLLAMA_NUM_PARALLEL)
+            vram_gb: VRAM-Budget für gleichzeitig geladene Modelle
+            max_hold_s: Maximale Zeit, die eine Anfrage zugunsten anderer Modelle zurückgestellt wird
+            model_size: Modellgröße in GB (Standard: 0 = passt immer)
+            is_resident: Ob ein Modell laut Ollama bereits im VRAM liegt
+            model_limit: Gleichzeitige Generierungen pro Modell (Standard: max_active)
+            service_alpha: Glättung der gemessenen Bedienzeit pro Modell (EWMA)
+            default_service_s: Angenommene Bedienzeit, solange nichts gemessen wurde
+        """
+        self.max_active = max_active
+        self.vram_gb = vram_gb
+        self.max_hold_s = max_hold_s
+        self._model_size = model_size or (lambda model: 0.0)
+        self._is_resident = is_resident or (lambda model: False)
+        self._model_limit = model_limit or (lambda model: max_active)
+        self.service_alpha = service_alpha
+        self.default_service_s = default_service_s
+
+        self._waiting: List[_Waiter] = []  # sortiert nach (Priorität, Ankunft)
+        self._active: Dict[str, int] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._service_s: Dict[str, float] = {}
+
+        # Metriken
+        self.model_loads = 0
+        self.swaps_avoided = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self._waits_ms: Dict[Priority, Deque[float]] = {p: deque(maxlen=500) for p in Priority}
+
+    @property
+    def active_total(self) -> int:
+        return sum(self._active.values())
+
+    def _limit(self, model: str) -> int:
+        return max(1, min(self._model_limit(model), self.max_active))
+
+    def service_time(self, model: str) -> float:
+        """Geglättete Bedienzeit einer Generierung in Sekunden"""
+        if model in self._service_s:
+            return self._service_s[model]
+        if self._service_s:
+            return sum(self._service_s.values()) / len(self._service_s)
+        return self.default_service_s
+
+    def projected_wait(self, model: str, priority: Priority = Priority.INTERACTIVE) -> float:
+        """
+        Prognostizierte Wartezeit bis zum Start einer neuen Anfrage.
+
+        Vor ihr liegen alle laufenden und gleich- oder höher priorisierten
+        wartenden Anfragen; sie werden mit der gemessenen Bedienzeit auf die
+        verfügbaren Slots (global und pro Modell) verteilt.
+        """
+        ahead = [w for w in self._waiting if w.priority <= priority]
+        ahead_model = sum(1 for w in ahead if w.model == model) + self._active.get(model, 0)
+        ahead_total = len(ahead) + self.active_total
+        wait_total = 0.0
+        if ahead_total >= self.max_active:
+            average = sum(self.service_time(w.model) for w in ahead) + sum(
+                self.service_time(m) * n for m, n in self._active.items()
+            )
+            wait_total = (ahead_total - self.max_active + 1) * (average / ahead_total) / self.max_active
+        wait_model = 0.0
+        limit = self._limit(model)
+        if ahead_model >= limit:
+            wait_model = (ahead_model - limit + 1) * self.service_time(model) / limit
+        return max(wait_total, wait_model)
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: Priority = Priority.INTERACTIVE, deadline_s: Optional[float] = None):
+        """
+        Wartet auf einen GPU-Slot für `model` und gibt ihn danach wieder frei.
+
+        Raises:
+            SchedulerRejected: Prognostizierte Wartezeit überschreitet `deadline_s`
+        """
+        if deadline_s is not None:
+            projected = self.projected_wait(model, priority)
+            if projected > deadline_s:
+                self.rejected += 1
+                logger.warning(f"[Scheduler] Abgelehnt: {model} ~{projected:.1f}s > Deadline {deadline_s:g}s")
+                raise SchedulerRejected(model, projected, deadline_s)
+
+        waiter = _Waiter(
+            model=model,
+            size_gb=self._model_size(model),
+            enqueued_at=time.monotonic(),
+            future=asyncio.get_running_loop().create_future(),
+            priority=Priority(priority),
+        )
+        index = bisect.bisect_right([w.sort_key for w in self._waiting], waiter.sort_key)
+        self._waiting.insert(index, waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Slot wurde zugeteilt, bevor der Abbruch ankam
+                self._release(model)
+            raise
+        started = time.monotonic()
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            # Nur vollständige Generierungen fließen in die Bedienzeit ein
+            if completed:
+                elapsed = time.monotonic() - started
+                previous = self._service_s.get(model)
+                self._service_s[model] = elapsed if previous is None else (
+                    self.service_alpha * elapsed + (1 - self.service_alpha) * previous
+                )
+            self._release(model)
+
+    def _release(self, model: str):
+        self._active[model] -= 1
+        if self._active[model] <= 0:
+            del self._active[model]
+        self._dispatch()
+
+    def _loaded_gb(self) -> float:
+        return sum(self._model_size(model) for model in self._active)
+
+    def _under_limit(self, waiter: _Waiter) -> bool:
+        return self._active.get(waiter.model, 0) < self._limit(waiter.model)
+
+    def _admissible(self, waiter: _Waiter) -> bool:
+        # Bereits geladene Modelle belegen kein zusätzliches VRAM
+        if waiter.model in self._active or not self._active or self._is_resident(waiter.model):
+            return True
+        return self._loaded_gb() + waiter.size_gb <= self.vram_gb
+
+    def _is_warm(self, model: str) -> bool:
+        return model in self._active or self._is_resident(model)
+
+    def _pick(self) -> Optional[_Waiter]:
+        # Anfragen, deren Modell am Limit ist, rücken beim Freiwerden dieses Modells nach
+        eligible = [w for w in self._waiting if self._under_limit(w)]
+        if not eligible:
+            return None
+        oldest = eligible[0]  # höchste Priorität, am längsten wartend
+        # Verhungerschutz: zu lange Wartende gehen vor, notfalls läuft die GPU dafür leer
+        if time.monotonic() - oldest.enqueued_at >= self.max_hold_s:
+            return oldest if self._admissible(oldest) else None
+
+        admissible = [w for w in eligible if self._admissible(w)]
+        if not admissible:
+            return None
+        # Warme Modelle nur innerhalb der höchsten wartenden Prioritätsklasse vorziehen
+        warm = next((w for w in admissible if w.priority == oldest.priority and self._is_warm(w.model)), None)
+        if warm is not None:
+            if warm is not oldest and not self._is_warm(oldest.model):
+                self.swaps_avoided += 1
+            return warm
+        return admissible[0]
+
+    def _dispatch(self):
+        while self._waiting and self.active_total < self.max_active:
+            waiter = self._pick()
+            if waiter is None:
+                break
+            self._waiting.remove(waiter)
+            if waiter.future.done():
+                continue
+            if not self._is_warm(waiter.model):
+                self.model_loads += 1
+            self._waits_ms[waiter.priority].append((time.monotonic() - waiter.enqueued_at) * 1000)
+            self._active[waiter.model] = self._active.get(waiter.model, 0) + 1
+            waiter.future.set_result(None)
+
+        # Zurückgestellte Anfragen müssen auch ohne neues Ereignis nach max_hold_s nachrücken
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        eligible = [w for w in self._waiting if self._under_limit(w)]
+        if eligible and self.active_total < self.max_active:
+            delay = eligible[0].enqueued_at + self.max_hold_s - time.monotonic()
+            # Bereits überfällig: das nächste Freiwerden eines Slots löst den Dispatch aus
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = {}
+        for priority, samples in self._waits_ms.items():
+            values = list(samples)
+            waits[priority.name.lower()] = {
+                "queued": sum(1 for w in self._waiting if w.priority == priority),
+                "wait_p50_ms": round(self._percentile(values, 0.5)),
+                "wait_p95_ms": round(self._percentile(values, 0.95)),
+                "wait_max_ms": round(max(values, default=0.0)),
+            }
+        return {
+            "active": dict(self._active),
+            "waiting": len(self._waiting),
+            "max_queue_depth": self.max_queue_depth,
+            "priorities": waits,
+            "service_s": {model: round(s, 2) for model, s in self._service_s.items()},
+            "model_loads": self.model_loads,
+            "swaps_avoided": self.swaps_avoided,
+            "rejected": self.rejected,
+        }
@@ -16,15 +16,56 @@ Verfügbare Modelle auf unserem Server:
 import os
 import asyncio
 import aiohttp
+import json
+import hashlib
 import logging
-from typing import Dict, Any, Optional, List
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, AsyncIterator
 from dataclasses import dataclass
 from enum import Enum
 
+from services.ollama_scheduler import ModelScheduler, Priority
+from services.ollama_pool import OllamaPool
+
 logger = logging.getLogger(__name__)
 
 # Ollama Konfiguration (GPU-Server)
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://ollama:11434")
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "32"))
+
+# Timeouts pro Request-Art (die geteilte Session selbst hat keinen Gesamt-Timeout)
+CONTROL_TIMEOUT = aiohttp.ClientTimeout(total=10, sock_connect=5)   # /api/tags, /api/ps, Health-Check
+PULL_TIMEOUT = aiohttp.ClientTimeout(total=3600, sock_connect=10)   # 1 Stunde für große Modelle
+
+# keep_alive pro Modell: interaktive Modelle bleiben im VRAM, das 70B-Modell (passt nur
+# teilweise in 20GB) wird nach kurzer Zeit wieder entladen und nicht vorgeladen
+KEEP_ALIVE_DEFAULT = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+KEEP_ALIVE_POLICIES: Dict[str, str] = {
+    "qwen2.5:32b": "2h",
+    "mistral:7b": "1h",
+    "llama3.1:8b": "1h",
+    "nomic-embed-text:latest": "2h",
+    "llama3.3:70b-instruct-q4_K_M": "2m",
+}
+# Beim Start vorzuladende Modelle (kommagetrennt, z.B. "qwen2.5:32b"; Standard leer = kein Warm-up).
+# Geladen wird nur auf Hosts, deren Inventar das Modell führt
+WARMUP_MODELS = [m.strip() for m in os.environ.get("OLLAMA_WARMUP_MODELS", "").split(",") if m.strip()]
+WARMUP_TIMEOUT = aiohttp.ClientTimeout(total=600, sock_connect=10)  # 70B von der Platte laden dauert
+
+
+def keep_alive_for(model: str) -> str:
+    """keep_alive-Wert für ein Modell (Policy oder OLLAMA_KEEP_ALIVE)"""
+    return KEEP_ALIVE_POLICIES.get(model, KEEP_ALIVE_DEFAULT)
+
+
+# Embeddings (/api/embed)
+EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text:latest")
+EMBED_BATCH_SIZE = int(os.environ.get("OLLAMA_EMBED_BATCH_SIZE", "64"))
+EMBED_CACHE_SIZE = int(os.environ.get("OLLAMA_EMBED_CACHE_SIZE", "4096"))
+# Gleichzeitige /api/embed-Requests pro Prozess. Embeddings laufen an der GPU-Warteschlange
+# vorbei und belegen keinen Generierungs-Slot (max_active bleibt den Chat-Modellen)
+EMBED_CONCURRENCY = int(os.environ.get("OLLAMA_EMBED_CONCURRENCY", "4"))
 
 
 class OllamaModel(str, Enum):
@@ -73,6 +114,140 @@ class OllamaResponse:
     tokens_per_second: float
 
 
+@dataclass
+class OllamaChunk:
+    """Ein Streaming-Teilstück; der letzte Chunk trägt die vollständige Antwort"""
+    content: str
+    done: bool
+    response: Optional[OllamaResponse] = None
+
+
+async def iter_ndjson(response: aiohttp.ClientResponse) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Parst Ollamas NDJSON-Stream inkrementell.
+    
+    Liest rohe Netzwerk-Chunks statt readline(), damit auch sehr lange
+    Zeilen (z.B. das finale Objekt mit `context`-Array) verarbeitet werden.
+    """
+    buffer = b""
+    async for data in response.content.iter_any():
+        buffer += data
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def _build_response(data: Dict[str, Any], content: str, model: str) -> OllamaResponse:
+    """Baut eine OllamaResponse aus dem finalen Ollama-Objekt"""
+    # Performance-Metriken
+    eval_duration = data.get("eval_duration", 0) / 1_000_000  # ns -> ms
+    eval_count = data.get("eval_count", 0)
+    tokens_per_sec = (eval_count / (eval_duration / 1000)) if eval_duration > 0 else 0
+    
+    return OllamaResponse(
+        content=content,
+        model=data.get("model", model),
+        prompt_tokens=data.get("prompt_eval_count", 0),
+        completion_tokens=eval_count,
+        total_tokens=data.get("prompt_eval_count", 0) + eval_count,
+        eval_duration_ms=int(eval_duration),
+        tokens_per_second=round(tokens_per_sec, 1)
+    )
+
+
+class EmbeddingCache:
+    """LRU-Cache für Embeddings, Schlüssel = SHA-256 über Modell und Text"""
+    
+    def __init__(self, max_entries: int = EMBED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[List[float]]:
+        vector = self._entries.get(key)
+        if vector is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return vector
+    
+    def put(self, key: str, vector: List[float]):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Prozessweit geteilt: Wissens-Import und Frage-Embeddings profitieren vom selben Cache
+_embedding_cache = EmbeddingCache()
+
+
+# Geteilte HTTP-Session: ein Connection-Pool mit Keep-Alive und DNS-Cache für alle Ollama-Aufrufe
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Gibt die prozessweite aiohttp-Session zurück (wird bei Bedarf angelegt).
+    
+    Timeouts werden pro Request übergeben, damit kurze Kontroll-Aufrufe und
+    lange 70B-Generierungen sich nicht gegenseitig ihre Limits vererben.
+    """
+    global _http_session, _http_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=OLLAMA_MAX_CONNECTIONS,
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10)
+        )
+        _http_loop = loop
+    return _http_session
+
+
+# Eigene kleine Drosselung für Embeddings (wie die Session an den Event-Loop gebunden)
+_embed_semaphore: Optional[asyncio.Semaphore] = None
+_embed_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _embed_limiter() -> asyncio.Semaphore:
+    """Prozessweite Semaphore für /api/embed (wird bei Bedarf angelegt)"""
+    global _embed_semaphore, _embed_loop
+    loop = asyncio.get_running_loop()
+    if _embed_semaphore is None or _embed_loop is not loop:
+        _embed_semaphore = asyncio.Semaphore(max(1, EMBED_CONCURRENCY))
+        _embed_loop = loop
+    return _embed_semaphore
+
+
+async def close_http_session():
+    """Schließt die geteilte Session (beim Herunterfahren der Anwendung)"""
+    global _http_session, _http_loop
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+    _http_loop = None
+
+
 class OllamaService:
     """
     Ollama API Service für lokales LLM auf GPU.
@@ -90,21 +265,73 @@ class OllamaService:
         base_url: str = None,
         model: str = None,
         timeout: int = 60,  # Länger für große Modelle
+        scheduler: ModelScheduler = None,
+        priority: Priority = Priority.INTERACTIVE,
+        queue_deadline_s: float = None,
+        pool: OllamaPool = None,
     ):
-        self.base_url = base_url or OLLAMA_URL
+        """
+        Args:
+            base_url: Ollama-URL, auch kommagetrennt für mehrere GPU-Server (Standard: OLLAMA_URLS/OLLAMA_URL)
+            model: Standard-Modell
+            timeout: Timeout pro Request in Sekunden
+            scheduler: Gemeinsame GPU-Warteschlange (z.B. MultiModelRouter.scheduler);
+                ohne Scheduler gehen Requests ungebremst an Ollama
+            priority: Priorität dieser Instanz in der Warteschlange (Batch-Jobs: Priority.BATCH)
+            queue_deadline_s: Sofort ablehnen, wenn die prognostizierte Wartezeit länger ist
+            pool: Gemeinsamer Host-Pool (z.B. MultiModelRouter.pool); dessen
+                Scheduler pro Host haben Vorrang vor `scheduler`
+        """
+        self.pool = pool or OllamaPool(base_url)
+        self.base_url = self.pool.primary.url
         self.model = model or OllamaModel.QWEN_32B.value  # Standard: Qwen 32B
         self.timeout = timeout
-        self._session = None
+        self.scheduler = scheduler
+        self.priority = priority
+        self.queue_deadline_s = queue_deadline_s
     
     async def __aenter__(self):
-        self._session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=self.timeout)
-        )
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self._session:
-            await self._session.close()
+        # Die geteilte Session bleibt offen (siehe close_http_session)
+        pass
+    
+    @property
+    def _session(self) -> aiohttp.ClientSession:
+        return get_http_session()
+    
+    def _request_timeout(self) -> aiohttp.ClientTimeout:
+        """Timeout einer einzelnen Generierung (gilt ab Request-Start, nicht ab Einreihen in die GPU-Warteschlange)"""
+        return aiohttp.ClientTimeout(total=self.timeout, sock_connect=10)
+    
+    @asynccontextmanager
+    async def _target(self, model: str):
+        """
+        Wählt den Host für `model` und belegt dort einen GPU-Slot (falls ein Scheduler konfiguriert ist).
+        
+        Yields:
+            Basis-URL des gewählten Hosts
+        """
+        async with self.pool.acquire(model) as host:
+            scheduler = host.scheduler or self.scheduler
+            if scheduler is None:
+                yield host.url
+                return
+            async with scheduler.slot(model, priority=self.priority, deadline_s=self.queue_deadline_s):
+                yield host.url
+    
+    @asynccontextmanager
+    async def _embed_target(self, model: str):
+        """
+        Wie _target, aber ohne GPU-Slot: Embeddings sind kurz und würden sonst
+        gegen max_active der Generierungsmodelle zählen. Begrenzt wird über EMBED_CONCURRENCY.
+        
+        Yields:
+            Basis-URL des gewählten Hosts
+        """
+        async with _embed_limiter(), self.pool.acquire(model) as host:
+            yield host.url
     
     async def generate(
         self,
@@ -124,35 +351,34 @@ class OllamaService:
             model: Modell überschreiben (optional)
             max_tokens: Maximale Antwortlänge
             temperature: Kreativität (0-1)
-            stream: Streaming aktivieren
+            stream: Über den Streaming-Endpunkt generieren und einsammeln
             
         Returns:
             OllamaResponse mit der generierten Antwort
         """
-        if not self._session:
-            self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=self.timeout)
+        if stream:
+            final = None
+            chunks = self.generate_stream(
+                prompt, system=system, model=model,
+                max_tokens=max_tokens, temperature=temperature
             )
+            try:
+                async for chunk in chunks:
+                    if chunk.done:
+                        final = chunk.response
+            finally:
+                # Bei Abbruch sofort den HTTP-Stream schließen, damit Ollama die Generierung beendet
+                await chunks.aclose()
+            return final
         
         use_model = model or self.model
-        
-        payload = {
-            "model": use_model,
-            "prompt": prompt,
-            "stream": stream,
-            "options": {
-                "temperature": temperature,
-                "num_predict": max_tokens,
-            }
-        }
-        
-        if system:
-            payload["system"] = system
+        payload = self._generate_payload(prompt, system, use_model, max_tokens, temperature, stream=False)
         
         try:
-            async with self._session.post(
-                f"{self.base_url}/api/generate",
-                json=payload
+            async with self._target(use_model) as url, self._session.post(
+                f"{url}/api/generate",
+                json=payload,
+                timeout=self._request_timeout()
             ) as response:
                 if response.status != 200:
                     error_text = await response.text()
@@ -160,21 +386,7 @@ class OllamaService:
                     raise Exception(f"Ollama API Fehler: {response.status}")
                 
                 data = await response.json()
-                
-                # Performance-Metriken
-                eval_duration = data.get("eval_duration", 0) / 1_000_000  # ns -> ms
-                eval_count = data.get("eval_count", 0)
-                tokens_per_sec = (eval_count / (eval_duration / 1000)) if eval_duration > 0 else 0
-                
-                return OllamaResponse(
-                    content=data.get("response", ""),
-                    model=data.get("model", use_model),
-                    prompt_tokens=data.get("prompt_eval_count", 0),
-                    completion_tokens=eval_count,
-                    total_tokens=data.get("prompt_eval_count", 0) + eval_count,
-                    eval_duration_ms=int(eval_duration),
-                    tokens_per_second=round(tokens_per_sec, 1)
-                )
+                return _build_response(data, data.get("response", ""), use_model)
                 
         except asyncio.TimeoutError:
             logger.error(f"[Ollama] Timeout nach {self.timeout}s")
@@ -183,6 +395,92 @@ class OllamaService:
             logger.error(f"[Ollama] Verbindungsfehler: {e}")
             raise Exception(f"Ollama nicht erreichbar: {e}")
     
+    async def generate_stream(
+        self,
+        prompt: str,
+        system: str = None,
+        model: str = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.3
+    ) -> AsyncIterator[OllamaChunk]:
+        """
+        Streamt eine Antwort Token für Token.
+        
+        Args:
+            prompt: Die Benutzer-Nachricht
+            system: System-Prompt (optional)
+            model: Modell überschreiben (optional)
+            max_tokens: Maximale Antwortlänge
+            temperature: Kreativität (0-1)
+            
+        Yields:
+            OllamaChunk pro Teilstück, der letzte mit done=True und vollständiger OllamaResponse
+        """
+        
+        use_model = model or self.model
+        payload = self._generate_payload(prompt, system, use_model, max_tokens, temperature, stream=True)
+        parts: List[str] = []
+        
+        try:
+            async with self._target(use_model) as url, self._session.post(
+                f"{url}/api/generate",
+                json=payload,
+                # Beim Streaming zählt die Pause zwischen Chunks, nicht die Gesamtdauer
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=self.timeout)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"[Ollama] API Fehler {response.status}: {error_text}")
+                    raise Exception(f"Ollama API Fehler: {response.status}")
+                
+                async for data in iter_ndjson(response):
+                    if data.get("error"):
+                        raise Exception(f"Ollama Stream Fehler: {data['error']}")
+                    text = data.get("response", "")
+                    if text:
+                        parts.append(text)
+                    if data.get("done"):
+                        yield OllamaChunk(
+                            content=text,
+                            done=True,
+                            response=_build_response(data, "".join(parts), use_model)
+                        )
+                        return
+                    if text:
+                        yield OllamaChunk(content=text, done=False)
+                        
+        except asyncio.TimeoutError:
+            logger.error(f"[Ollama] Stream-Timeout nach {self.timeout}s ohne Daten")
+            raise Exception(f"Ollama Timeout nach {self.timeout}s")
+        except aiohttp.ClientError as e:
+            logger.error(f"[Ollama] Verbindungsfehler: {e}")
+            raise Exception(f"Ollama nicht erreichbar: {e}")
+        
+        raise Exception("Ollama Stream ohne Abschluss beendet")
+    
+    def _generate_payload(
+        self,
+        prompt: str,
+        system: Optional[str],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        stream: bool
+    ) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": keep_alive_for(model),
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+            }
+        }
+        if system:
+            payload["system"] = system
+        return payload
+    
     async def chat(
         self,
         messages: List[Dict[str, str]],
@@ -204,10 +502,6 @@ class OllamaService:
         Returns:
             OllamaResponse
         """
-        if not self._session:
-            self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=self.timeout)
-            )
         
         use_model = model or self.model
         
@@ -221,6 +515,7 @@ class OllamaService:
             "model": use_model,
             "messages": ollama_messages,
             "stream": False,
+            "keep_alive": keep_alive_for(use_model),
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens,
@@ -228,9 +523,10 @@ class OllamaService:
         }
         
         try:
-            async with self._session.post(
-                f"{self.base_url}/api/chat",
-                json=payload
+            async with self._target(use_model) as url, self._session.post(
+                f"{url}/api/chat",
+                json=payload,
+                timeout=self._request_timeout()
             ) as response:
                 if response.status != 200:
                     error_text = await response.text()
@@ -239,71 +535,176 @@ class OllamaService:
                 data = await response.json()
                 
                 message = data.get("message", {})
-                eval_duration = data.get("eval_duration", 0) / 1_000_000
-                eval_count = data.get("eval_count", 0)
-                tokens_per_sec = (eval_count / (eval_duration / 1000)) if eval_duration > 0 else 0
-                
-                return OllamaResponse(
-                    content=message.get("content", ""),
-                    model=data.get("model", use_model),
-                    prompt_tokens=data.get("prompt_eval_count", 0),
-                    completion_tokens=eval_count,
-                    total_tokens=data.get("prompt_eval_count", 0) + eval_count,
-                    eval_duration_ms=int(eval_duration),
-                    tokens_per_second=round(tokens_per_sec, 1)
-                )
+                return _build_response(data, message.get("content", ""), use_model)
                 
         except asyncio.TimeoutError:
             raise Exception(f"Ollama Chat Timeout nach {self.timeout}s")
         except aiohttp.ClientError as e:
             raise Exception(f"Ollama nicht erreichbar: {e}")
     
-    async def list_models(self) -> List[Dict[str, Any]]:
-        """Listet alle verfügbaren Modelle"""
-        if not self._session:
-            self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=10)
-            )
+    async def embed(
+        self,
+        texts: List[str],
+        model: str = None,
+        batch_size: int = None
+    ) -> List[List[float]]:
+        """
+        Erstellt Embeddings über Ollamas Batch-Endpunkt /api/embed.
         
-        try:
-            async with self._session.get(f"{self.base_url}/api/tags") as response:
-                if response.status != 200:
-                    return []
-                data = await response.json()
-                return data.get("models", [])
-        except Exception as e:
-            logger.error(f"[Ollama] Modelle abrufen fehlgeschlagen: {e}")
-            return []
+        Identische Texte werden nur einmal berechnet, bereits bekannte kommen
+        aus dem LRU-Cache; der Rest geht in Batches von `batch_size` an Ollama.
+        
+        Args:
+            texts: Texte in beliebiger Anzahl
+            model: Embedding-Modell (Standard: OLLAMA_EMBED_MODEL)
+            batch_size: Texte pro Request (Standard: OLLAMA_EMBED_BATCH_SIZE)
+            
+        Returns:
+            Ein Vektor pro Text, in Eingabe-Reihenfolge
+        """
+        use_model = model or EMBED_MODEL
+        batch_size = batch_size or EMBED_BATCH_SIZE
+        keys = [EmbeddingCache.key(use_model, text) for text in texts]
+        
+        vectors: Dict[str, List[float]] = {}
+        missing: Dict[str, str] = {}  # Schlüssel → Text, ohne Duplikate
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            cached = _embedding_cache.get(key)
+            if cached is not None:
+                vectors[key] = cached
+            else:
+                missing[key] = text
+        
+        missing_keys = list(missing)
+        batches = [missing_keys[i:i + batch_size] for i in range(0, len(missing_keys), batch_size)]
+        
+        async def embed_batch(batch: List[str]):
+            payload = {"model": use_model, "input": [missing[key] for key in batch], "keep_alive": keep_alive_for(use_model)}
+            try:
+                async with self._embed_target(use_model) as url, self._session.post(
+                    f"{url}/api/embed",
+                    json=payload,
+                    timeout=self._request_timeout()
+                ) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"[Ollama] Embedding Fehler {response.status}: {error_text}")
+                        raise Exception(f"Ollama Embedding Fehler: {response.status}")
+                    data = await response.json()
+            except asyncio.TimeoutError:
+                raise Exception(f"Ollama Embedding Timeout nach {self.timeout}s")
+            except aiohttp.ClientError as e:
+                raise Exception(f"Ollama nicht erreichbar: {e}")
+            
+            embeddings = data.get("embeddings", [])
+            if len(embeddings) != len(batch):
+                raise Exception(f"Ollama Embedding: {len(embeddings)} Vektoren für {len(batch)} Texte")
+            for key, vector in zip(batch, embeddings):
+                vectors[key] = vector
+                _embedding_cache.put(key, vector)
+        
+        if batches:
+            await asyncio.gather(*(embed_batch(batch) for batch in batches))
+            logger.debug(f"[Ollama] {len(missing_keys)} Embeddings berechnet, {len(texts) - len(missing_keys)} aus Cache/Duplikaten")
+        
+        return [vectors[key] for key in keys]
+    
+    async def warm_up(self, models: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        Lädt Modelle vorab in den VRAM aller Hosts, damit der erste echte
+        Request nicht die volle Ladezeit zahlt.
+        
+        Pro Host werden die Modelle nacheinander geladen (paralleles Laden
+        verdrängt sich gegenseitig), die Hosts laufen parallel. Ein Host lädt
+        nur Modelle aus seinem eigenen Inventar (/api/tags) - sonst würde Ollama
+        ein fehlendes Modell mit einem Fehler quittieren oder erst ziehen.
+        
+        Args:
+            models: Vorzuladende Modelle (Standard: OLLAMA_WARMUP_MODELS)
+            
+        Returns:
+            Pro Modell und Host: {"model", "host", "ok", "load_ms", "wall_ms", "error"}
+        """
+        models = WARMUP_MODELS if models is None else models
+        
+        async def load(url: str, model: str) -> Dict[str, Any]:
+            # Leerer Prompt / leere Eingabe: Ollama lädt nur das Modell und setzt keep_alive
+            if "embed" in model:
+                endpoint, payload = "/api/embed", {"model": model, "input": "", "keep_alive": keep_alive_for(model)}
+            else:
+                endpoint, payload = "/api/generate", {"model": model, "prompt": "", "stream": False, "keep_alive": keep_alive_for(model)}
+            result = {"model": model, "host": url, "ok": False, "load_ms": 0, "wall_ms": 0, "error": None}
+            started = asyncio.get_running_loop().time()
+            try:
+                async with self._session.post(f"{url}{endpoint}", json=payload, timeout=WARMUP_TIMEOUT) as response:
+                    if response.status != 200:
+                        raise Exception(f"HTTP {response.status}: {await response.text()}")
+                    data = await response.json()
+                result["ok"] = True
+                result["load_ms"] = int(data.get("load_duration", 0) / 1_000_000)
+            except Exception as e:
+                result["error"] = str(e) or type(e).__name__
+                logger.warning(f"[Ollama] Warm-up {model} auf {url} fehlgeschlagen: {result['error']}")
+            result["wall_ms"] = int((asyncio.get_running_loop().time() - started) * 1000)
+            return result
+        
+        async def warm_host(host) -> List[Dict[str, Any]]:
+            installed = [model for model in models if model in host.models]
+            for model in models:
+                if model not in host.models:
+                    logger.info(f"[Ollama] Warm-up {model} auf {host.url} übersprungen (nicht installiert)")
+            return [await load(host.url, model) for model in installed]
+        
+        if models and not any(host.models for host in self.pool.hosts):
+            await self.pool.refresh_inventory(self._session)
+        per_host = await asyncio.gather(*(warm_host(host) for host in self.pool.hosts))
+        report = [result for results in per_host for result in results]
+        for result in report:
+            if result["ok"]:
+                logger.info(f"[Ollama] Warm-up {result['model']} auf {result['host']}: geladen in {result['load_ms']}ms ({result['wall_ms']}ms gesamt)")
+        return report
+    
+    async def list_models(self) -> List[Dict[str, Any]]:
+        """Listet alle verfügbaren Modelle (über alle Hosts, ohne Duplikate)"""
+        models: Dict[str, Dict[str, Any]] = {}
+        for host in self.pool.hosts:
+            try:
+                async with self._session.get(f"{host.url}/api/tags", timeout=CONTROL_TIMEOUT) as response:
+                    if response.status != 200:
+                        continue
+                    data = await response.json()
+                    for model in data.get("models", []):
+                        models.setdefault(model["name"], model)
+            except Exception as e:
+                logger.error(f"[Ollama] Modelle abrufen fehlgeschlagen ({host.url}): {e}")
+        return list(models.values())
     
     async def health_check(self) -> bool:
-        """Prüft ob Ollama erreichbar ist"""
+        """Prüft ob mindestens ein Ollama-Host erreichbar ist (aktualisiert dabei das Inventar pro Host)"""
         try:
-            if not self._session:
-                self._session = aiohttp.ClientSession(
-                    timeout=aiohttp.ClientTimeout(total=5)
-                )
-            async with self._session.get(f"{self.base_url}/api/tags") as response:
-                return response.status == 200
+            return await self.pool.refresh_inventory(self._session)
         except Exception:
             return False
     
     async def pull_model(self, model_name: str) -> bool:
-        """Lädt ein Modell herunter"""
-        if not self._session:
-            self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=3600)  # 1 Stunde für große Modelle
-            )
+        """Lädt ein Modell auf allen Hosts herunter (True, wenn es überall geklappt hat)"""
+        async def pull(url: str) -> bool:
+            try:
+                payload = {"name": model_name, "stream": False}
+                async with self._session.post(
+                    f"{url}/api/pull",
+                    json=payload,
+                    timeout=PULL_TIMEOUT
+                ) as response:
+                    return response.status == 200
+            except Exception as e:
+                logger.error(f"[Ollama] Modell {model_name} herunterladen fehlgeschlagen ({url}): {e}")
+                return False
         
-        try:
-            payload = {"name": model_name, "stream": False}
-            async with self._session.post(
-                f"{self.base_url}/api/pull",
-                json=payload
-            ) as response:
-                return response.status == 200
-        except Exception as e:
-            logger.error(f"[Ollama] Modell {model_name} herunterladen fehlgeschlagen: {e}")
-            return False
+        results = await asyncio.gather(*(pull(host.url) for host in self.pool.hosts))
+        return all(results)
     
     def get_recommended_model(self, task: str) -> str:
         """Gibt das empfohlene Modell für eine Aufgabe zurück"""
@@ -334,11 +735,11 @@ async def quick_generate(
     model: str = None
 ) -> str:
     """
-    Schnelle Generierung ohne Kontext-Manager.
+    Schnelle Generierung ohne Kontext-Manager (nutzt Singleton und geteilten Connection-Pool).
     """
-    async with OllamaService() as ollama:
-        response = await ollama.generate(prompt, system, model=model)
-        return response.content
+    ollama = await get_ollama_service()
+    response = await ollama.generate(prompt, system, model=model)
+    return response.content
 
 
 # Kompatibilitäts-Alias für bestehenden Code
@@ -0,0 +1,176 @@
+"""
+Semantischer Router für Taskilo-KI
+===================================
+Klassifiziert Nutzerfragen über Embeddings statt über Substring-Keywords,
+damit Umschreibungen ("Was darf ich vom Finanzamt zurückholen?") beim
+richtigen Agenten und beim passenden Modell landen.
+
+Verfahren:
+- Pro Tabelle (z.B. "agent", "capability") werden Prototyp-Texte je Klasse
+  einmalig eingebettet und zu normierten Zentroiden gemittelt
+- Alle Zentroiden liegen in EINER Matrix; eine Anfrage kostet genau ein
+  Matrix-Vektor-Produkt für alle Tabellen zusammen
+- Unter `min_similarity` oder ohne Embedding → None, der Aufrufer nutzt
+  dann die Keyword-Klassifikation
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from services.multi_model_router import ModelCapability
+
+logger = logging.getLogger(__name__)
+
+
+# Prototyp-Fragen pro Fähigkeit (GENERAL deckt Smalltalk ab, damit er nicht in Fachklassen fällt)
+CAPABILITY_PROTOTYPES: Dict[ModelCapability, List[str]] = {
+    ModelCapability.GENERAL: [
+        "Hallo, wie geht es dir?",
+        "Danke für die Hilfe!",
+        "Was kannst du alles?",
+        "Kannst du mir kurz helfen?",
+    ],
+    ModelCapability.CODE: [
+        "Schreibe eine Python-Funktion, die Rechnungen als PDF exportiert",
+        "Warum wirft mein JavaScript-Code einen Fehler?",
+        "Wie baue ich eine REST-API mit Authentifizierung?",
+        "Wie richte ich einen Docker-Container für meine Webseite ein?",
+    ],
+    ModelCapability.GERMAN: [
+        "Wie hoch ist der Grundfreibetrag in Deutschland?",
+        "Muss ich als Freiberufler Umsatzsteuer abführen?",
+        "Was darf ich vom Finanzamt zurückholen?",
+        "Welche Frist gilt für meine Steuererklärung?",
+    ],
+    ModelCapability.MATH: [
+        "Berechne 19 Prozent Mehrwertsteuer auf 2.500 Euro",
+        "Wie hoch ist mein durchschnittlicher Monatsumsatz?",
+        "Rechne mir meinen Stundensatz bei 60.000 Euro Jahresziel aus",
+        "Wie viel bleibt netto von 4.000 Euro Gewinn übrig?",
+    ],
+    ModelCapability.CREATIVE: [
+        "Schreib einen Blogartikel über Zeitmanagement für Selbstständige",
+        "Formuliere einen Slogan für mein Café",
+        "Erstelle einen LinkedIn-Post zu meinem neuen Angebot",
+        "Denk dir Ideen für eine Marketingkampagne aus",
+    ],
+    ModelCapability.LEGAL: [
+        "Was muss in mein Impressum?",
+        "Ist diese Klausel in meinem Vertrag wirksam?",
+        "Brauche ich eine Datenschutzerklärung für meine Webseite?",
+        "Wer haftet, wenn mein Kunde nicht zahlt?",
+    ],
+    ModelCapability.REASONING: [
+        "Vergleiche GmbH und Einzelunternehmen für meinen Fall",
+        "Analysiere Stärken und Schwächen meines Geschäftsmodells",
+        "Entwickle eine Strategie für den Markteintritt",
+        "Warum sinkt mein Gewinn trotz steigendem Umsatz?",
+    ],
+}
+
+
+class SemanticRouter:
+    """
+    Zentroid-Klassifikator über Embeddings.
+
+    Beispiel:
+        router = SemanticRouter(encode=lambda texts: model.encode(texts))
+        router.add_table("capability", CAPABILITY_PROTOTYPES)
+        router.build()
+        capability, score = router.classify("capability", query_embedding)
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], Any],
+        min_similarity: float = 0.35,
+    ):
+        """
+        Args:
+            encode: Bettet eine Liste von Texten ein (z.B. SentenceTransformer.encode)
+            min_similarity: Kosinus-Ähnlichkeit, unter der auf Keywords zurückgefallen wird
+        """
+        if np is None:
+            raise ImportError("numpy wird für den semantischen Router benötigt")
+        self._encode = encode
+        self.min_similarity = min_similarity
+        self._tables: Dict[str, Dict[Any, Sequence[str]]] = {}
+        self._labels: List[Any] = []
+        self._slices: Dict[str, slice] = {}
+        self._centroids = None  # (Klassen gesamt × Dimension), zeilenweise normiert
+
+    def add_table(self, name: str, prototypes: Dict[Any, Sequence[str]]):
+        """Registriert eine Klassifikations-Tabelle (Klasse → Prototyp-Texte)"""
+        self._tables[name] = {label: list(texts) for label, texts in prototypes.items() if texts}
+
+    def build(self):
+        """Bettet alle Prototypen in einem Batch ein und baut die Zentroid-Matrix"""
+        texts: List[str] = []
+        owners: List[int] = []
+        labels: List[Any] = []
+        slices: Dict[str, slice] = {}
+        for name, table in self._tables.items():
+            start = len(labels)
+            for label, prototypes in table.items():
+                owners.extend([len(labels)] * len(prototypes))
+                texts.extend(prototypes)
+                labels.append(label)
+            slices[name] = slice(start, len(labels))
+
+        if not texts:
+            return
+
+        vectors = self._normalize(np.asarray(self._encode(texts), dtype=np.float32))
+        owners_arr = np.asarray(owners)
+        centroids = np.zeros((len(labels), vectors.shape[1]), dtype=np.float32)
+        np.add.at(centroids, owners_arr, vectors)
+
+        self._centroids = self._normalize(centroids)
+        self._labels = labels
+        self._slices = slices
+        logger.info(f"[SemanticRouter] {len(labels)} Zentroiden aus {len(texts)} Prototypen")
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    @property
+    def ready(self) -> bool:
+        return self._centroids is not None
+
+    def classify_all(self, embedding) -> Dict[str, Optional[Tuple[Any, float]]]:
+        """
+        Klassifiziert ein Embedding gegen alle Tabellen mit einem Matrix-Vektor-Produkt.
+
+        Returns:
+            Tabellenname → (Klasse, Ähnlichkeit) oder None bei zu geringer Ähnlichkeit
+        """
+        result: Dict[str, Optional[Tuple[Any, float]]] = {name: None for name in self._tables}
+        if not self.ready or embedding is None or len(embedding) == 0:
+            return result
+
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        if query.shape[-1] != self._centroids.shape[1]:
+            logger.warning("[SemanticRouter] Embedding-Dimension passt nicht zu den Zentroiden")
+            return result
+
+        similarities = self._centroids @ query
+        for name, part in self._slices.items():
+            scores = similarities[part]
+            if scores.size == 0:
+                continue
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score >= self.min_similarity:
+                result[name] = (self._labels[part.start + best], score)
+        return result
+
+    def classify(self, name: str, embedding) -> Optional[Tuple[Any, float]]:
+        """Klassifiziert ein Embedding gegen eine einzelne Tabelle"""
+        return self.classify_all(embedding).get(name)
@@ -0,0 +1,137 @@
+"""
+Sitzungs-Kontext für Taskilo-KI
+================================
+Ollama liefert bei /api/generate im letzten Stream-Objekt ein `context`-Array
+(die Token der bisherigen Unterhaltung). Wird es beim nächsten Turn
+mitgeschickt, wertet Ollama nur die neue Nachricht aus statt System-Prompt
+und Verlauf erneut.
+
+Regeln:
+- Opt-in (SESSION_CONTEXT_ENABLED=1): ohne Freigabe bleibt der Router beim
+  /api/chat-Layout, dessen stabiles Präfix Ollamas KV-Cache ohnehin nutzt
+- Folge-Turns schicken nur den Frage-Teil (der Aufrufer liefert ihn, samt
+  neu abgerufener Wissens-Abschnitte), nicht erneut die ganze Wissensbasis
+  und den Zähler - sonst wächst der Kontext pro Turn um mehrere KB und läuft
+  nach wenigen Turns über `max_tokens`
+- Pro Sitzung wird nur der Kontext des zuletzt antwortenden Modells gehalten;
+  antwortet ein anderes Modell, wird wieder mit vollem Prompt begonnen
+- Ändert sich der System-Teil (Persönlichkeit, Benutzer-Info), ebenso
+- LRU über Sitzungen mit TTL; Kontexte über `max_tokens` werden verworfen
+  (Ollama würde sie am num_ctx vorne abschneiden)
+"""
+
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Konfiguration
+SESSION_CONTEXT_ENABLED = os.environ.get("SESSION_CONTEXT_ENABLED", "0").lower() in ("1", "true", "yes")
+SESSION_CONTEXT_MAX_SESSIONS = int(os.environ.get("SESSION_CONTEXT_SESSIONS", "2048"))
+SESSION_CONTEXT_TTL = float(os.environ.get("SESSION_CONTEXT_TTL", "1800"))
+SESSION_CONTEXT_MAX_TOKENS = int(os.environ.get("SESSION_CONTEXT_MAX_TOKENS", "6144"))
+
+
+@dataclass
+class SessionContext:
+    model: str
+    fingerprint: str
+    tokens: List[int] = field(repr=False)
+    expires_at: float
+
+
+class SessionContextStore:
+    """
+    Begrenzter Speicher für Ollama-Kontext-Token pro Sitzung.
+
+    Beispiel:
+        store = SessionContextStore(enabled=True)
+        fingerprint = store.fingerprint(system_prompt)
+        context = store.get(session_id, model, fingerprint)  # None = voller Prompt
+        ...
+        store.put(session_id, model, fingerprint, response.context)
+    """
+
+    def __init__(self, max_sessions: int = None, ttl_s: float = None, max_tokens: int = None, enabled: bool = None):
+        """
+        Args:
+            enabled: Sitzungen überhaupt fortsetzen (Standard: SESSION_CONTEXT_ENABLED)
+            max_sessions: Maximale Sitzungen im Speicher (0 = aus)
+            ttl_s: Lebensdauer eines Kontexts ohne neuen Turn in Sekunden
+            max_tokens: Längster Kontext, der noch fortgesetzt wird
+        """
+        self._enabled = enabled if enabled is not None else SESSION_CONTEXT_ENABLED
+        self.max_sessions = max_sessions if max_sessions is not None else SESSION_CONTEXT_MAX_SESSIONS
+        self.ttl_s = ttl_s if ttl_s is not None else SESSION_CONTEXT_TTL
+        self.max_tokens = max_tokens if max_tokens is not None else SESSION_CONTEXT_MAX_TOKENS
+
+        # Sitzung → Kontext; Reihenfolge = zuletzt genutzt zuletzt
+        self._entries: "OrderedDict[str, SessionContext]" = OrderedDict()
+
+        # Metriken
+        self.continued = 0
+        self.restarted = 0
+        self.model_changes = 0
+        self.overflows = 0
+        self.evictions = 0
+        self.tokens_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and self.max_sessions > 0
+
+    @staticmethod
+    def fingerprint(system: str) -> str:
+        return hashlib.sha256((system or "").encode("utf-8")).hexdigest()
+
+    def get(self, session_id: str, model: str, fingerprint: str) -> Optional[List[int]]:
+        """Kontext-Token zum Fortsetzen oder None (dann voller Prompt)"""
+        entry = self._entries.get(session_id)
+        if entry is not None and entry.model != model:
+            self.model_changes += 1
+            logger.info(f"[SessionContext] {session_id}: Modellwechsel {entry.model} → {model}, voller Prompt")
+        if entry is None or entry.model != model or entry.fingerprint != fingerprint or entry.expires_at <= time.time():
+            self._entries.pop(session_id, None)
+            self.restarted += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.continued += 1
+        return entry.tokens
+
+    def put(self, session_id: str, model: str, fingerprint: str, tokens: Optional[List[int]]):
+        """Speichert den Kontext nach einem Turn; ohne Kontext (z.B. Cache-Treffer) wird die Sitzung verworfen"""
+        if not self.enabled:
+            return
+        if not tokens or len(tokens) > self.max_tokens:
+            if tokens:
+                self.overflows += 1
+            self._entries.pop(session_id, None)
+            return
+        self._entries[session_id] = SessionContext(model, fingerprint, tokens, time.time() + self.ttl_s)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def record_saved(self, tokens: int):
+        self.tokens_saved += tokens
+
+    def drop(self, session_id: str):
+        self._entries.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sessions": len(self._entries),
+            "continued": self.continued,
+            "restarted": self.restarted,
+            "model_changes": self.model_changes,
+            "overflows": self.overflows,
+            "evictions": self.evictions,
+            "prompt_tokens_saved": self.tokens_saved,
+        }